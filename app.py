@@ -5,7 +5,9 @@ from functools import wraps
 from flask import Flask, jsonify, Response, request, redirect, url_for
 import flask
 import os
-from cache import MemoryCache
+from cache import MemoryCache, SQLiteCache
+from frame_store import FrameExpiredError, clean_spill_dir, store_frame, load_frame
+from semantic_cache import SemanticCache
 import ext_config
 from vanna_factory import create_vanna_instance
 
@@ -13,7 +15,20 @@ from vanna_factory import create_vanna_instance
 app = Flask(__name__, static_url_path='')
 
 # SETUP
-cache = MemoryCache()
+cache_options = dict(
+    max_bytes=getattr(ext_config, 'CACHE_MAX_BYTES', None),
+    max_entries=getattr(ext_config, 'CACHE_MAX_ENTRIES', None),
+    ttl=getattr(ext_config, 'CACHE_TTL', None),
+)
+# 多个工作进程部署时使用SQLite共享缓存，否则各进程生成的id互不可见
+if getattr(ext_config, 'CACHE_BACKEND', 'memory') == 'sqlite':
+    cache = SQLiteCache(path=getattr(ext_config, 'CACHE_SQLITE_PATH', 'question_cache.sqlite3'), **cache_options)
+else:
+    cache = MemoryCache(**cache_options)
+    # 进程内缓存重启后不再引用上次落盘的查询结果，只清理已退出进程的文件
+    removed = clean_spill_dir(getattr(ext_config, 'CACHE_SPILL_DIR', None))
+    if removed:
+        print(f"[INFO] 已清理 {removed} 个上次运行遗留的落盘查询结果")
 
 # from vanna.local import LocalContext_OpenAI
 # vn = LocalContext_OpenAI()
@@ -31,7 +46,22 @@ cache = MemoryCache()
 
 vn = create_vanna_instance()
 
+# 问题到SQL的语义缓存，每个工作进程各有一份
+semantic_cache = None
+if getattr(ext_config, 'SEMANTIC_CACHE_ENABLED', False):
+    semantic_cache = SemanticCache(
+        embed_fn=vn.generate_embedding,
+        version_fn=getattr(vn, 'get_training_data_version', None),
+        threshold=getattr(ext_config, 'SEMANTIC_CACHE_THRESHOLD', 0.95),
+        max_entries=getattr(ext_config, 'SEMANTIC_CACHE_MAX_ENTRIES', 1000),
+        ttl=getattr(ext_config, 'SEMANTIC_CACHE_TTL', None),
+        version_check_interval=getattr(ext_config, 'SEMANTIC_CACHE_VERSION_CHECK_INTERVAL', 5.0),
+    )
+
 # NO NEED TO CHANGE ANYTHING BELOW THIS LINE
+def expired_response():
+    return jsonify({"type": "error", "error": "Cached result expired, please ask the question again", "expired": True})
+
 def requires_cache(fields):
     def decorator(f):
         @wraps(f)
@@ -41,16 +71,25 @@ def requires_cache(fields):
             if id is None:
                 return jsonify({"type": "error", "error": "No id provided"})
             
+            # 每个字段只读取一次，避免检查和取值之间条目过期，也不重复计入命中统计
+            field_values = {}
             for field in fields:
-                if cache.get(id=id, field=field) is None:
+                value = cache.get(id=id, field=field)
+                if value is None:
+                    # 缓存有容量和存活时间限制，已被移除的结果需要重新提问
+                    if cache.was_evicted(id=id):
+                        return expired_response()
                     return jsonify({"type": "error", "error": f"No {field} found"})
-            
-            field_values = {field: cache.get(id=id, field=field) for field in fields}
+                field_values[field] = value
             
             # Add the id to the field_values
             field_values['id'] = id
 
-            return f(*args, **field_values, **kwargs)
+            try:
+                return f(*args, **field_values, **kwargs)
+            except FrameExpiredError:
+                # 取出缓存值之后落盘文件被淘汰删除
+                return expired_response()
         return decorated
     return decorator
 
@@ -70,17 +109,30 @@ def generate_sql():
         return jsonify({"type": "error", "error": "No question provided"})
 
     id = cache.generate_id(question=question)
-    sql = vn.generate_sql(question=question)
+
+    # 语义相同的问题在训练数据未变化时直接返回缓存的SQL
+    hit, embedding = semantic_cache.lookup(question) if semantic_cache else (None, None)
+    if hit:
+        sql = hit['sql']
+    else:
+        sql = vn.generate_sql(question=question)
+        if semantic_cache and vn.is_sql_valid(sql=sql):
+            semantic_cache.store(question, sql, embedding)
 
     cache.set(id=id, field='question', value=question)
     cache.set(id=id, field='sql', value=sql)
 
-    return jsonify(
-        {
-            "type": "sql", 
-            "id": id,
-            "text": sql,
-        })
+    response = {
+        "type": "sql", 
+        "id": id,
+        "text": sql,
+        "cached": hit is not None,
+    }
+    if hit:
+        response["cached_question"] = hit['question']
+        response["similarity"] = hit['similarity']
+
+    return jsonify(response)
 
 @app.route('/api/v0/run_sql', methods=['GET'])
 @requires_cache(['sql'])
@@ -88,7 +140,13 @@ def run_sql(id: str, sql: str):
     try:
         df = vn.run_sql(sql=sql)
 
-        cache.set(id=id, field='df', value=df)
+        # 查询结果以压缩的Arrow格式缓存，较大的结果落盘
+        cache.set(id=id, field='df', value=store_frame(
+            df,
+            compression=getattr(ext_config, 'CACHE_FRAME_COMPRESSION', 'zstd'),
+            spill_dir=getattr(ext_config, 'CACHE_SPILL_DIR', None),
+            spill_bytes=getattr(ext_config, 'CACHE_SPILL_BYTES', None),
+        ))
 
         return jsonify(
             {
@@ -103,7 +161,7 @@ def run_sql(id: str, sql: str):
 @app.route('/api/v0/download_csv', methods=['GET'])
 @requires_cache(['df'])
 def download_csv(id: str, df):
-    csv = df.to_csv()
+    csv = load_frame(df).to_csv()
 
     return Response(
         csv,
@@ -115,6 +173,7 @@ def download_csv(id: str, df):
 @requires_cache(['df', 'question', 'sql'])
 def generate_plotly_figure(id: str, df, question, sql):
     try:
+        df = load_frame(df)
         code = vn.generate_plotly_code(question=question, sql=sql, df_metadata=f"Running df.dtypes gives:\n {df.dtypes}")
         fig = vn.get_plotly_figure(plotly_code=code, df=df, dark_mode=False)
         fig_json = fig.to_json()
@@ -127,6 +186,8 @@ def generate_plotly_figure(id: str, df, question, sql):
                 "id": id,
                 "fig": fig_json,
             })
+    except FrameExpiredError:
+        return expired_response()
     except Exception as e:
         # Print the stack trace
         import traceback
@@ -136,23 +197,54 @@ def generate_plotly_figure(id: str, df, question, sql):
 
 @app.route('/api/v0/get_training_data', methods=['GET'])
 def get_training_data():
-    df = vn.get_training_data()
-    
-    # 添加统计信息
-    stats = {}
-    if not df.empty and 'training_data_type' in df.columns:
-        type_counts = df['training_data_type'].value_counts().to_dict()
-        stats = {
-            "total": len(df),
-            "by_type": type_counts
-        }
-    
+    training_data_type = flask.request.args.get('type')
+    search = flask.request.args.get('search')
+    after_id = flask.request.args.get('after')
+
+    try:
+        page_size = getattr(ext_config, 'TRAINING_DATA_PAGE_SIZE', 25)
+        max_page_size = getattr(ext_config, 'TRAINING_DATA_MAX_PAGE_SIZE', 500)
+        limit = max(1, min(int(flask.request.args.get('limit', page_size)), max_page_size))
+        offset = max(0, int(flask.request.args.get('offset', 0)))
+    except ValueError:
+        return jsonify({"type": "error", "error": "Invalid limit or offset"})
+
+    next_after = None
+    if hasattr(vn, 'count_training_data'):
+        # PgVector在数据库端过滤、分页和统计，耗时与训练数据总量无关
+        try:
+            df = vn.get_training_data(training_data_type=training_data_type, search=search,
+                                      limit=limit, offset=offset, after_id=after_id)
+            stats = vn.count_training_data(training_data_type=training_data_type, search=search)
+        except Exception as e:
+            # 查询失败时返回错误，而不是显示为没有训练数据
+            return jsonify({"type": "error", "error": str(e)})
+        next_after = df.attrs.get('next_after_id')
+    else:
+        # 其他向量数据库取回全部数据后在内存中过滤和分页
+        df = vn.get_training_data()
+
+        stats = {}
+        if not df.empty and 'training_data_type' in df.columns:
+            if training_data_type:
+                df = df[df['training_data_type'] == training_data_type.lower()]
+            if search:
+                matches = df['content'].astype(str).str.contains(search, case=False, regex=False)
+                matches |= df['question'].fillna('').astype(str).str.contains(search, case=False, regex=False)
+                df = df[matches]
+            stats = {
+                "total": len(df),
+                "by_type": df['training_data_type'].value_counts().to_dict()
+            }
+        df = df.iloc[offset:offset + limit]
+
     return jsonify(
     {
         "type": "df", 
         "id": "training_data",
-        "df": df.head(25).to_json(orient='records'),
-        "stats": stats
+        "df": df.to_json(orient='records'),
+        "stats": stats,
+        "next_after": next_after
     })
 
 @app.route('/api/v0/remove_training_data', methods=['POST'])
@@ -164,6 +256,8 @@ def remove_training_data():
         return jsonify({"type": "error", "error": "No id provided"})
 
     if vn.remove_training_data(id=id):
+        if semantic_cache:
+            semantic_cache.invalidate()
         return jsonify({"success": True})
     else:
         return jsonify({"type": "error", "error": "Couldn't remove training data"})
@@ -178,14 +272,37 @@ def add_training_data():
     try:
         id = vn.train(question=question, sql=sql, ddl=ddl, documentation=documentation)
 
+        if semantic_cache:
+            semantic_cache.invalidate()
+
         return jsonify({"id": id})
     except Exception as e:
         print("TRAINING ERROR", e)
         return jsonify({"type": "error", "error": str(e)})
 
+@app.route('/api/v0/pool_stats', methods=['GET'])
+def pool_stats():
+    # 只有PgVector实例有数据库连接池
+    if not hasattr(vn, 'get_pool_stats'):
+        return jsonify({"type": "error", "error": "Vector store has no connection pool"})
+
+    return jsonify({"type": "pool_stats", "stats": vn.get_pool_stats()})
+
+@app.route('/api/v0/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify({"type": "cache_stats", "stats": cache.stats()})
+
+@app.route('/api/v0/semantic_cache_stats', methods=['GET'])
+def semantic_cache_stats():
+    if semantic_cache is None:
+        return jsonify({"type": "error", "error": "Semantic cache is disabled"})
+
+    return jsonify({"type": "semantic_cache_stats", "stats": semantic_cache.stats()})
+
 @app.route('/api/v0/generate_followup_questions', methods=['GET'])
 @requires_cache(['df', 'question', 'sql'])
 def generate_followup_questions(id: str, df, question, sql):
+    df = load_frame(df)
     followup_questions = vn.generate_followup_questions(question=question, sql=sql, df=df)
 
     cache.set(id=id, field='followup_questions', value=followup_questions)
@@ -213,12 +330,28 @@ def load_question(id: str, question, sql, df, fig_json, followup_questions):
                 "followup_questions": followup_questions,
             })
 
+    except FrameExpiredError:
+        return expired_response()
     except Exception as e:
         return jsonify({"type": "error", "error": str(e)})
 
 @app.route('/api/v0/get_question_history', methods=['GET'])
 def get_question_history():
-    return jsonify({"type": "question_history", "questions": cache.get_all(field_list=['question']) })
+    # 不带分页参数时按原有格式返回全部历史(提问顺序)，兼容内置前端
+    if not any(flask.request.args.get(name) for name in ('limit', 'cursor', 'keyword')):
+        return jsonify({"type": "question_history", "questions": cache.get_all(field_list=['question'])})
+
+    try:
+        limit = max(1, min(int(flask.request.args.get('limit', getattr(ext_config, 'CACHE_HISTORY_PAGE_SIZE', 50))), 500))
+        questions, next_cursor = cache.get_history(
+            limit=limit,
+            cursor=flask.request.args.get('cursor'),
+            keyword=flask.request.args.get('keyword'),
+        )
+    except ValueError:
+        return jsonify({"type": "error", "error": "Invalid limit or cursor"})
+
+    return jsonify({"type": "question_history", "questions": questions, "next_cursor": next_cursor})
 
 @app.route('/')
 def root():
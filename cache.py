@@ -1,6 +1,18 @@
 from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+import json
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
 import uuid
 
+from frame_store import StoredFrame
+
 class Cache(ABC):
     @abstractmethod
     def generate_id(self, *args, **kwargs):
@@ -22,41 +34,649 @@ class Cache(ABC):
     def delete(self, id):
         pass
 
+    def was_evicted(self, id) -> bool:
+        """id对应的条目是否因过期或容量限制被移除"""
+        return False
+
+    def get_history(self, limit=50, cursor=None, keyword=None):
+        """按提问时间倒序分页返回问题历史
+
+        默认实现遍历所有条目，子类应使用索引实现，使不带关键词时每页的代价与历史总量无关。
+        关键词过滤需要逐条检查问题文本，代价与扫描到的历史条数成正比，匹配项很少时
+        接近扫描全部历史。
+
+        Args:
+            limit: 每页条数
+            cursor: 上一页返回的游标，None表示第一页
+            keyword: 问题需要包含的关键词，多个关键词以空格分隔，不区分大小写
+
+        Returns:
+            ([{"id": id, "question": 问题}], 下一页的游标或None)
+        """
+        terms = _keyword_terms(keyword)
+        items = [
+            item for item in reversed(self.get_all(field_list=["question"]))
+            if item["question"] is not None and _matches(item["question"], terms)
+        ]
+        start = int(cursor) if cursor else 0
+        page = items[start:start + limit]
+        return page, str(start + limit) if start + limit < len(items) else None
+
+
+def _keyword_terms(keyword):
+    """将关键词拆分为小写的词列表"""
+    return keyword.lower().split() if keyword else []
+
+
+def _matches(question, terms):
+    """问题是否包含所有关键词"""
+    if not terms:
+        return True
+    question = str(question).lower()
+    return all(term in question for term in terms)
+
+
+def estimate_size(value) -> int:
+    """估算缓存值占用的字节数
+
+    DataFrame按memory_usage(deep=True)计算，StoredFrame按Arrow数据的大小计算(落盘的结果也计入，
+    以限制磁盘占用)，字符串(如fig_json)按长度计算，其他值按JSON序列化后的长度估算。
+    """
+    if value is None:
+        return 0
+    if isinstance(value, StoredFrame):
+        return value.nbytes
+    if hasattr(value, "memory_usage"):
+        try:
+            usage = value.memory_usage(index=True, deep=True)
+            return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+        except Exception:
+            pass
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value)
+    try:
+        return len(json.dumps(value, ensure_ascii=False, default=str))
+    except (TypeError, ValueError):
+        return sys.getsizeof(value)
+
+
+class _CacheEntry:
+    """一个问题的缓存条目"""
+    __slots__ = ("fields", "sizes", "size", "expires_at", "seq")
+
+    def __init__(self, expires_at):
+        self.fields = {}
+        self.sizes = {}
+        self.size = 0
+        self.expires_at = expires_at
+        # 问题历史中的序号，写入question字段时分配
+        self.seq = None
+
 
 class MemoryCache(Cache):
-    def __init__(self):
-        self.cache = {}
+    """有容量上限的内存缓存
+
+    每个条目在最后一次写入ttl秒后过期；条目总字节数或条目数超过上限时按最近最少使用(LRU)
+    的顺序淘汰。被移除的ID会保留一段记录，以便区分"已过期"和"不存在"。
+    """
+
+    # 保留的已移除ID记录数
+    MAX_TOMBSTONES = 10000
+    # 全量清理过期条目的最短间隔(秒)
+    PURGE_INTERVAL = 60
+
+    def __init__(self, max_bytes=None, max_entries=None, ttl=None):
+        """
+        Args:
+            max_bytes: 所有条目的估算总字节数上限，None表示不限制
+            max_entries: 条目数上限，None表示不限制
+            ttl: 条目的存活时间(秒)，None表示不过期
+        """
+        self.cache = OrderedDict()
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.total_bytes = 0
+        self.evicted = OrderedDict()
+        self.lock = threading.RLock()
+        self.next_purge = time.monotonic() + self.PURGE_INTERVAL
+        self.metrics = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        # 问题历史索引：按写入顺序递增的序号列表和序号到ID的映射，移除的条目留下空洞，过多时压缩
+        self.history_seqs = []
+        self.history_ids = {}
+        self.history_holes = 0
+        self.next_seq = 0
 
     def generate_id(self, *args, **kwargs):
         return str(uuid.uuid4())
 
-    def set(self, id, field, value):
-        if id not in self.cache:
-            self.cache[id] = {}
+    def _expiry(self, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        return time.monotonic() + ttl if ttl else None
+
+    def _remove(self, id, reason=None):
+        """移除条目（调用方持有锁），reason不为空时记录移除原因"""
+        entry = self.cache.pop(id)
+        self.total_bytes -= entry.size
+        for value in entry.fields.values():
+            _release(value)
+        if entry.seq is not None:
+            del self.history_ids[entry.seq]
+            self.history_holes += 1
+            if self.history_holes > 1024 and self.history_holes * 2 > len(self.history_seqs):
+                self.history_seqs = [seq for seq in self.history_seqs if seq in self.history_ids]
+                self.history_holes = 0
+        if reason:
+            self.metrics["evictions" if reason == "evicted" else "expirations"] += 1
+            self.evicted[id] = reason
+            while len(self.evicted) > self.MAX_TOMBSTONES:
+                self.evicted.popitem(last=False)
+
+    def _is_expired(self, entry, now):
+        return entry.expires_at is not None and entry.expires_at <= now
+
+    def _purge_expired(self, force=False):
+        """清理所有过期条目（调用方持有锁）"""
+        now = time.monotonic()
+        if not force and now < self.next_purge:
+            return
+        self.next_purge = now + self.PURGE_INTERVAL
+        for id in [id for id, entry in self.cache.items() if self._is_expired(entry, now)]:
+            self._remove(id, "expired")
+
+    def _evict(self, protect):
+        """超出容量时按LRU顺序淘汰条目，刚写入的条目不淘汰（调用方持有锁）"""
+        while ((self.max_bytes is not None and self.total_bytes > self.max_bytes)
+               or (self.max_entries is not None and len(self.cache) > self.max_entries)):
+            victim = next((id for id in self.cache if id != protect), None)
+            if victim is None:
+                break
+            self._remove(victim, "evicted")
+
+    def set(self, id, field, value, ttl=None):
+        with self.lock:
+            self._purge_expired()
+            entry = self.cache.get(id)
+            if entry is None:
+                entry = self.cache[id] = _CacheEntry(self._expiry(ttl))
+                self.evicted.pop(id, None)
+            else:
+                entry.expires_at = self._expiry(ttl)
+                self.cache.move_to_end(id)
+
+            size = estimate_size(value)
+            entry.size += size - entry.sizes.get(field, 0)
+            self.total_bytes += size - entry.sizes.get(field, 0)
+            previous = entry.fields.get(field)
+            if previous is not value:
+                _release(previous)
+            entry.fields[field] = value
+            entry.sizes[field] = size
+
+            if field == "question" and entry.seq is None:
+                self.next_seq += 1
+                entry.seq = self.next_seq
+                self.history_seqs.append(entry.seq)
+                self.history_ids[entry.seq] = id
+
+            self._evict(protect=id)
+
+    def get(self, id, field):
+        with self.lock:
+            entry = self.cache.get(id)
+            if entry is None:
+                self.metrics["misses"] += 1
+                return None
+
+            if self._is_expired(entry, time.monotonic()):
+                self._remove(id, "expired")
+                self.metrics["misses"] += 1
+                return None
+
+            if field not in entry.fields:
+                self.metrics["misses"] += 1
+                return None
+
+            self.cache.move_to_end(id)
+            self.metrics["hits"] += 1
+            return entry.fields[field]
+
+    def get_all(self, field_list) -> list:
+        with self.lock:
+            self._purge_expired(force=True)
+            return [
+                {
+                    "id": id,
+                    **{
+                        field: entry.fields.get(field)
+                        for field in field_list
+                    }
+                }
+                for id, entry in self.cache.items()
+            ]
 
-        self.cache[id][field] = value
+    def delete(self, id):
+        with self.lock:
+            if id in self.cache:
+                self._remove(id)
+
+    def was_evicted(self, id) -> bool:
+        with self.lock:
+            entry = self.cache.get(id)
+            if entry is not None and self._is_expired(entry, time.monotonic()):
+                self._remove(id, "expired")
+            return id in self.evicted
+
+    def get_history(self, limit=50, cursor=None, keyword=None):
+        """按提问时间倒序分页返回问题历史，游标为序号，用二分查找定位
+
+        带关键词时从游标处逐条检查，直到凑满一页，匹配项很少时会遍历大部分历史。
+        """
+        terms = _keyword_terms(keyword)
+        with self.lock:
+            now = time.monotonic()
+            pos = bisect_left(self.history_seqs, int(cursor)) if cursor else len(self.history_seqs)
+            items = []
+            # 多取一条判断是否还有下一页
+            while pos > 0 and len(items) <= limit:
+                pos -= 1
+                seq = self.history_seqs[pos]
+                id = self.history_ids.get(seq)
+                if id is None:
+                    continue
+                entry = self.cache[id]
+                if self._is_expired(entry, now):
+                    continue
+                question = entry.fields.get("question")
+                if _matches(question, terms):
+                    items.append((seq, {"id": id, "question": question}))
+        next_cursor = str(items[limit - 1][0]) if len(items) > limit else None
+        return [item for _, item in items[:limit]], next_cursor
+
+    def stats(self) -> dict:
+        """返回缓存的容量和命中情况"""
+        with self.lock:
+            self._purge_expired(force=True)
+            return {
+                "backend": "memory",
+                "entries": len(self.cache),
+                "bytes": self.total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                **self.metrics,
+            }
+
+def _release(value):
+    """释放缓存值占用的外部资源(StoredFrame的落盘文件)"""
+    if isinstance(value, StoredFrame):
+        value.release()
+
+
+def serialize_value(value):
+    """将缓存值序列化为(类型, 二进制数据)
+
+    字符串(SQL、问题、fig_json)按UTF-8编码，列表和字典等JSON值按JSON编码，
+    StoredFrame保存Arrow缓冲区或落盘文件路径，DataFrame等其他对象用pickle最高协议
+    (协议5对numpy数组按原始字节存储)序列化。
+    """
+    if isinstance(value, StoredFrame):
+        return "frame", value.to_bytes()
+    if isinstance(value, str):
+        return "str", value.encode("utf-8")
+    if isinstance(value, (bytes, bytearray)):
+        return "bytes", bytes(value)
+    if value is None or isinstance(value, (list, dict, int, float, bool)):
+        try:
+            return "json", json.dumps(value, ensure_ascii=False).encode("utf-8")
+        except (TypeError, ValueError):
+            pass
+    return "pickle", pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def deserialize_value(kind, data):
+    """serialize_value的逆操作"""
+    if kind == "str":
+        return bytes(data).decode("utf-8")
+    if kind == "bytes":
+        return bytes(data)
+    if kind == "json":
+        return json.loads(bytes(data).decode("utf-8"))
+    if kind == "frame":
+        return StoredFrame.from_bytes(data)
+    if kind == "pickle":
+        return pickle.loads(data)
+    raise ValueError(f"未知的缓存值类型: {kind}")
+
+
+class SQLiteCache(Cache):
+    """基于SQLite(WAL模式)的共享缓存
+
+    缓存保存在本机的SQLite文件中，多个工作进程(如gunicorn的多个worker)和重启后的进程
+    看到的是同一份问答状态。过期、容量淘汰和已移除ID记录的规则与MemoryCache相同，
+    时间使用系统时间以便在进程之间比较。
+
+    每个进程(fork之后)使用自己的数据库连接，同一进程内的线程共用一个连接并由锁保护。
+    """
+
+    MAX_TOMBSTONES = MemoryCache.MAX_TOMBSTONES
+    PURGE_INTERVAL = MemoryCache.PURGE_INTERVAL
+
+    def __init__(self, path, max_bytes=None, max_entries=None, ttl=None, busy_timeout=30):
+        """
+        Args:
+            path: SQLite文件路径
+            max_bytes: 所有条目的估算总字节数上限，None表示不限制
+            max_entries: 条目数上限，None表示不限制
+            ttl: 条目的存活时间(秒)，None表示不过期
+            busy_timeout: 等待其他进程释放写锁的最长时间(秒)
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.busy_timeout = busy_timeout
+        self.lock = threading.RLock()
+        self._conn = None
+        self._pid = None
+        self.next_purge = 0
+        # 命中统计只记录本进程
+        self.metrics = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connection()
+        print(f"已初始化SQLite问答缓存: {path}")
+
+    def _connection(self):
+        """返回本进程的数据库连接，fork之后重新连接（调用方持有锁或在初始化中）"""
+        if self._conn is None or self._pid != os.getpid():
+            # 继承自父进程的连接不能在子进程中使用，也不关闭，直接丢弃
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout,
+                                   isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                id TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                expires_at REAL,
+                size INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_cache_entries_accessed ON cache_entries (accessed_at);
+            CREATE INDEX IF NOT EXISTS idx_cache_entries_expires ON cache_entries (expires_at);
+            CREATE TABLE IF NOT EXISTS cache_fields (
+                id TEXT NOT NULL,
+                field TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                value BLOB,
+                size INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (id, field)
+            );
+            CREATE TABLE IF NOT EXISTS cache_history (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL UNIQUE,
+                question TEXT
+            );
+            CREATE TABLE IF NOT EXISTS cache_evicted (
+                id TEXT PRIMARY KEY,
+                reason TEXT NOT NULL,
+                evicted_at REAL NOT NULL
+            );
+            """)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    @contextmanager
+    def _transaction(self):
+        """在本进程的连接上开启写事务，立即获取写锁以避免读后升级写锁时的冲突"""
+        with self.lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _expiry(self, now, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        return now + ttl if ttl else None
+
+    def _remove(self, conn, ids, reason=None, now=None):
+        """删除条目（在写事务内调用），reason不为空时记录移除原因"""
+        if not ids:
+            return
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for (data,) in conn.execute(
+                f"SELECT value FROM cache_fields WHERE kind = 'frame' AND id IN ({placeholders})", chunk
+            ):
+                _release(deserialize_value("frame", data))
+            conn.execute(f"DELETE FROM cache_fields WHERE id IN ({placeholders})", chunk)
+            conn.execute(f"DELETE FROM cache_entries WHERE id IN ({placeholders})", chunk)
+            conn.execute(f"DELETE FROM cache_history WHERE id IN ({placeholders})", chunk)
+        if reason:
+            self.metrics["evictions" if reason == "evicted" else "expirations"] += len(ids)
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache_evicted (id, reason, evicted_at) VALUES (?, ?, ?)",
+                [(id, reason, now or time.time()) for id in ids]
+            )
+
+    def _purge_expired(self, conn, now, force=False):
+        """清理过期条目和过多的已移除ID记录（在写事务内调用）"""
+        if not force and now < self.next_purge:
+            return
+        self.next_purge = now + self.PURGE_INTERVAL
+        expired = [row[0] for row in conn.execute(
+            "SELECT id FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+        )]
+        self._remove(conn, expired, "expired", now)
+        conn.execute(
+            """
+            DELETE FROM cache_evicted WHERE id IN (
+                SELECT id FROM cache_evicted ORDER BY evicted_at DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.MAX_TOMBSTONES,)
+        )
+
+    def _evict(self, conn, protect, now):
+        """超出容量时按LRU顺序淘汰条目，刚写入的条目不淘汰（在写事务内调用）"""
+        while True:
+            total_bytes, count = conn.execute(
+                "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM cache_entries"
+            ).fetchone()
+            excess_entries = count - self.max_entries if self.max_entries is not None else 0
+            excess_bytes = total_bytes - self.max_bytes if self.max_bytes is not None else 0
+            if excess_entries <= 0 and excess_bytes <= 0:
+                return
+            victims = conn.execute(
+                "SELECT id, size FROM cache_entries WHERE id != ? ORDER BY accessed_at LIMIT ?",
+                (protect, max(excess_entries, 1) if excess_bytes <= 0 else 100)
+            ).fetchall()
+            if not victims:
+                return
+            selected = []
+            for victim_id, size in victims:
+                selected.append(victim_id)
+                excess_entries -= 1
+                excess_bytes -= size
+                if excess_entries <= 0 and excess_bytes <= 0:
+                    break
+            self._remove(conn, selected, "evicted", now)
+
+    def generate_id(self, *args, **kwargs):
+        return str(uuid.uuid4())
+
+    def set(self, id, field, value, ttl=None):
+        kind, data = serialize_value(value)
+        size = estimate_size(value)
+        now = time.time()
+        with self._transaction() as conn:
+            self._purge_expired(conn, now)
+            conn.execute(
+                """
+                INSERT INTO cache_entries (id, created_at, accessed_at, expires_at, size)
+                VALUES (?, ?, ?, ?, 0)
+                ON CONFLICT (id) DO UPDATE SET accessed_at = excluded.accessed_at, expires_at = excluded.expires_at
+                """,
+                (id, now, now, self._expiry(now, ttl))
+            )
+            previous = conn.execute(
+                "SELECT size, kind, value FROM cache_fields WHERE id = ? AND field = ?", (id, field)
+            ).fetchone()
+            if previous is not None and previous[1] == "frame" and bytes(previous[2]) != data:
+                _release(deserialize_value("frame", previous[2]))
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_fields (id, field, kind, value, size) VALUES (?, ?, ?, ?, ?)",
+                (id, field, kind, sqlite3.Binary(data), size)
+            )
+            conn.execute(
+                "UPDATE cache_entries SET size = size + ? WHERE id = ?",
+                (size - (previous[0] if previous else 0), id)
+            )
+            if field == "question":
+                conn.execute(
+                    """
+                    INSERT INTO cache_history (id, question) VALUES (?, ?)
+                    ON CONFLICT (id) DO UPDATE SET question = excluded.question
+                    """,
+                    (id, value if isinstance(value, str) else str(value))
+                )
+            conn.execute("DELETE FROM cache_evicted WHERE id = ?", (id,))
+            self._evict(conn, protect=id, now=now)
 
     def get(self, id, field):
-        if id not in self.cache:
-            return None
+        now = time.time()
+        with self.lock:
+            conn = self._connection()
+            row = conn.execute(
+                """
+                SELECT e.expires_at, f.kind, f.value
+                FROM cache_entries e
+                LEFT JOIN cache_fields f ON f.id = e.id AND f.field = ?
+                WHERE e.id = ?
+                """,
+                (field, id)
+            ).fetchone()
+
+            if row is None:
+                self.metrics["misses"] += 1
+                return None
+
+            expires_at, kind, data = row
+            if expires_at is not None and expires_at <= now:
+                with self._transaction() as conn:
+                    self._remove(conn, [id], "expired", now)
+                self.metrics["misses"] += 1
+                return None
 
-        if field not in self.cache[id]:
-            return None
+            if kind is None:
+                self.metrics["misses"] += 1
+                return None
 
-        return self.cache[id][field]
+            conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE id = ?", (now, id))
+            self.metrics["hits"] += 1
+        return deserialize_value(kind, data)
 
     def get_all(self, field_list) -> list:
+        now = time.time()
+        with self._transaction() as conn:
+            self._purge_expired(conn, now, force=True)
+        with self.lock:
+            conn = self._connection()
+            ids = [row[0] for row in conn.execute("SELECT id FROM cache_entries ORDER BY created_at")]
+            placeholders = ",".join("?" * len(field_list))
+            values = {}
+            if field_list:
+                for id, field, kind, data in conn.execute(
+                    f"SELECT id, field, kind, value FROM cache_fields WHERE field IN ({placeholders})",
+                    list(field_list)
+                ):
+                    values[(id, field)] = deserialize_value(kind, data)
         return [
             {
                 "id": id,
                 **{
-                    field: self.get(id=id, field=field)
+                    field: values.get((id, field))
                     for field in field_list
                 }
             }
-            for id in self.cache
+            for id in ids
         ]
 
     def delete(self, id):
-        if id in self.cache:
-            del self.cache[id]
\ No newline at end of file
+        with self._transaction() as conn:
+            self._remove(conn, [id])
+
+    def was_evicted(self, id) -> bool:
+        now = time.time()
+        with self.lock:
+            conn = self._connection()
+            row = conn.execute("SELECT expires_at FROM cache_entries WHERE id = ?", (id,)).fetchone()
+            if row is not None and row[0] is not None and row[0] <= now:
+                with self._transaction() as conn:
+                    self._remove(conn, [id], "expired", now)
+            return conn.execute("SELECT 1 FROM cache_evicted WHERE id = ?", (id,)).fetchone() is not None
+
+    def get_history(self, limit=50, cursor=None, keyword=None):
+        """按提问时间倒序分页返回问题历史，游标为cache_history的自增主键
+
+        关键词以LIKE '%词%'过滤，无法使用索引，SQLite沿主键倒序扫描直到凑满一页，
+        匹配项很少时会扫描大部分历史。
+        """
+        conditions = ["(e.expires_at IS NULL OR e.expires_at > ?)"]
+        params = [time.time()]
+        if cursor:
+            conditions.append("h.seq < ?")
+            params.append(int(cursor))
+        for term in _keyword_terms(keyword):
+            escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            conditions.append("h.question LIKE ? ESCAPE '\\'")
+            params.append(f"%{escaped}%")
+        params.append(limit + 1)
+
+        with self.lock:
+            rows = self._connection().execute(
+                f"""
+                SELECT h.seq, h.id, h.question
+                FROM cache_history h
+                JOIN cache_entries e ON e.id = h.id
+                WHERE {" AND ".join(conditions)}
+                ORDER BY h.seq DESC
+                LIMIT ?
+                """,
+                params
+            ).fetchall()
+        next_cursor = str(rows[limit - 1][0]) if len(rows) > limit else None
+        return [{"id": id, "question": question} for _, id, question in rows[:limit]], next_cursor
+
+    def stats(self) -> dict:
+        """返回缓存的容量(所有进程共享)和命中情况(本进程)"""
+        now = time.time()
+        with self._transaction() as conn:
+            self._purge_expired(conn, now, force=True)
+            total_bytes, count = conn.execute(
+                "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM cache_entries"
+            ).fetchone()
+        return {
+            "backend": "sqlite",
+            "entries": count,
+            "bytes": total_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            **self.metrics,
+        }
+
+    def close(self):
+        """关闭本进程的数据库连接"""
+        with self.lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
@@ -0,0 +1,160 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+
+class EmbeddingCache:
+    """嵌入向量缓存，按(模型名称, 向量维度, 文本哈希)寻址
+
+    包含两级缓存：
+    1. 内存LRU缓存，容量由max_size控制
+    2. 可选的SQLite持久化缓存，向量以float32二进制存储，进程重启后仍然有效
+    """
+
+    def __init__(self, model_name: str, max_size: int = 100, persist_path: Optional[str] = None):
+        """
+        Args:
+            model_name: 嵌入模型名称
+            max_size: 内存LRU缓存的最大条数，0表示不使用内存缓存
+            persist_path: SQLite缓存文件路径，为None时不启用持久化缓存
+        """
+        self.model_name = model_name
+        self.max_size = max_size
+        self.persist_path = persist_path
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+
+        # 命中统计
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if persist_path:
+            directory = os.path.dirname(os.path.abspath(persist_path))
+            os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(persist_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                dimension INTEGER NOT NULL,
+                vector BLOB NOT NULL
+            )
+            """)
+            self._conn.commit()
+
+        print(f"已初始化嵌入向量缓存 (内存容量: {max_size}, 持久化: {persist_path or '未启用'})")
+
+    def make_key(self, text: str, dimension: int) -> str:
+        """根据模型名称、向量维度和文本内容生成缓存键"""
+        content = f"{self.model_name}\x00{dimension}\x00{text}"
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def get(self, text: str, dimension: int) -> Optional[List[float]]:
+        """查询单个文本的嵌入向量，未命中返回None"""
+        return self.get_many([text], dimension)[0]
+
+    def get_many(self, texts: List[str], dimension: int) -> List[Optional[List[float]]]:
+        """批量查询嵌入向量，返回与输入顺序一致的列表，未命中的位置为None"""
+        keys = [self.make_key(text, dimension) for text in texts]
+        results = [None] * len(keys)
+        disk_lookup = {}
+
+        with self._lock:
+            for idx, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    results[idx] = vector
+                else:
+                    disk_lookup.setdefault(key, []).append(idx)
+
+            if disk_lookup and self._conn is not None:
+                found = self._load_from_disk(list(disk_lookup.keys()))
+                for key, vector in found.items():
+                    for idx in disk_lookup.pop(key):
+                        results[idx] = vector
+                        self.disk_hits += 1
+                    self._remember(key, vector)
+
+            self.misses += sum(len(indices) for indices in disk_lookup.values())
+
+        return results
+
+    def set(self, text: str, dimension: int, vector: List[float]):
+        """写入单个文本的嵌入向量"""
+        self.set_many([text], dimension, [vector])
+
+    def set_many(self, texts: List[str], dimension: int, vectors: List[List[float]]):
+        """批量写入嵌入向量"""
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self.make_key(text, dimension)
+                vector = list(vector)
+                self._remember(key, vector)
+                rows.append((key, self.model_name, dimension, array("f", vector).tobytes()))
+
+            if rows and self._conn is not None:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embedding_cache (key, model, dimension, vector) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.commit()
+
+    def _remember(self, key: str, vector: List[float]):
+        """写入内存LRU缓存，超出容量时淘汰最久未使用的条目（调用方持有锁）"""
+        if self.max_size <= 0:
+            return
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def _load_from_disk(self, keys: List[str]) -> dict:
+        """从SQLite缓存中批量读取向量（调用方持有锁）"""
+        found = {}
+        # SQLite单条语句的参数个数有限，分段查询
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cursor = self._conn.execute(
+                f"SELECT key, vector FROM embedding_cache WHERE key IN ({placeholders})",
+                chunk
+            )
+            for key, blob in cursor.fetchall():
+                vector = array("f")
+                vector.frombytes(blob)
+                found[key] = vector.tolist()
+        return found
+
+    def stats(self) -> dict:
+        """返回缓存命中统计"""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+                "memory_size": len(self._memory),
+                "memory_capacity": self.max_size,
+                "persistent": self._conn is not None,
+            }
+
+    def close(self):
+        """关闭持久化缓存连接"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
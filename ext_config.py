@@ -57,6 +57,14 @@ OLLAMA_EMBEDDING_MODEL = "quentinz/bge-large-zh-v1.5"
 
 OLLAMA_EMBEDDING_DIMENSION = 1024  
 
+# Ollama批量嵌入配置（使用/api/embed多输入接口）
+OLLAMA_EMBED_BATCH_SIZE = 32  # 单次请求最多包含的文本条数
+OLLAMA_EMBED_BATCH_MAX_TOKENS = 8192  # 单次请求的token预算（按字符数保守估算）
+OLLAMA_REQUEST_TIMEOUT = 60  # 单次HTTP请求超时时间（秒）
+OLLAMA_POOL_SIZE = 8  # HTTP keep-alive连接池大小
+OLLAMA_EMBED_MAX_WORKERS = 4  # 并发嵌入请求的线程数，1表示串行
+EMBEDDING_NORMALIZE = None  # 嵌入向量L2归一化。None表示只在PgVector内积检索(PGVECTOR_DISTANCE = "inner_product")时开启；ChromaDB默认的L2距离下与已有的未归一化向量混用会改变排序。修改后需重新训练(增量训练会自动全量重建)
+
 # 应用数据库连接配置 (业务数据库)
 DB_HOST = "192.168.67.10"
 DB_PORT = 5432
@@ -72,13 +80,74 @@ PGVECTOR_USER = "postgres"
 PGVECTOR_PASSWORD = "postgres"
 PGVECTOR_TABLE = "langchain_pg_embedding"  # PgVector表名
 
+# PgVector向量索引配置 (tools/reset_langchain_pgvector.py建索引和查询时使用)
+PGVECTOR_INDEX_TYPE = "hnsw"  # 向量索引类型: "hnsw" 或 "ivfflat"
+PGVECTOR_HNSW_M = 16  # HNSW每个节点的最大连接数
+PGVECTOR_HNSW_EF_CONSTRUCTION = 64  # HNSW建索引时的候选列表大小
+PGVECTOR_HNSW_EF_SEARCH = 100  # HNSW查询时的候选列表大小，越大召回率越高、查询越慢
+PGVECTOR_IVFFLAT_LISTS = None  # ivfflat聚类中心数，None表示按行数自动计算
+PGVECTOR_IVFFLAT_PROBES = None  # ivfflat查询时扫描的聚类数，None表示取索引lists的平方根
+PGVECTOR_MAINTENANCE_WORKERS = 4  # 建索引时的并行工作进程数
+PGVECTOR_MAINTENANCE_WORK_MEM = "1GB"  # 建索引时的maintenance_work_mem
+PGVECTOR_STORAGE_TYPE = "vector"  # 向量列类型: "vector"(float32) 或 "halfvec"(float16，存储和索引约减半)，需与重置工具建表时一致
+PGVECTOR_BINARY_RERANK = False  # 启用后在二值量化索引上取候选，再按完整精度重排，需用重置工具的--binary-rerank建索引
+PGVECTOR_RERANK_FACTOR = 4  # 二值量化检索时每个集合取 k*该值 个候选进行重排
+PGVECTOR_DISTANCE = "cosine"  # 距离度量: "cosine" 或 "inner_product"(向量归一化后用<#>检索，需用重置工具按vector_ip_ops建索引)
+
+# PgVector连接池配置 (三个集合和所有维护方法共用一个引擎，多进程服务器的每个工作进程各有一个连接池)
+PGVECTOR_POOL_SIZE = 5  # 连接池保持的连接数
+PGVECTOR_MAX_OVERFLOW = 10  # 连接池满时最多额外创建的连接数
+PGVECTOR_POOL_PRE_PING = True  # 取出连接时先检测是否可用，自动替换失效的连接
+PGVECTOR_POOL_RECYCLE = 1800  # 连接最长使用时间(秒)，超过后重建，-1表示不回收
+PGVECTOR_POOL_TIMEOUT = 30  # 连接池耗尽时等待空闲连接的最长时间(秒)
+
 # ChromaDB配置
 CHROMADB_PATH = "."  # ChromaDB文件存储路径
 
 # 批处理配置
 BATCH_PROCESSING_ENABLED = True
 BATCH_SIZE = 10
-MAX_WORKERS = 4
-EMBEDDING_CACHE_SIZE = 100
+MAX_WORKERS = 4  # 批量嵌入阶段的线程数
+PIPELINE_WRITE_WORKERS = 2  # 批量写入阶段的线程数
+PIPELINE_QUEUE_SIZE = 8  # 流水线阶段之间队列可缓冲的批次数，队列满时上游阻塞
+PIPELINE_BATCH_TIMEOUT = 2.0  # 输入空闲超过该秒数时发出未满的批次
+EMBEDDING_CACHE_SIZE = 100  # 嵌入向量内存LRU缓存条数，0表示关闭内存缓存
+EMBEDDING_CACHE_PATH = None  # 嵌入向量持久化缓存文件(SQLite)，例如 "embedding_cache.sqlite3"，None表示不持久化
+
+# SQL示例问题生成配置
+QUESTION_GEN_MAX_WORKERS = 4  # 并发调用大模型生成问题的线程数
+QUESTION_GEN_RATE_LIMIT = 5  # 每秒最多发起的大模型请求数，0表示不限制
+QUESTION_GEN_MAX_RETRIES = 3  # 调用失败时的最大重试次数
+QUESTION_CACHE_PATH = None  # 按SQL哈希持久化生成的问题(JSON)，例如 "question_cache.json"，None表示只在内存中缓存
+
+# 增量训练配置
+TRAINING_INCREMENTAL = True  # 启用后只训练新增或修改的数据块，并删除训练文件中已移除的数据
+TRAINING_MANIFEST_FILE = ".vanna_training_manifest.json"  # 训练清单文件名，保存在训练数据目录下
+TRAINING_CATALOG_DDL = False  # 启用后从业务数据库的系统目录生成每张表的DDL进行训练，不再读取导出的DDL文件；需开启TRAINING_INCREMENTAL，切换后首次训练会删除原DDL文件写入的记录，避免每张表的DDL重复
+TRAINING_CATALOG_SCHEMAS = ["public"]  # 从系统目录读取表结构的schema列表
+
+# 训练数据近似重复检测配置
+TRAINING_DEDUP_ENABLED = False  # 写入前与已有向量比较余弦相似度，跳过近似重复的训练数据，跳过的项目只记录在报告文件中
+TRAINING_DEDUP_THRESHOLD = 0.97  # 余弦相似度大于等于该值视为近似重复
+TRAINING_DEDUP_COLLECTIONS = ["documentation"]  # 参与去重的集合。不建议加入"sql"：只有过滤值或年份不同的问题/SQL对向量几乎相同，会被误判为重复；DDL按表区分不做去重
+TRAINING_DEDUP_REPORT = "dedup_report.json"  # 近似重复报告文件名，保存在训练数据目录下
+
+# Web应用配置
+TRAINING_DATA_PAGE_SIZE = 25  # 训练数据页面默认每页条数
+TRAINING_DATA_MAX_PAGE_SIZE = 500  # 训练数据接口单次请求允许的最大条数
+CACHE_BACKEND = "memory"  # 问答结果缓存: "memory"(进程内，只适合单进程) 或 "sqlite"(本机共享，多个工作进程和重启后可见)
+CACHE_SQLITE_PATH = "question_cache.sqlite3"  # CACHE_BACKEND = "sqlite" 时的缓存文件
+CACHE_MAX_BYTES = 512 * 1024 * 1024  # 问答结果缓存的估算总字节数上限(DataFrame按内存占用、图表按JSON长度)，超出时按LRU淘汰，None表示不限制
+CACHE_MAX_ENTRIES = 1000  # 问答结果缓存的最大问题数，None表示不限制
+CACHE_TTL = 3600  # 问答结果最后一次写入后的存活时间(秒)，None表示不过期
+CACHE_HISTORY_PAGE_SIZE = 50  # 问题历史接口传入limit、cursor或keyword时的默认每页条数；不传时返回全部历史。关键词过滤需逐条扫描历史
+CACHE_FRAME_COMPRESSION = "zstd"  # 查询结果以Arrow格式缓存时的压缩算法: "zstd"、"lz4"或None，需要安装pyarrow，未安装时按原样缓存DataFrame
+CACHE_SPILL_DIR = "cache_spill"  # 较大的查询结果落盘的目录(不压缩的Arrow文件，内存映射读取)，None表示不落盘
+CACHE_SPILL_BYTES = 16 * 1024 * 1024  # 查询结果的Arrow数据超过该字节数时落盘
+SEMANTIC_CACHE_ENABLED = False  # 语义相同的问题在训练数据未变化时直接返回已生成的SQL，不再调用大模型。相似问题可能命中为其他问题生成的SQL，前端不会提示，启用前需评估
+SEMANTIC_CACHE_THRESHOLD = 0.95  # 问题向量的余弦相似度大于等于该值、且数字和引号内的文本相同时视为同一个问题；未加引号的名称(门店、地区)和中文数字无法区分，只差这些内容的问题相似度通常高于0.95
+SEMANTIC_CACHE_MAX_ENTRIES = 1000  # 语义缓存最多保存的问题数，满时覆盖最早的条目
+SEMANTIC_CACHE_TTL = 86400  # 语义缓存条目的存活时间(秒)，None表示不过期
+SEMANTIC_CACHE_VERSION_CHECK_INTERVAL = 5  # 检查训练数据版本的最短间隔(秒)，版本变化时清空语义缓存
 
 USE_CHINESE_PROMPTS = True  # 设置为True启用中文优化版本的千问实现，使用ChineseQianWenAI_Chat类
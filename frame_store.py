@@ -0,0 +1,195 @@
+import os
+import struct
+import uuid
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+except ImportError:
+    pa = None
+    ipc = None
+
+
+# 写入Arrow文件时每个记录批次的最大行数，读取前几行时只需解码开头的批次
+BATCH_ROWS = 65536
+
+# to_bytes的头部：类型(B: 内存缓冲区, P: 落盘文件路径)和行数
+_HEADER = struct.Struct("<cQ")
+
+# 落盘文件的扩展名
+SPILL_SUFFIX = ".arrow"
+
+
+class FrameExpiredError(Exception):
+    """落盘文件已被删除（缓存淘汰或进程重启后清理），需要重新查询"""
+    pass
+
+
+class StoredFrame:
+    """以Arrow IPC文件格式保存的查询结果DataFrame
+
+    较小的结果以压缩(默认zstd)的Arrow缓冲区保存在内存或共享缓存中；超过spill_bytes的
+    结果写入spill_dir下的不压缩Arrow文件，读取时内存映射，不占用进程内存，其他进程也
+    可以直接读取。只有在需要时才转换回pandas，只需要前几行时只解码开头的记录批次。
+    """
+    __slots__ = ("buffer", "path", "num_rows", "nbytes")
+
+    def __init__(self, buffer=None, path=None, num_rows=0, nbytes=0):
+        self.buffer = buffer
+        self.path = path
+        self.num_rows = num_rows
+        self.nbytes = nbytes
+
+    @classmethod
+    def from_dataframe(cls, df, compression="zstd", spill_dir=None, spill_bytes=None):
+        """将DataFrame转换为Arrow格式
+
+        Args:
+            df: pandas DataFrame
+            compression: 内存缓冲区的压缩算法 ("zstd"、"lz4"或None)
+            spill_dir: 落盘目录，None表示不落盘
+            spill_bytes: DataFrame内存占用超过该字节数时落盘
+
+        Returns:
+            StoredFrame
+        """
+        table = pa.Table.from_pandas(df)
+        spill = spill_dir and spill_bytes is not None and table.nbytes > spill_bytes
+
+        if spill:
+            os.makedirs(spill_dir, exist_ok=True)
+            # 文件名以进程ID开头，清理时只删除已退出进程的文件
+            path = os.path.join(os.path.abspath(spill_dir), f"{os.getpid()}-{uuid.uuid4().hex}{SPILL_SUFFIX}")
+            # 落盘文件不压缩，内存映射读取时无需解压和复制
+            with pa.OSFile(path, "wb") as sink:
+                with ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table, max_chunksize=BATCH_ROWS)
+            return cls(path=path, num_rows=table.num_rows, nbytes=os.path.getsize(path))
+
+        sink = pa.BufferOutputStream()
+        options = ipc.IpcWriteOptions(compression=compression)
+        with ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table, max_chunksize=BATCH_ROWS)
+        buffer = sink.getvalue()
+        return cls(buffer=buffer, num_rows=table.num_rows, nbytes=buffer.size)
+
+    def _reader(self):
+        if self.path is not None:
+            # 文件可能在取出缓存值之后被淘汰删除；已经映射的文件删除后仍可读取
+            try:
+                source = pa.memory_map(self.path, "r")
+            except FileNotFoundError as e:
+                raise FrameExpiredError(f"落盘的查询结果已被删除: {self.path}") from e
+            return ipc.open_file(source)
+        return ipc.open_file(self.buffer)
+
+    def to_pandas(self):
+        """读取完整的DataFrame"""
+        return self._reader().read_pandas()
+
+    def head(self, n=5):
+        """只解码开头的记录批次，返回前n行"""
+        reader = self._reader()
+        batches = []
+        rows = 0
+        for idx in range(reader.num_record_batches):
+            if rows >= n:
+                break
+            batch = reader.get_batch(idx)
+            batches.append(batch)
+            rows += batch.num_rows
+        table = pa.Table.from_batches(batches, schema=reader.schema)
+        return table.slice(0, n).to_pandas()
+
+    def to_bytes(self) -> bytes:
+        """序列化为共享缓存中保存的字节：头部为类型和行数，落盘的结果只保存文件路径"""
+        if self.path is not None:
+            return _HEADER.pack(b"P", self.num_rows) + self.path.encode("utf-8")
+        return _HEADER.pack(b"B", self.num_rows) + self.buffer.to_pybytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """to_bytes的逆操作，内存中的缓冲区直接引用传入的字节，不复制"""
+        data = memoryview(data)
+        kind, num_rows = _HEADER.unpack(data[:_HEADER.size])
+        body = data[_HEADER.size:]
+        if kind == b"P":
+            path = bytes(body).decode("utf-8")
+            nbytes = os.path.getsize(path) if os.path.exists(path) else 0
+            return cls(path=path, num_rows=num_rows, nbytes=nbytes)
+        return cls(buffer=pa.py_buffer(body), num_rows=num_rows, nbytes=len(body))
+
+    def release(self):
+        """删除落盘文件"""
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def store_frame(df, compression="zstd", spill_dir=None, spill_bytes=None):
+    """将查询结果转换为StoredFrame，pyarrow不可用或转换失败时原样返回DataFrame"""
+    if pa is None or df is None:
+        return df
+    try:
+        return StoredFrame.from_dataframe(df, compression=compression, spill_dir=spill_dir, spill_bytes=spill_bytes)
+    except (pa.ArrowException, TypeError, ValueError) as e:
+        print(f"[WARNING] 查询结果无法转换为Arrow格式，按原样缓存: {e}")
+        return df
+
+
+def _process_alive(pid: int) -> bool:
+    """进程是否仍在运行，无法确定时视为在运行"""
+    if pid == os.getpid():
+        return True
+    if os.name == "nt":
+        # Windows上os.kill(pid, 0)会结束目标进程，改为尝试打开进程句柄
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # 进程存在但属于其他用户
+        return True
+    return True
+
+
+def clean_spill_dir(spill_dir) -> int:
+    """删除落盘目录中已退出进程留下的Arrow文件
+
+    进程内缓存只在淘汰时删除落盘文件，进程重启或崩溃后原有文件不再被引用。文件名以
+    写入进程的ID开头，仍在运行的进程(例如其他工作进程)的文件不会被删除；没有进程ID的
+    文件是旧版本写入的，一并删除。
+
+    Returns:
+        删除的文件数
+    """
+    if not spill_dir or not os.path.isdir(spill_dir):
+        return 0
+    removed = 0
+    for name in os.listdir(spill_dir):
+        if not name.endswith(SPILL_SUFFIX):
+            continue
+        owner = name.split("-", 1)[0]
+        if "-" in name and owner.isdigit() and _process_alive(int(owner)):
+            continue
+        try:
+            os.remove(os.path.join(spill_dir, name))
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def load_frame(value):
+    """取出完整的pandas DataFrame，value可以是StoredFrame或DataFrame"""
+    if isinstance(value, StoredFrame):
+        return value.to_pandas()
+    return value
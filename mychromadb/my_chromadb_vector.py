@@ -1,3 +1,4 @@
+import hashlib
 import json
 from typing import List
 
@@ -9,6 +10,8 @@ from chromadb.utils import embedding_functions
 from vanna.base import VannaBase
 from vanna.utils import deterministic_uuid
 
+from query_context import QueryContext
+
 default_ef = embedding_functions.DefaultEmbeddingFunction()
 
 
@@ -28,6 +31,11 @@ class My_ChromaDB_VectorStore(VannaBase):
         self.n_results_documentation = config.get("n_results_documentation", config.get("n_results", 10))
         self.n_results_ddl = config.get("n_results_ddl", config.get("n_results", 10))
 
+        # 单次generate_sql内共享问题向量，避免三个集合各自重复嵌入
+        self.query_context = QueryContext()
+        # 嵌入配置(模型、归一化)变化后重新训练时设为True，已存在的记录也重新嵌入并覆盖
+        self.reembed_existing = False
+
         if curr_client == "persistent":
             self.chroma_client = chromadb.PersistentClient(
                 path=path, settings=Settings(anonymized_telemetry=False)
@@ -67,6 +75,17 @@ class My_ChromaDB_VectorStore(VannaBase):
             return embedding[0]
         return embedding
 
+    def generate_sql(self, question: str, **kwargs) -> str:
+        """在查询上下文中生成SQL，三个集合的检索共享同一个问题向量"""
+        with self.query_context.scope(question):
+            return super().generate_sql(question, **kwargs)
+
+    def _get_question_embedding(self, question: str) -> List[float]:
+        """获取问题向量，同一个查询上下文中只计算一次"""
+        return self.query_context.get_or_compute(
+            question, "embedding", lambda: self.generate_embedding(question)
+        )
+
     def add_question_sql(self, question: str, sql: str, **kwargs) -> str:
         question_sql_json = json.dumps(
             {
@@ -102,6 +121,172 @@ class My_ChromaDB_VectorStore(VannaBase):
         )
         return id
 
+    def _build_batch_record(self, item: dict) -> dict:
+        """将BatchProcessor的批处理项转换为待写入记录（不含向量）"""
+        item_type = item.get("type")
+        if item_type == "question_sql":
+            document = json.dumps(
+                {
+                    "question": item["question"],
+                    "sql": item["sql"],
+                },
+                ensure_ascii=False,
+            )
+            return {"collection": "sql", "id": deterministic_uuid(document) + "-sql", "document": document}
+        elif item_type == "ddl":
+            document = item["content"]
+            return {"collection": "ddl", "id": deterministic_uuid(document) + "-ddl", "document": document}
+        elif item_type == "documentation":
+            document = item["content"]
+            return {"collection": "documentation", "id": deterministic_uuid(document) + "-doc", "document": document}
+        raise ValueError(f"不支持的批处理类型: {item_type}")
+
+    def _get_max_batch_size(self) -> int:
+        """获取Chroma单次add允许的最大条数"""
+        getter = getattr(self.chroma_client, "get_max_batch_size", None)
+        if callable(getter):
+            return getter()
+        return getattr(self.chroma_client, "max_batch_size", 5000)
+
+    def _get_existing_ids(self, collection_name: str, ids: list) -> set:
+        """查询已存在于集合中的记录ID，只取ID不读取文档和向量"""
+        if not ids:
+            return set()
+        collection = getattr(self, f"{collection_name}_collection")
+        return set(collection.get(ids=list(ids), include=[])["ids"])
+
+    def get_existing_ids(self, ids: list) -> set:
+        """按ID后缀分组，返回给定ID中仍存在于各集合的ID集合，训练清单用来核对记录"""
+        grouped = {}
+        for _id in ids:
+            _id = str(_id)
+            for suffix, collection_name in (("-sql", "sql"), ("-ddl", "ddl"), ("-doc", "documentation")):
+                if _id.endswith(suffix):
+                    grouped.setdefault(collection_name, []).append(_id)
+                    break
+
+        existing = set()
+        for collection_name, collection_ids in grouped.items():
+            existing.update(self._get_existing_ids(collection_name, collection_ids))
+        return existing
+
+    def prepare_batch(self, batch_data: list) -> list:
+        """为一批训练数据生成记录，并通过一次embedding_function调用批量计算向量
+
+        ID由内容生成，ID已存在说明内容未变化，记录标记为exists，不再重新嵌入和写入；
+        reembed_existing为True时不做该检查。
+
+        Args:
+            batch_data: BatchProcessor生成的批处理数据列表
+
+        Returns:
+            与batch_data顺序一致的记录列表，无法解析的项目带有error字段
+        """
+        records = []
+        for item in batch_data:
+            try:
+                records.append(self._build_batch_record(item))
+            except Exception as e:
+                records.append({"error": f"批处理项格式错误: {e}"})
+
+        grouped_ids = {}
+        for record in records:
+            if "error" not in record:
+                grouped_ids.setdefault(record["collection"], set()).add(record["id"])
+        existing = set() if self.reembed_existing else {
+            (collection_name, _id)
+            for collection_name, ids in grouped_ids.items()
+            for _id in self._get_existing_ids(collection_name, ids)
+        }
+        for record in records:
+            if "error" not in record and (record["collection"], record["id"]) in existing:
+                record["exists"] = True
+
+        valid = [record for record in records if "error" not in record and not record.get("exists")]
+        if valid:
+            embeddings = self.embedding_function([record["document"] for record in valid])
+            for record, embedding in zip(valid, embeddings):
+                record["embedding"] = embedding
+        return records
+
+    def write_prepared_batch(self, records: list) -> list:
+        """按集合分组写入prepare_batch生成的记录，每个集合按最大批大小分段调用collection.upsert
+
+        add会忽略已存在的ID，upsert在重新嵌入(reembed_existing)时覆盖原有向量，对新ID与add相同。
+
+        Args:
+            records: prepare_batch返回的记录列表
+
+        Returns:
+            与records顺序一致的结果列表，每项为 {"id": 记录ID, "error": 错误信息或None}
+        """
+        results = [{"id": record.get("id"), "error": record.get("error")} for record in records]
+
+        # 按集合分组，同一批次内重复的ID只写入一次
+        grouped = {}
+        for idx, record in enumerate(records):
+            if "error" in record or record.get("exists"):
+                continue
+            grouped.setdefault(record["collection"], {}).setdefault(record["id"], (idx, record))
+
+        max_batch_size = self._get_max_batch_size()
+        for collection_name, entries in grouped.items():
+            collection = getattr(self, f"{collection_name}_collection")
+            entries = list(entries.values())
+            for start in range(0, len(entries), max_batch_size):
+                chunk = entries[start:start + max_batch_size]
+                try:
+                    collection.upsert(
+                        documents=[record["document"] for _, record in chunk],
+                        embeddings=[record["embedding"] for _, record in chunk],
+                        ids=[record["id"] for _, record in chunk],
+                    )
+                except Exception as e:
+                    print(f"批量写入集合 {collection_name} 失败: {e}")
+                    for idx, _ in chunk:
+                        results[idx]["error"] = str(e)
+
+        # 重复项与首次出现的项目共享写入结果
+        for idx, record in enumerate(records):
+            if "error" not in record and not record.get("exists") and results[idx]["error"] is None:
+                first_idx, _ = grouped[record["collection"]][record["id"]]
+                results[idx]["error"] = results[first_idx]["error"]
+        return results
+
+    def add_batch(self, batch_data: list) -> list:
+        """批量添加训练数据：一次嵌入调用，每个集合一次（或按最大批大小分段）collection.add
+
+        Args:
+            batch_data: 批处理数据列表，每项为
+                {'type': 'ddl', 'content': ...}、
+                {'type': 'documentation', 'content': ...} 或
+                {'type': 'question_sql', 'question': ..., 'sql': ...}
+
+        Returns:
+            与batch_data顺序一致的结果列表，每项为 {"id": 记录ID, "error": 错误信息或None}
+        """
+        records = self.prepare_batch(batch_data)
+        results = self.write_prepared_batch(records)
+        failed = sum(1 for result in results if result["error"])
+        print(f"批量添加训练数据完成: 成功 {len(results) - failed} 条，失败 {failed} 条")
+        return results
+
+    def get_collection_embeddings(self, collection_name: str) -> tuple:
+        """读取集合中所有记录的ID和向量，用于训练时检测近似重复
+
+        Args:
+            collection_name: 集合名称
+
+        Returns:
+            (ID列表, 向量列表)
+        """
+        collection = getattr(self, f"{collection_name}_collection")
+        data = collection.get(include=["embeddings"])
+        embeddings = data.get("embeddings")
+        if embeddings is None:
+            embeddings = []
+        return list(data["ids"]), list(embeddings)
+
     def get_training_data(self, **kwargs) -> pd.DataFrame:
         sql_data = self.sql_collection.get()
 
@@ -190,6 +375,41 @@ class My_ChromaDB_VectorStore(VannaBase):
         else:
             return False
 
+    def remove_training_data_many(self, ids: list) -> int:
+        """按ID后缀分组，每个集合调用一次delete批量删除训练数据
+
+        Args:
+            ids: 记录ID列表
+
+        Returns:
+            请求删除的有效ID数量（Chroma的delete不返回实际删除行数）
+        """
+        grouped = {}
+        for _id in ids:
+            _id = str(_id)
+            for suffix, collection_name in (("-sql", "sql"), ("-ddl", "ddl"), ("-doc", "documentation")):
+                if _id.endswith(suffix):
+                    grouped.setdefault(collection_name, []).append(_id)
+                    break
+
+        for collection_name, collection_ids in grouped.items():
+            getattr(self, f"{collection_name}_collection").delete(ids=collection_ids)
+        return sum(len(collection_ids) for collection_ids in grouped.values())
+
+    def get_training_data_version(self) -> str:
+        """训练数据版本：三个集合排序后的记录ID的哈希，用于判断语义缓存是否失效
+
+        记录ID由内容哈希生成，删除旧记录再写入新记录的修改即使记录数不变也会改变版本。
+        Chroma不提供修改计数，需要读取所有ID(不读取文档和向量)，代价与记录数成正比。
+        """
+        digest = hashlib.sha256()
+        for name in ("sql", "ddl", "documentation"):
+            ids = getattr(self, f"{name}_collection").get(include=[])["ids"]
+            digest.update(f"{name}:{len(ids)}\n".encode("utf-8"))
+            for _id in sorted(ids):
+                digest.update(f"{_id}\n".encode("utf-8"))
+        return digest.hexdigest()
+
     def remove_collection(self, collection_name: str) -> bool:
         """
         This function can reset the collection to empty state.
@@ -250,7 +470,7 @@ class My_ChromaDB_VectorStore(VannaBase):
     def get_similar_question_sql(self, question: str, **kwargs) -> list:
         """查询相似问题并返回文档列表，同时打印相似度信息"""
         query_results = self.sql_collection.query(
-            query_texts=[question],
+            query_embeddings=[self._get_question_embedding(question)],
             n_results=self.n_results_sql,
         )
         # 打印详细的查询结果信息
@@ -265,7 +485,7 @@ class My_ChromaDB_VectorStore(VannaBase):
     def get_related_ddl(self, question: str, **kwargs) -> list:
         """查询相关DDL并返回文档列表，同时打印相似度信息"""
         query_results = self.ddl_collection.query(
-            query_texts=[question],
+            query_embeddings=[self._get_question_embedding(question)],
             n_results=self.n_results_ddl,
         )
         # 打印详细的查询结果信息
@@ -280,7 +500,7 @@ class My_ChromaDB_VectorStore(VannaBase):
     def get_related_documentation(self, question: str, **kwargs) -> list:
         """查询相关文档并返回文档列表，同时打印相似度信息"""
         query_results = self.documentation_collection.query(
-            query_texts=[question],
+            query_embeddings=[self._get_question_embedding(question)],
             n_results=self.n_results_documentation,
         )
         # 打印详细的查询结果信息
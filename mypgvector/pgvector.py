@@ -1,17 +1,21 @@
 import ast
 import json
 import logging
+import math
+import os
 import uuid
-import hashlib
+import weakref
 
 import pandas as pd
-from langchain_core.documents import Document
 from langchain_postgres.vectorstores import PGVector
 from sqlalchemy import create_engine, text
 
 from vanna.exceptions import ValidationError
 from vanna.base import VannaBase
 from vanna.types import TrainingPlan, TrainingPlanItem
+from vanna.utils import deterministic_uuid
+
+from query_context import QueryContext
 
 
 class PG_VectorStore(VannaBase):
@@ -29,6 +33,33 @@ class PG_VectorStore(VannaBase):
             self.n_results_sql = config.get("n_results_sql", 10)
             self.n_results_documentation = config.get("n_results_documentation", 10)
             self.n_results_ddl = config.get("n_results_ddl", 10)
+            # 批量写入时单条INSERT语句包含的最大行数
+            self.batch_insert_size = config.get("batch_insert_size", 500)
+            # 查询时的近似最近邻参数，按索引类型在每次检索的事务内设置
+            self.vector_index_type = (config.get("vector_index_type") or "hnsw").lower()
+            self.hnsw_ef_search = config.get("hnsw_ef_search")
+            self.ivfflat_probes = config.get("ivfflat_probes")
+            # 向量存储类型: "vector"(float32) 或 "halfvec"(float16，存储和索引减半)
+            self.vector_storage_type = (config.get("vector_storage_type") or "vector").lower()
+            if self.vector_storage_type not in ("vector", "halfvec"):
+                raise ValueError(f"不支持的向量存储类型: {self.vector_storage_type}")
+            # 二值量化检索：先按汉明距离在二值索引上取候选，再按完整精度的余弦距离重排
+            self.binary_rerank = bool(config.get("binary_rerank", False))
+            self.rerank_factor = config.get("rerank_factor", 4)
+            self.vector_dimension = config.get("vector_dimension")
+            # 距离度量: "cosine"(<=>) 或 "inner_product"(<#>，写入和查询时向量L2归一化，排序与余弦一致)
+            self.distance_metric = (config.get("distance_metric") or "cosine").lower()
+            if self.distance_metric not in ("cosine", "inner_product"):
+                raise ValueError(f"不支持的距离度量: {self.distance_metric}")
+            self.distance_operator = "<#>" if self.distance_metric == "inner_product" else "<=>"
+            if self.binary_rerank and not self.vector_dimension:
+                raise ValueError("启用二值量化重排时必须配置vector_dimension")
+            # 连接池配置，三个集合和所有维护方法共用同一个引擎
+            self.pool_size = config.get("pool_size", 5)
+            self.max_overflow = config.get("max_overflow", 10)
+            self.pool_pre_ping = bool(config.get("pool_pre_ping", True))
+            self.pool_recycle = config.get("pool_recycle", 1800)
+            self.pool_timeout = config.get("pool_timeout", 30)
             print(f"向量搜索默认结果数: SQL={self.n_results_sql}, DDL={self.n_results_ddl}, Documentation={self.n_results_documentation}")
 
         if config and "embedding_function" in config:
@@ -39,59 +70,134 @@ class PG_VectorStore(VannaBase):
             self.embedding_function = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
             print(f"使用默认embedding函数: HuggingFaceEmbeddings (all-MiniLM-L6-v2)")
 
+        # 单次generate_sql内共享问题向量，避免三个集合各自重复嵌入
+        self.query_context = QueryContext()
+        # 嵌入配置(模型、归一化)变化后重新训练时设为True，已存在的记录也重新嵌入并覆盖
+        self.reembed_existing = False
+        # 数据库是否提供pg_input_is_valid(PostgreSQL 16+)，首次查询训练数据时检测
+        self._pg_input_is_valid = None
+
         try:
-            # 初始化数据库引擎
-            self.engine = create_engine(self.connection_string)
+            # 初始化数据库引擎(带连接池)
+            self.engine = self._create_pooled_engine()
             
-            # 初始化集合
+            # 初始化集合，共用同一个引擎和连接池
             self.sql_collection = PGVector(
                 embeddings=self.embedding_function,
                 collection_name="sql",
-                connection=self.connection_string,
+                connection=self.engine,
             )
             self.ddl_collection = PGVector(
                 embeddings=self.embedding_function,
                 collection_name="ddl",
-                connection=self.connection_string,
+                connection=self.engine,
             )
             self.documentation_collection = PGVector(
                 embeddings=self.embedding_function,
                 collection_name="documentation",
-                connection=self.connection_string,
+                connection=self.engine,
             )
+            self._ensure_version_table()
             print("PgVector集合初始化成功")
         except Exception as e:
             print(f"PgVector集合初始化失败: {e}")
             raise
 
-    def _generate_int_id(self, content, prefix=0):
-        """生成整数ID
-        
+    def _create_pooled_engine(self):
+        """创建带连接池的数据库引擎
+
+        pool_pre_ping在取出连接时检测连接是否可用，pool_recycle定期重建连接，
+        避免数据库或中间的代理关闭空闲连接后取到失效的连接。
+
+        多进程服务器(如gunicorn的preload模式)在fork之前创建的引擎会被子进程继承，
+        父子进程共用同一个套接字会导致协议错乱。这里注册fork回调，子进程中丢弃继承的
+        连接(不关闭，以免影响父进程)，之后按需建立自己的连接。
+        """
+        engine = create_engine(
+            self.connection_string,
+            pool_size=self.pool_size,
+            max_overflow=self.max_overflow,
+            pool_pre_ping=self.pool_pre_ping,
+            pool_recycle=self.pool_recycle,
+            pool_timeout=self.pool_timeout,
+        )
+
+        # 回调只持有弱引用，不阻止引擎被回收
+        engine_ref = weakref.ref(engine)
+
+        def _dispose_in_child():
+            child_engine = engine_ref()
+            if child_engine is not None:
+                child_engine.dispose(close=False)
+
+        # Windows没有fork，也就没有register_at_fork
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=_dispose_in_child)
+
+        print(f"数据库连接池: pool_size={self.pool_size}, max_overflow={self.max_overflow}, "
+              f"pre_ping={self.pool_pre_ping}, recycle={self.pool_recycle}秒")
+        return engine
+
+    # 训练数据版本表：只有一行，写入或删除训练数据时在同一事务内加一
+    VERSION_TABLE = "vanna_training_version"
+
+    def _ensure_version_table(self):
+        """创建训练数据版本表（已存在时不做任何修改）"""
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {self.VERSION_TABLE} (id INTEGER PRIMARY KEY, version BIGINT NOT NULL)"
+            ))
+            connection.execute(text(
+                f"INSERT INTO {self.VERSION_TABLE} (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING"
+            ))
+
+    def _bump_training_version(self, connection):
+        """在写入训练数据的事务内递增版本，随数据一起提交或回滚"""
+        connection.execute(text(f"UPDATE {self.VERSION_TABLE} SET version = version + 1 WHERE id = 1"))
+
+    def get_pool_stats(self) -> dict:
+        """返回连接池的使用情况
+
+        Returns:
+            dict: 连接池大小、空闲连接数、已借出连接数、溢出连接数和状态描述
+        """
+        pool = self.engine.pool
+        return {
+            "pool_size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "max_overflow": self.max_overflow,
+            "status": pool.status(),
+        }
+
+    # 集合名称到ID后缀的映射
+    ID_SUFFIXES = {"sql": "sql", "ddl": "ddl", "documentation": "doc"}
+
+    @classmethod
+    def generate_content_id(cls, content: str, collection_name: str) -> str:
+        """根据内容生成记录ID
+
+        ID为内容的确定性UUID加集合后缀，例如 "3f2c...-sql"。相同内容总是得到相同的ID，
+        不同内容之间不会发生碰撞，重复写入同一内容是幂等的。
+
         Args:
-            content: 用于生成ID的内容
-            prefix: ID前缀，用于区分不同类型的ID
-                   0: 文档
-                   1: DDL
-                   2: SQL
-            
+            content: 记录的文档内容
+            collection_name: 集合名称 ('sql'、'ddl'或'documentation')
+
         Returns:
-            整数ID
+            记录ID
         """
-        # 使用内容的哈希值生成一个大整数，但要确保在PostgreSQL INTEGER范围内
-        # PostgreSQL INTEGER范围: -2,147,483,648 到 +2,147,483,647
-        # 我们使用较小的范围来确保安全: 0 到 999,999
-        content_hash = int(hashlib.md5(content.encode()).hexdigest(), 16) % 1000000
-        
-        # 添加较小的前缀以区分不同类型 (1-3位数字)
-        # 0-99: 文档
-        # 100-199: DDL
-        # 200-299: SQL
-        prefix_map = {0: 0, 1: 100000, 2: 200000}
-        prefix_value = prefix_map.get(prefix, 0)
-        
-        return prefix_value + content_hash
+        return f"{deterministic_uuid(content)}-{cls.ID_SUFFIXES[collection_name]}"
 
-    def add_question_sql(self, question: str, sql: str, **kwargs) -> int:
+    def _add_single(self, item: dict) -> str:
+        """通过批量写入路径添加单条训练数据，返回记录ID"""
+        result = self.add_batch([item])[0]
+        if result["error"]:
+            raise Exception(result["error"])
+        return result["id"]
+
+    def add_question_sql(self, question: str, sql: str, **kwargs) -> str:
         """添加问题-SQL对到向量数据库
         
         Args:
@@ -99,79 +205,285 @@ class PG_VectorStore(VannaBase):
             sql: SQL语句
             
         Returns:
-            添加的记录ID (整数)
+            添加的记录ID
         """
-        question_sql_json = json.dumps(
-            {
+        try:
+            _id = self._add_single({
+                "type": "question_sql",
                 "question": question,
                 "sql": sql,
-            },
-            ensure_ascii=False,
-        )
-        # 生成整数ID
-        id = self._generate_int_id(question_sql_json, prefix=2)
-        createdat = kwargs.get("createdat")
-        doc = Document(
-            page_content=question_sql_json,
-            metadata={"id": id, "createdat": createdat},
-        )
-        
-        try:
-            self.sql_collection.add_documents([doc], ids=[str(id)])
-            print(f"添加问题-SQL对成功，ID: {id}")
-            return id
+                "createdat": kwargs.get("createdat"),
+            })
+            print(f"添加问题-SQL对成功，ID: {_id}")
+            return _id
         except Exception as e:
             print(f"添加问题-SQL对失败: {e}")
             raise
 
-    def add_ddl(self, ddl: str, **kwargs) -> int:
+    def add_ddl(self, ddl: str, **kwargs) -> str:
         """添加DDL语句到向量数据库
         
         Args:
             ddl: DDL语句
             
         Returns:
-            添加的记录ID (整数)
+            添加的记录ID
         """
-        # 生成整数ID
-        _id = self._generate_int_id(ddl, prefix=1)
-        doc = Document(
-            page_content=ddl,
-            metadata={"id": _id},
-        )
-        
         try:
-            self.ddl_collection.add_documents([doc], ids=[str(_id)])
+            _id = self._add_single({"type": "ddl", "content": ddl})
             print(f"添加DDL成功，ID: {_id}")
             return _id
         except Exception as e:
             print(f"添加DDL失败: {e}")
             raise
 
-    def add_documentation(self, documentation: str, **kwargs) -> int:
+    def add_documentation(self, documentation: str, **kwargs) -> str:
         """添加文档到向量数据库
         
         Args:
             documentation: 文档内容
             
         Returns:
-            添加的记录ID (整数)
+            添加的记录ID
         """
-        # 生成整数ID
-        _id = self._generate_int_id(documentation, prefix=0)
-        doc = Document(
-            page_content=documentation,
-            metadata={"id": _id},
-        )
-        
         try:
-            self.documentation_collection.add_documents([doc], ids=[str(_id)])
+            _id = self._add_single({"type": "documentation", "content": documentation})
             print(f"添加文档成功，ID: {_id}")
             return _id
         except Exception as e:
             print(f"添加文档失败: {e}")
             raise
 
+    def _build_batch_record(self, item: dict) -> dict:
+        """将BatchProcessor的批处理项转换为待写入记录（不含向量）
+
+        Args:
+            item: 批处理项，type为'ddl'、'documentation'或'question_sql'
+
+        Returns:
+            包含collection、id、document和metadata的记录
+        """
+        item_type = item.get("type")
+        if item_type == "question_sql":
+            document = json.dumps(
+                {
+                    "question": item["question"],
+                    "sql": item["sql"],
+                },
+                ensure_ascii=False,
+            )
+            collection_name = "sql"
+            _id = self.generate_content_id(document, collection_name)
+            metadata = {"id": _id, "createdat": item.get("createdat")}
+        elif item_type == "ddl":
+            document = item["content"]
+            collection_name = "ddl"
+            _id = self.generate_content_id(document, collection_name)
+            metadata = {"id": _id}
+        elif item_type == "documentation":
+            document = item["content"]
+            collection_name = "documentation"
+            _id = self.generate_content_id(document, collection_name)
+            metadata = {"id": _id}
+        else:
+            raise ValueError(f"不支持的批处理类型: {item_type}")
+
+        return {
+            "collection": collection_name,
+            "id": _id,
+            "document": document,
+            "metadata": metadata,
+        }
+
+    def _get_collection_uuids(self) -> dict:
+        """查询集合名称到collection uuid的映射
+
+        不做缓存，每批写入前重新查询(集合表只有几行)，重置工具重建集合后
+        不会继续使用已不存在的uuid。集合不存在时(重置后尚未重新创建)通过PGVector创建。
+        """
+        query = text(
+            """
+            SELECT name, uuid FROM langchain_pg_collection
+            WHERE name IN ('sql', 'ddl', 'documentation')
+            """
+        )
+        with self.engine.connect() as connection:
+            uuids = {row.name: row.uuid for row in connection.execute(query)}
+        missing = [name for name in self.ID_SUFFIXES if name not in uuids]
+        if missing:
+            for name in missing:
+                print(f"[WARNING] 集合 {name} 不存在(向量表可能已被重置)，重新创建")
+                getattr(self, f"{name}_collection").create_collection()
+            with self.engine.connect() as connection:
+                uuids = {row.name: row.uuid for row in connection.execute(query)}
+        return uuids
+
+    def _get_existing_ids(self, ids: list) -> set:
+        """查询已存在于langchain_pg_embedding中的记录ID"""
+        if not ids:
+            return set()
+        query = text("SELECT id FROM langchain_pg_embedding WHERE id = ANY(:ids)")
+        with self.engine.connect() as connection:
+            return {row.id for row in connection.execute(query, {"ids": list(ids)})}
+
+    def get_existing_ids(self, ids: list) -> set:
+        """返回给定ID中仍存在于向量数据库的ID集合，训练清单用来核对记录"""
+        return self._get_existing_ids([str(_id) for _id in ids])
+
+    def prepare_batch(self, batch_data: list) -> list:
+        """为一批训练数据生成记录并批量计算向量
+
+        所有文档通过一次embed_documents调用嵌入。无法解析的项目在记录中带有error字段，
+        不参与嵌入和写入。ID由内容生成，ID已存在说明内容未变化，记录标记为exists，
+        不再重新嵌入和写入；reembed_existing为True时不做该检查。
+
+        Args:
+            batch_data: BatchProcessor生成的批处理数据列表
+
+        Returns:
+            与batch_data顺序一致的记录列表
+        """
+        records = []
+        for item in batch_data:
+            try:
+                records.append(self._build_batch_record(item))
+            except Exception as e:
+                records.append({"error": f"批处理项格式错误: {e}"})
+
+        existing = set() if self.reembed_existing else self._get_existing_ids(
+            {str(record["id"]) for record in records if "error" not in record}
+        )
+        for record in records:
+            if "error" not in record and str(record["id"]) in existing:
+                record["exists"] = True
+
+        valid = [record for record in records if "error" not in record and not record.get("exists")]
+        if valid:
+            embeddings = self.embedding_function.embed_documents([record["document"] for record in valid])
+            for record, embedding in zip(valid, embeddings):
+                record["embedding"] = self._prepare_vector(embedding)
+        return records
+
+    def write_prepared_batch(self, records: list) -> list:
+        """将prepare_batch生成的记录用多行INSERT写入langchain_pg_embedding
+
+        ID冲突时只有内容、元数据或向量确实变化才更新，已存在的记录(exists)直接跳过。
+
+        Args:
+            records: prepare_batch返回的记录列表
+
+        Returns:
+            与records顺序一致的结果列表，每项为 {"id": 记录ID, "error": 错误信息或None}
+        """
+        results = [{"id": record.get("id"), "error": record.get("error")} for record in records]
+        valid = [idx for idx, record in enumerate(records) if "error" not in record and not record.get("exists")]
+        if not valid:
+            return results
+
+        try:
+            collection_uuids = self._get_collection_uuids()
+
+            # 同一条INSERT ... ON CONFLICT语句中不能出现重复的主键，按ID去重（保留最后一条）
+            rows = {}
+            for idx in valid:
+                record = records[idx]
+                collection_id = collection_uuids.get(record["collection"])
+                if collection_id is None:
+                    results[idx]["error"] = f"集合 {record['collection']} 不存在"
+                    continue
+                rows[str(record["id"])] = {
+                    "id": str(record["id"]),
+                    "collection_id": collection_id,
+                    "document": record["document"],
+                    "embedding": self._vector_literal(record["embedding"]),
+                    "cmetadata": json.dumps(record["metadata"], ensure_ascii=False),
+                }
+
+            rows = list(rows.values())
+            with self.engine.begin() as connection:
+                changed = 0
+                for start in range(0, len(rows), self.batch_insert_size):
+                    chunk = rows[start:start + self.batch_insert_size]
+                    params = {}
+                    values = []
+                    for idx, row in enumerate(chunk):
+                        values.append(
+                            f"(:id_{idx}, :collection_id_{idx}, :document_{idx}, "
+                            f"CAST(:embedding_{idx} AS {self.vector_storage_type}), CAST(:cmetadata_{idx} AS jsonb))"
+                        )
+                        for key, value in row.items():
+                            params[f"{key}_{idx}"] = value
+
+                    statement = text(
+                        f"""
+                        INSERT INTO langchain_pg_embedding (id, collection_id, document, embedding, cmetadata)
+                        VALUES {", ".join(values)}
+                        ON CONFLICT (id) DO UPDATE SET
+                            collection_id = EXCLUDED.collection_id,
+                            document = EXCLUDED.document,
+                            embedding = EXCLUDED.embedding,
+                            cmetadata = EXCLUDED.cmetadata
+                        WHERE langchain_pg_embedding.document IS DISTINCT FROM EXCLUDED.document
+                           OR langchain_pg_embedding.collection_id IS DISTINCT FROM EXCLUDED.collection_id
+                           OR langchain_pg_embedding.cmetadata IS DISTINCT FROM EXCLUDED.cmetadata
+                           OR langchain_pg_embedding.embedding IS DISTINCT FROM EXCLUDED.embedding
+                        """
+                    )
+                    changed += connection.execute(statement, params).rowcount
+                # 内容未变化的重复写入不改变版本
+                if changed:
+                    self._bump_training_version(connection)
+        except Exception as e:
+            print(f"批量写入向量数据库失败: {e}")
+            for idx in valid:
+                if results[idx]["error"] is None:
+                    results[idx]["error"] = str(e)
+
+        return results
+
+    def add_batch(self, batch_data: list) -> list:
+        """批量添加训练数据：一次嵌入调用加多行INSERT写入
+
+        Args:
+            batch_data: 批处理数据列表，每项为
+                {'type': 'ddl', 'content': ...}、
+                {'type': 'documentation', 'content': ...} 或
+                {'type': 'question_sql', 'question': ..., 'sql': ...}
+
+        Returns:
+            与batch_data顺序一致的结果列表，每项为 {"id": 记录ID, "error": 错误信息或None}
+        """
+        records = self.prepare_batch(batch_data)
+        results = self.write_prepared_batch(records)
+        failed = sum(1 for result in results if result["error"])
+        print(f"批量添加训练数据完成: 成功 {len(results) - failed} 条，失败 {failed} 条")
+        return results
+
+    def get_collection_embeddings(self, collection_name: str) -> tuple:
+        """读取集合中所有记录的ID和向量，用于训练时检测近似重复
+
+        Args:
+            collection_name: 集合名称
+
+        Returns:
+            (ID列表, 向量列表)
+        """
+        query = text(
+            """
+            SELECT e.id, e.embedding::text AS embedding
+            FROM langchain_pg_embedding e
+            JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+            WHERE c.name = :name
+            """
+        )
+        ids, embeddings = [], []
+        with self.engine.connect() as connection:
+            for row in connection.execute(query, {"name": collection_name}):
+                ids.append(row.id)
+                # pgvector的文本格式 [0.1,0.2,...] 恰好是合法的JSON数组
+                embeddings.append(json.loads(row.embedding))
+        return ids, embeddings
+
     def get_collection(self, collection_name):
         """获取指定的集合
         
@@ -191,6 +503,176 @@ class PG_VectorStore(VannaBase):
             case _:
                 raise ValueError("指定的集合不存在.")
 
+    def generate_sql(self, question: str, **kwargs) -> str:
+        """在查询上下文中生成SQL，三个集合的检索共享同一个问题向量"""
+        with self.query_context.scope(question):
+            return super().generate_sql(question, **kwargs)
+
+    def _get_question_embedding(self, question: str) -> list:
+        """获取问题向量，同一个查询上下文中只计算一次"""
+        return self.query_context.get_or_compute(
+            question, "embedding", lambda: self._prepare_vector(self.embedding_function.embed_query(question))
+        )
+
+    def _prepare_vector(self, embedding) -> list:
+        """使用内积距离时将向量L2归一化（已归一化的向量不变），余弦距离时原样返回"""
+        if self.distance_metric != "inner_product":
+            return embedding
+        norm = math.sqrt(sum(value * value for value in embedding))
+        if norm == 0:
+            return embedding
+        return [value / norm for value in embedding]
+
+    @staticmethod
+    def _vector_literal(embedding) -> str:
+        """将向量转换为pgvector的文本格式，例如 [0.1,0.2,0.3]"""
+        return "[" + ",".join(str(float(value)) for value in embedding) + "]"
+
+    def _get_search_settings(self, min_candidates: int = 0) -> list:
+        """返回检索前需要执行的SET LOCAL语句
+
+        ivfflat未配置probes时，读取索引的lists参数，取其平方根作为probes，结果在实例内缓存。
+
+        Args:
+            min_candidates: 索引至少需要返回的候选数，HNSW的ef_search不能小于该值
+        """
+        if self.vector_index_type == "hnsw":
+            ef_search = max(int(self.hnsw_ef_search or 0), min_candidates)
+            if ef_search:
+                return [f"SET LOCAL hnsw.ef_search = {ef_search}"]
+            return []
+
+        if self.vector_index_type == "ivfflat":
+            if not self.ivfflat_probes:
+                self.ivfflat_probes = self._derive_ivfflat_probes()
+            if self.ivfflat_probes:
+                return [f"SET LOCAL ivfflat.probes = {int(self.ivfflat_probes)}"]
+        return []
+
+    def _derive_ivfflat_probes(self):
+        """根据ivfflat索引的lists计算probes，索引不存在时返回None"""
+        query = text(
+            """
+            SELECT option_value
+            FROM pg_catalog.pg_index i
+            JOIN pg_catalog.pg_class c ON c.oid = i.indexrelid
+            JOIN pg_catalog.pg_am am ON am.oid = c.relam
+            CROSS JOIN LATERAL pg_catalog.pg_options_to_table(c.reloptions)
+            WHERE i.indrelid = 'langchain_pg_embedding'::regclass
+              AND am.amname = 'ivfflat'
+              AND option_name = 'lists'
+            LIMIT 1
+            """
+        )
+        try:
+            with self.engine.connect() as connection:
+                lists = connection.execute(query).scalar()
+        except Exception as e:
+            print(f"读取ivfflat索引参数失败: {e}")
+            return None
+        if not lists:
+            return None
+        probes = max(1, round(int(lists) ** 0.5))
+        print(f"ivfflat索引lists={lists}，查询probes={probes}")
+        return probes
+
+    def search_collections(self, embedding, limits: dict) -> dict:
+        """用一条SQL语句同时检索多个集合
+
+        每个集合是一个按距离(余弦<=>或内积<#>)排序并LIMIT的子查询，子查询之间UNION ALL，
+        一次数据库往返即可拿到所有集合的结果。启用binary_rerank时，每个集合先按
+        二值量化向量的汉明距离取k*rerank_factor个候选，再按完整精度的距离取前k个。
+
+        Args:
+            embedding: 查询向量
+            limits: 集合名称到返回条数的映射，例如 {"sql": 6, "ddl": 6}
+
+        Returns:
+            集合名称到文档内容列表的映射，列表按相似度从高到低排列
+        """
+        params = {"embedding": self._vector_literal(embedding)}
+        query_vector = f"CAST(:embedding AS {self.vector_storage_type})"
+        subqueries = []
+        max_candidates = 0
+        for idx, (collection_name, k) in enumerate(limits.items()):
+            params[f"name_{idx}"] = collection_name
+            params[f"k_{idx}"] = k
+            if self.binary_rerank:
+                # 表达式必须与tools/reset_langchain_pgvector.py创建的二值索引完全一致才能使用索引
+                bits = f"bit({int(self.vector_dimension)})"
+                params[f"candidates_{idx}"] = k * self.rerank_factor
+                max_candidates = max(max_candidates, k * self.rerank_factor)
+                subqueries.append(f"""
+            (SELECT collection_name, document, distance FROM (
+                SELECT c.name AS collection_name, e.document,
+                       e.embedding {self.distance_operator} {query_vector} AS distance
+                FROM langchain_pg_embedding e
+                JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+                WHERE c.name = :name_{idx}
+                ORDER BY binary_quantize(e.embedding)::{bits} <~> binary_quantize({query_vector})::{bits}
+                LIMIT :candidates_{idx}
+             ) candidates_{idx}
+             ORDER BY distance
+             LIMIT :k_{idx})
+            """)
+            else:
+                subqueries.append(f"""
+            (SELECT c.name AS collection_name, e.document,
+                    e.embedding {self.distance_operator} {query_vector} AS distance
+             FROM langchain_pg_embedding e
+             JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+             WHERE c.name = :name_{idx}
+             ORDER BY distance
+             LIMIT :k_{idx})
+            """)
+
+        query = text(" UNION ALL ".join(subqueries) + " ORDER BY distance")
+
+        results = {collection_name: [] for collection_name in limits}
+        # SET LOCAL只在当前事务内生效，不影响连接池中的其他连接
+        with self.engine.begin() as connection:
+            for setting in self._get_search_settings(max_candidates):
+                connection.execute(text(setting))
+            for row in connection.execute(query, params):
+                results[row.collection_name].append(row.document)
+        return results
+
+    def get_related_training_data(self, question: str) -> dict:
+        """一次数据库往返获取问题相关的SQL对、DDL和文档
+
+        Args:
+            question: 问题文本
+
+        Returns:
+            {"sql": [问题-SQL对], "ddl": [DDL], "documentation": [文档]}
+        """
+        embedding = self._get_question_embedding(question)
+        related = self.search_collections(embedding, {
+            "sql": self.n_results_sql,
+            "ddl": self.n_results_ddl,
+            "documentation": self.n_results_documentation,
+        })
+        related["sql"] = self._parse_sql_documents(related["sql"])
+        return related
+
+    def _get_related(self, question: str, collection_name: str, k: int) -> list:
+        """获取单个集合的检索结果
+
+        在generate_sql的查询上下文中，第一次调用会一次检索全部三个集合并缓存结果，
+        之后的调用直接复用；上下文之外只检索指定的集合。
+        """
+        if self.query_context.is_active(question):
+            related = self.query_context.get_or_compute(
+                question, "related", lambda: self.get_related_training_data(question)
+            )
+            return related[collection_name]
+
+        embedding = self._get_question_embedding(question)
+        documents = self.search_collections(embedding, {collection_name: k})[collection_name]
+        if collection_name == "sql":
+            return self._parse_sql_documents(documents)
+        return documents
+
     def get_similar_question_sql(self, question: str, **kwargs) -> list:
         """查询相似问题并返回文档列表，同时打印相似度信息
         
@@ -201,10 +683,10 @@ class PG_VectorStore(VannaBase):
             相似问题的SQL对列表
         """
         try:
-            documents = self.sql_collection.similarity_search(query=question, k=self.n_results_sql)
+            documents = self._get_related(question, "sql", self.n_results_sql)
             print(f"查询问题: {question}")
             print(f"找到 {len(documents)} 个相似问题")
-            return [ast.literal_eval(document.page_content) for document in documents]
+            return documents
         except Exception as e:
             print(f"查询相似问题失败: {e}")
             return []
@@ -219,10 +701,10 @@ class PG_VectorStore(VannaBase):
             相关DDL列表
         """
         try:
-            documents = self.ddl_collection.similarity_search(query=question, k=self.n_results_ddl)
+            documents = self._get_related(question, "ddl", self.n_results_ddl)
             print(f"DDL查询: {question}")
             print(f"找到 {len(documents)} 个相关DDL")
-            return [document.page_content for document in documents]
+            return documents
         except Exception as e:
             print(f"查询相关DDL失败: {e}")
             return []
@@ -237,10 +719,10 @@ class PG_VectorStore(VannaBase):
             相关文档列表
         """
         try:
-            documents = self.documentation_collection.similarity_search(query=question, k=self.n_results_documentation)
+            documents = self._get_related(question, "documentation", self.n_results_documentation)
             print(f"文档查询: {question}")
             print(f"找到 {len(documents)} 个相关文档")
-            return [document.page_content for document in documents]
+            return documents
         except Exception as e:
             print(f"查询相关文档失败: {e}")
             return []
@@ -290,91 +772,222 @@ class PG_VectorStore(VannaBase):
                 elif item.item_type == TrainingPlanItem.ITEM_TYPE_SQL and item.item_name:
                     self.add_question_sql(question=item.item_name, sql=item.item_value)
 
-    def get_training_data(self, **kwargs) -> pd.DataFrame:
-        """获取训练数据
-        
-        从langchain_pg_embedding和langchain_pg_collection表联合查询，
-        根据collection表确定训练数据类型，不再从ID格式推断
-        
+    # get_training_data返回的列
+    TRAINING_DATA_COLUMNS = ["id", "question", "content", "training_data_type"]
+
+    def _training_data_filters(self, training_data_type: str = None, search: str = None) -> tuple:
+        """构造训练数据查询的过滤条件
+
+        Args:
+            training_data_type: 只返回指定类型 ('sql'、'ddl'或'documentation')
+            search: 文档内容包含的文本，不区分大小写
+
         Returns:
-            包含所有训练数据的DataFrame
+            (WHERE子句, 参数字典)
         """
-        # 建立数据库连接
+        conditions = []
+        params = {}
+        if training_data_type:
+            training_data_type = training_data_type.lower()
+            if training_data_type not in self.ID_SUFFIXES:
+                raise ValueError(f"不支持的训练数据类型: {training_data_type}")
+            conditions.append("c.name = :training_data_type")
+            params["training_data_type"] = training_data_type
+        if search:
+            # 转义LIKE通配符，按字面文本匹配
+            escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            conditions.append("e.document ILIKE :search ESCAPE '\\'")
+            params["search"] = f"%{escaped}%"
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return where, params
+
+    @staticmethod
+    def _parse_legacy_sql_document(document):
+        """解析SQL查询中未能按JSON解析的问题-SQL文档
+
+        包括旧版本以Python字典字符串保存的文档，以及数据库不支持在转换前检查JSON时
+        未在SQL中解析的文档。
+
+        Returns:
+            (问题, SQL)，无法解析时问题为None、SQL为原始文档
+        """
+        doc_dict = PG_VectorStore._parse_sql_document(document)
+        if doc_dict is None:
+            return None, document
+        return doc_dict.get("question"), doc_dict.get("sql", document)
+
+    @staticmethod
+    def _parse_sql_document(document):
+        """解析问题-SQL文档：先按JSON解析，失败时按旧版本的Python字典字符串解析
+
+        Returns:
+            dict，无法解析或不是字典时返回None
+        """
+        try:
+            doc_dict = json.loads(document)
+            if isinstance(doc_dict, dict):
+                return doc_dict
+        except (TypeError, ValueError):
+            pass
         try:
-            engine = create_engine(self.connection_string)
+            doc_dict = ast.literal_eval(document)
+        except Exception:
+            # literal_eval对损坏的输入可能抛出ValueError、SyntaxError、TypeError或RecursionError
+            return None
+        return doc_dict if isinstance(doc_dict, dict) else None
 
-            # 联合查询，通过collection表确定类型
-            query = """
-            SELECT e.cmetadata, e.document, c.name as training_data_type
-            FROM langchain_pg_embedding e
-            JOIN langchain_pg_collection c ON e.collection_id = c.uuid
-            """
-            df_result = pd.read_sql(query, engine)
-            
-            # 用于累积处理后的行的列表
-            processed_rows = []
-
-            # 处理DataFrame中的每一行
-            for _, row in df_result.iterrows():
-                custom_id = row["cmetadata"]["id"]
-                document = row["document"]
-                training_data_type = row["training_data_type"].lower()  # 转为小写以统一处理
-                
-                # 根据类型处理数据
-                if training_data_type == "sql":
-                    # 将文档字符串转换为字典
-                    try:
-                        doc_dict = ast.literal_eval(document)
-                        question = doc_dict.get("question")
-                        content = doc_dict.get("sql")
-                    except (ValueError, SyntaxError):
-                        print(f"警告: SQL解析错误，ID={custom_id}，将尝试更宽松的解析")
-                        # 尝试更宽松的解析
-                        if isinstance(document, str) and "question" in document and "sql" in document:
-                            try:
-                                # 尝试使用JSON解析
-                                doc_dict = json.loads(document)
-                                question = doc_dict.get("question")
-                                content = doc_dict.get("sql")
-                            except:
-                                # 如果解析失败，使用原始文档
-                                question = None
-                                content = document
-                        else:
-                            question = None
-                            content = document
-                elif training_data_type in ["documentation", "ddl"]:
-                    question = None  # 问题的默认值
-                    content = document
+    @classmethod
+    def _parse_sql_documents(cls, documents: list) -> list:
+        """逐条解析检索到的问题-SQL文档，跳过无法解析的文档，不影响其他文档和集合"""
+        parsed = []
+        for document in documents:
+            doc_dict = cls._parse_sql_document(document)
+            if doc_dict is None:
+                print(f"[WARNING] 跳过无法解析的问题-SQL文档: {str(document)[:100]}")
+                continue
+            parsed.append(doc_dict)
+        return parsed
+
+    def _supports_input_validation(self, connection) -> bool:
+        """检测数据库是否提供pg_input_is_valid (PostgreSQL 16+)，结果只检测一次"""
+        if self._pg_input_is_valid is None:
+            version = int(connection.execute(text("SHOW server_version_num")).scalar())
+            self._pg_input_is_valid = version >= 160000
+        return self._pg_input_is_valid
+
+    def get_training_data(self, training_data_type: str = None, search: str = None,
+                          limit: int = None, offset: int = 0, after_id: str = None,
+                          **kwargs) -> pd.DataFrame:
+        """获取训练数据，支持在数据库端过滤和分页
+
+        只查询ID、文档和集合名称，不读取向量列。PostgreSQL 16+上问题-SQL文档先用
+        pg_input_is_valid检查，合法的JSON在SQL中按JSON路径一次性解析，其余文档(旧格式、
+        以'{"'开头但不是合法JSON的文档，以及更早版本上的所有文档)在Python中逐条解析。
+        分页可以用offset/limit，也可以用after_id做键集分页(按主键顺序取after_id之后的记录)，
+        后者的代价与页码无关。
+
+        Args:
+            training_data_type: 只返回指定类型 ('sql'、'ddl'或'documentation')
+            search: 文档内容包含的文本，不区分大小写
+            limit: 每页条数，None表示返回全部
+            offset: 跳过的条数
+            after_id: 键集分页游标，即上一页DataFrame.attrs["next_after_id"]
+
+        Returns:
+            包含id、question、content和training_data_type列的DataFrame，
+            attrs["next_after_id"]为下一页的游标，没有下一页时为None
+
+        Raises:
+            分页查询(limit或after_id)失败时抛出数据库异常，由调用方返回错误；
+            全量获取失败时保持原有行为，返回空DataFrame
+        """
+        where, params = self._training_data_filters(training_data_type, search)
+        try:
+            if after_id:
+                where += (" AND " if where else "WHERE ") + "e.id > :after_id"
+                params["after_id"] = str(after_id)
+            page = ""
+            if limit is not None:
+                page = "LIMIT :limit OFFSET :offset"
+                params["limit"] = int(limit)
+                params["offset"] = int(offset or 0)
+
+            with self.engine.connect() as connection:
+                # 只转换确认为合法JSON的文档，单条损坏的文档不会导致整页查询失败
+                # CASE保证先检查再转换；旧版本数据库上不在SQL中转换，全部在Python中解析
+                if self._supports_input_validation(connection):
+                    doc = ("CASE WHEN c.name = 'sql' AND e.document LIKE '{\"%' "
+                           "AND pg_input_is_valid(e.document, 'jsonb') THEN e.document::jsonb END")
                 else:
-                    # 未知类型，使用原始文档
-                    print(f"警告: 未知训练数据类型 '{training_data_type}'，ID={custom_id}")
-                    question = None
-                    content = document
-
-                # 将处理后的数据添加到列表中
-                processed_rows.append(
-                    {"id": custom_id, "question": question, "content": content, "training_data_type": training_data_type}
+                    doc = "NULL::jsonb"
+                query = text(
+                    f"""
+                    SELECT p.row_key, p.id,
+                           p.doc ->> 'question' AS question,
+                           COALESCE(p.doc ->> 'sql', p.document) AS content,
+                           p.training_data_type
+                    FROM (
+                        SELECT e.id AS row_key,
+                               COALESCE(e.cmetadata ->> 'id', e.id) AS id,
+                               e.document,
+                               {doc} AS doc,
+                               c.name AS training_data_type
+                        FROM langchain_pg_embedding e
+                        JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+                        {where}
+                        ORDER BY e.id
+                        {page}
+                    ) p
+                    ORDER BY p.row_key
+                    """
                 )
+                result = connection.execute(query, params)
+                df_result = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
 
-            # 从处理后的行列表创建DataFrame
-            df_processed = pd.DataFrame(processed_rows)
-            
-            # 输出详细统计信息
-            total = len(df_processed)
-            if not df_processed.empty:
+            if df_result.empty:
+                df_processed = pd.DataFrame(columns=self.TRAINING_DATA_COLUMNS)
+                df_processed.attrs["next_after_id"] = None
+                return df_processed
+
+            # 旧格式的问题-SQL文档
+            legacy = (df_result["training_data_type"] == "sql") & df_result["question"].isna()
+            if legacy.any():
+                parsed = df_result.loc[legacy, "content"].map(self._parse_legacy_sql_document)
+                df_result.loc[legacy, "question"] = parsed.str[0]
+                df_result.loc[legacy, "content"] = parsed.str[1]
+
+            next_after_id = None
+            if limit is not None and len(df_result) == int(limit):
+                next_after_id = df_result["row_key"].iloc[-1]
+
+            df_processed = df_result[self.TRAINING_DATA_COLUMNS].reset_index(drop=True)
+            df_processed.attrs["next_after_id"] = next_after_id
+
+            # 全量获取时输出统计信息
+            if limit is None:
                 by_type = df_processed["training_data_type"].value_counts().to_dict()
-                print(f"获取到 {total} 条训练数据:")
+                print(f"获取到 {len(df_processed)} 条训练数据:")
                 for type_name, count in by_type.items():
                     print(f" - {type_name}: {count}条")
-            else:
-                print(f"获取到 {total} 条训练数据")
-            
+
             return df_processed
         except Exception as e:
             print(f"获取训练数据失败: {e}")
+            if limit is not None or after_id:
+                raise
             # 返回空DataFrame
-            return pd.DataFrame(columns=["id", "question", "content", "training_data_type"])
+            return pd.DataFrame(columns=self.TRAINING_DATA_COLUMNS)
+
+    def count_training_data(self, training_data_type: str = None, search: str = None) -> dict:
+        """按类型统计训练数据条数，过滤条件与get_training_data相同
+
+        Returns:
+            dict: {"total": 总条数, "by_type": {类型: 条数}}
+        """
+        where, params = self._training_data_filters(training_data_type, search)
+        query = text(
+            f"""
+            SELECT c.name AS training_data_type, COUNT(*) AS count
+            FROM langchain_pg_embedding e
+            JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+            {where}
+            GROUP BY c.name
+            """
+        )
+        with self.engine.connect() as connection:
+            by_type = {row.training_data_type: row.count for row in connection.execute(query, params)}
+        return {"total": sum(by_type.values()), "by_type": by_type}
+
+    def get_training_data_version(self) -> int:
+        """训练数据版本，用于判断语义缓存是否失效
+
+        取自版本表。本类写入或删除训练数据时在同一事务内递增版本，任何进程(包括训练
+        脚本)提交后立即可见；删除旧记录再写入新记录的修改也会改变版本。绕过本类直接
+        修改向量表时版本不会变化，需要调用方主动使缓存失效。
+        """
+        query = text(f"SELECT version FROM {self.VERSION_TABLE} WHERE id = 1")
+        with self.engine.connect() as connection:
+            return connection.execute(query).scalar()
 
     def remove_training_data(self, id: str, **kwargs) -> bool:
         """删除训练数据
@@ -385,10 +998,7 @@ class PG_VectorStore(VannaBase):
         Returns:
             是否删除成功
         """
-        # 创建数据库引擎
         try:
-            engine = create_engine(self.connection_string)
-
             # SQL DELETE 语句
             delete_statement = text(
                 """
@@ -397,12 +1007,14 @@ class PG_VectorStore(VannaBase):
             """
             )
 
-            # 连接到数据库并执行删除语句
-            with engine.connect() as connection:
+            # 从连接池取出连接并执行删除语句
+            with self.engine.connect() as connection:
                 # 开始事务
                 with connection.begin() as transaction:
                     try:
                         result = connection.execute(delete_statement, {"id": id})
+                        if result.rowcount > 0:
+                            self._bump_training_version(connection)
                         # 如果删除成功则提交事务
                         transaction.commit()
                         # 检查是否有行被删除，并相应地返回True或False
@@ -419,6 +1031,38 @@ class PG_VectorStore(VannaBase):
             print(f"删除训练数据失败: {e}")
             return False
 
+    def remove_training_data_many(self, ids: list) -> int:
+        """用一条DELETE语句批量删除训练数据
+
+        按cmetadata->>'id'匹配，依赖tools/reset_langchain_pgvector.py创建的表达式索引。
+
+        Args:
+            ids: 记录ID列表
+
+        Returns:
+            删除的行数
+        """
+        ids = [str(_id) for _id in ids]
+        if not ids:
+            return 0
+
+        delete_statement = text(
+            """
+            DELETE FROM langchain_pg_embedding
+            WHERE cmetadata ->> 'id' = ANY(:ids)
+            """
+        )
+        try:
+            with self.engine.begin() as connection:
+                result = connection.execute(delete_statement, {"ids": ids})
+                if result.rowcount > 0:
+                    self._bump_training_version(connection)
+            print(f"批量删除训练数据: 请求 {len(ids)} 条，删除 {result.rowcount} 条")
+            return result.rowcount
+        except Exception as e:
+            print(f"批量删除训练数据失败: {e}")
+            raise
+
     def remove_collection(self, collection_name: str) -> bool:
         """删除集合中的所有数据
         
@@ -429,41 +1073,26 @@ class PG_VectorStore(VannaBase):
             是否删除成功
         """
         try:
-            engine = create_engine(self.connection_string)
-
-            # 根据集合名称确定ID范围
-            id_range = {
-                "documentation": "(cmetadata->>'id')::int < 100000",
-                "ddl": "(cmetadata->>'id')::int >= 100000 AND (cmetadata->>'id')::int < 200000",
-                "sql": "(cmetadata->>'id')::int >= 200000"
-            }
-            
-            condition = id_range.get(collection_name)
-            if not condition:
-                # 尝试使用旧格式的后缀
-                suffix_map = {"ddl": "ddl", "sql": "sql", "documentation": "doc"}
-                suffix = suffix_map.get(collection_name)
-                
-                if not suffix:
-                    logging.info("无效的集合名称。请从 'ddl', 'sql', 或 'documentation' 中选择。")
-                    return False
-                    
-                # 使用旧的ID格式条件
-                condition = f"cmetadata->>'id' LIKE '%{suffix}'"
-
-            # SQL 查询，根据条件删除行
+            if collection_name not in self.ID_SUFFIXES:
+                logging.info("无效的集合名称。请从 'ddl', 'sql', 或 'documentation' 中选择。")
+                return False
+
+            # 按集合关联删除，与记录ID的格式无关
             query = text(
-                f"""
-                DELETE FROM langchain_pg_embedding
-                WHERE {condition}
+                """
+                DELETE FROM langchain_pg_embedding e
+                USING langchain_pg_collection c
+                WHERE e.collection_id = c.uuid AND c.name = :name
             """
             )
 
             # 在事务块内执行删除操作
-            with engine.connect() as connection:
+            with self.engine.connect() as connection:
                 with connection.begin() as transaction:
                     try:
-                        result = connection.execute(query)
+                        result = connection.execute(query, {"name": collection_name})
+                        if result.rowcount > 0:
+                            self._bump_training_version(connection)
                         transaction.commit()  # 显式提交事务
                         if result.rowcount > 0:
                             logging.info(
@@ -484,6 +1113,82 @@ class PG_VectorStore(VannaBase):
             print(f"删除集合失败: {e}")
             return False
 
+    def migrate_legacy_ids(self, chunk_size: int = 1000) -> dict:
+        """将旧版本生成的整数ID迁移为基于内容的ID
+
+        旧ID是内容MD5对1000000取模再加类型前缀，容易碰撞。迁移按集合和文档内容重新计算ID，
+        同时更新主键和cmetadata中的id，向量不变，无需重新嵌入。新ID已被占用说明内容重复，
+        直接删除旧记录。整个迁移在一个事务中完成。
+
+        Args:
+            chunk_size: 单条UPDATE语句包含的最大行数
+
+        Returns:
+            {"migrated": 迁移条数, "removed": 删除的重复条数, "unchanged": 已是新ID的条数}
+        """
+        query = text(
+            """
+            SELECT e.id, c.name AS collection_name, e.document
+            FROM langchain_pg_embedding e
+            JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+            """
+        )
+        stats = {"migrated": 0, "removed": 0, "unchanged": 0}
+
+        with self.engine.begin() as connection:
+            rows = connection.execute(query).fetchall()
+            current_ids = {row.id for row in rows}
+
+            mapping = {}
+            assigned = set()
+            removed = []
+            for row in rows:
+                if row.collection_name not in self.ID_SUFFIXES:
+                    continue
+                new_id = self.generate_content_id(row.document, row.collection_name)
+                if new_id == row.id:
+                    stats["unchanged"] += 1
+                elif new_id in current_ids or new_id in assigned:
+                    removed.append(row.id)
+                else:
+                    mapping[row.id] = new_id
+                    assigned.add(new_id)
+
+            if removed:
+                connection.execute(
+                    text("DELETE FROM langchain_pg_embedding WHERE id = ANY(:ids)"), {"ids": removed}
+                )
+            stats["removed"] = len(removed)
+
+            items = list(mapping.items())
+            for start in range(0, len(items), chunk_size):
+                chunk = items[start:start + chunk_size]
+                params = {}
+                values = []
+                for idx, (old_id, new_id) in enumerate(chunk):
+                    values.append(f"(:old_{idx}, :new_{idx})")
+                    params[f"old_{idx}"] = old_id
+                    params[f"new_{idx}"] = new_id
+                connection.execute(
+                    text(
+                        f"""
+                        UPDATE langchain_pg_embedding e
+                        SET id = m.new_id,
+                            cmetadata = jsonb_set(COALESCE(e.cmetadata, '{{}}'::jsonb), '{{id}}', to_jsonb(m.new_id))
+                        FROM (VALUES {", ".join(values)}) AS m(old_id, new_id)
+                        WHERE e.id = m.old_id
+                        """
+                    ),
+                    params,
+                )
+            stats["migrated"] = len(items)
+            if removed or items:
+                self._bump_training_version(connection)
+
+        print(f"记录ID迁移完成: 迁移 {stats['migrated']} 条，删除重复 {stats['removed']} 条，"
+              f"无需迁移 {stats['unchanged']} 条")
+        return stats
+
     def generate_embedding(self, data: str, **kwargs):
         """生成嵌入向量
         
@@ -494,7 +1199,7 @@ class PG_VectorStore(VannaBase):
             嵌入向量
         """
         try:
-            return self.embedding_function.encode([data])[0]
+            return self.embedding_function.embed_query(data)
         except Exception as e:
             print(f"生成嵌入向量失败: {e}")
             raise
\ No newline at end of file
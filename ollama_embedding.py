@@ -1,11 +1,31 @@
+import math
+import threading
+import concurrent.futures
 import requests
+from requests.adapters import HTTPAdapter
 from typing import List, Union
 import ext_config
+from embedding_cache import EmbeddingCache
+
+
+def embedding_normalize_enabled() -> bool:
+    """是否将嵌入向量L2归一化
+
+    EMBEDDING_NORMALIZE为None时只在PgVector使用内积距离时开启。ChromaDB集合默认使用L2距离，
+    已有向量没有归一化，只归一化新的向量会改变检索排序。
+    """
+    normalize = getattr(ext_config, "EMBEDDING_NORMALIZE", None)
+    if normalize is None:
+        return (getattr(ext_config, "VECTOR_DB_TYPE", "").lower() == "pgvector"
+                and getattr(ext_config, "PGVECTOR_DISTANCE", "cosine").lower() == "inner_product")
+    return bool(normalize)
 
 class OllamaEmbeddingFunction:
     """Ollama嵌入向量生成类，符合ChromaDB的embedding_function接口"""
     
-    def __init__(self, model_name="bge-m3:latest", base_url="http://localhost:11434", verbose=False):
+    def __init__(self, model_name="bge-m3:latest", base_url="http://localhost:11434", verbose=False,
+                 batch_size=None, max_batch_tokens=None, timeout=None, pool_size=None, max_workers=None,
+                 cache=None, normalize=None):
         """
         初始化Ollama Embedding Function
         
@@ -13,11 +33,46 @@ class OllamaEmbeddingFunction:
             model_name: Ollama模型名称，默认为"bge-m3:latest"
             base_url: Ollama API的基础URL，默认为"http://localhost:11434"
             verbose: 是否打印详细日志，默认为False (已废弃，现在总是打印详细日志)
+            batch_size: 批量嵌入时单次请求的最大文本条数，默认读取ext_config.OLLAMA_EMBED_BATCH_SIZE
+            max_batch_tokens: 批量嵌入时单次请求的token预算，默认读取ext_config.OLLAMA_EMBED_BATCH_MAX_TOKENS
+            timeout: 单次HTTP请求超时时间（秒），默认读取ext_config.OLLAMA_REQUEST_TIMEOUT
+            pool_size: keep-alive连接池大小，默认读取ext_config.OLLAMA_POOL_SIZE
+            max_workers: 并发请求线程数，默认读取ext_config.OLLAMA_EMBED_MAX_WORKERS，1表示串行
+            cache: 嵌入向量缓存(EmbeddingCache)，默认按ext_config.EMBEDDING_CACHE_SIZE和EMBEDDING_CACHE_PATH创建
+            normalize: 是否将返回的向量L2归一化，默认由embedding_normalize_enabled按ext_config决定
         """
         self.embedding_model_name = model_name
         self.ollama_base_url = base_url
         self.embedding_dimension = ext_config.OLLAMA_EMBEDDING_DIMENSION
-        print(f"已初始化Ollama嵌入向量生成器 (模型: {model_name}, 维度: {self.embedding_dimension})")
+        self.batch_size = batch_size or getattr(ext_config, "OLLAMA_EMBED_BATCH_SIZE", 32)
+        self.max_batch_tokens = max_batch_tokens or getattr(ext_config, "OLLAMA_EMBED_BATCH_MAX_TOKENS", 8192)
+        # 旧版本Ollama不支持/api/embed多输入接口，探测失败后退回逐条请求
+        self.batch_endpoint_supported = True
+        self.timeout = timeout or getattr(ext_config, "OLLAMA_REQUEST_TIMEOUT", 60)
+        self.pool_size = pool_size or getattr(ext_config, "OLLAMA_POOL_SIZE", 8)
+        self.max_workers = max_workers or getattr(ext_config, "OLLAMA_EMBED_MAX_WORKERS", 1)
+        # 归一化后余弦相似度等于内积，向量数据库可以使用更便宜的内积距离
+        self.normalize = normalize if normalize is not None else embedding_normalize_enabled()
+
+        # 复用keep-alive连接，避免每次嵌入都新建TCP连接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # 并发请求线程池按需创建
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+        # 相同文本不重复请求嵌入服务
+        if cache is None:
+            cache_size = getattr(ext_config, "EMBEDDING_CACHE_SIZE", 0)
+            cache_path = getattr(ext_config, "EMBEDDING_CACHE_PATH", None)
+            if cache_size > 0 or cache_path:
+                cache = EmbeddingCache(model_name, max_size=cache_size, persist_path=cache_path)
+        self.cache = cache
+        print(f"已初始化Ollama嵌入向量生成器 (模型: {model_name}, 维度: {self.embedding_dimension}, "
+              f"批大小: {self.batch_size}, 批token预算: {self.max_batch_tokens}, 并发数: {self.max_workers})")
     
     def __call__(self, input: Union[str, List[str]]) -> List[List[float]]:
         """
@@ -33,12 +88,7 @@ class OllamaEmbeddingFunction:
         if isinstance(input, str):
             input = [input]
         
-        # 为每个文本生成嵌入向量
-        embeddings = []
-        for text in input:
-            embeddings.append(self.generate_embedding(text))
-        
-        return embeddings
+        return self.generate_embeddings(input)
     
     def generate_embedding(self, data: str) -> List[float]:
         """
@@ -52,12 +102,19 @@ class OllamaEmbeddingFunction:
             print("[WARNING] 输入文本为空，返回零向量")
             # 返回配置中指定维度的零向量
             return [0.0] * self.embedding_dimension
+
+        if self.cache is not None:
+            cached = self.cache.get(data, self.embedding_dimension)
+            if cached is not None:
+                print("===调试: 命中嵌入向量缓存===\n")
+                return self._normalize(cached)
         
         try:
             # 直接调用Ollama API
-            response = requests.post(
+            response = self.session.post(
                 f"{self.ollama_base_url}/api/embeddings",
-                json={"model": self.embedding_model_name, "prompt": data}
+                json={"model": self.embedding_model_name, "prompt": data},
+                timeout=self.timeout
             )
             
             if response.status_code != 200:
@@ -73,24 +130,203 @@ class OllamaEmbeddingFunction:
                 print(f"错误: {error_msg}")
                 raise Exception(error_msg)
                 
-            # 检查返回的向量维度与配置是否一致
-            actual_dimension = len(vector)
-            if actual_dimension != self.embedding_dimension:
-                print(f"[警告] 模型返回的向量维度({actual_dimension})与配置维度({self.embedding_dimension})不一致")
-                # 更新维度设置为实际值
-                self.embedding_dimension = actual_dimension
+            self._check_dimension(vector)
                 
             print(f"向量长度: {len(vector)}")
             print(f"向量前5个元素: {vector[:5]}")
             print("===调试: 嵌入向量生成成功===\n")
+
+            if self.cache is not None:
+                self.cache.set(data, self.embedding_dimension, vector)
                 
-            return vector
+            return self._normalize(vector)
             
         except Exception as e:
             print(f"[ERROR] Ollama嵌入向量生成异常: {str(e)}")
             print("===调试: 嵌入向量生成失败===\n")
             raise 
 
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        批量生成文本向量，通过Ollama的/api/embed接口一次请求多个文本
+
+        文本按batch_size和max_batch_tokens切分为多个请求，结果按输入顺序重新拼接。
+        max_workers大于1时多个请求并发发送。空文本和命中缓存的文本不发送到服务端。
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            与输入顺序一致的嵌入向量列表
+        """
+        texts = list(texts)
+        embeddings = [None] * len(texts)
+
+        # 空文本直接返回零向量，其余文本参与批量请求
+        pending = []
+        for idx, text in enumerate(texts):
+            if not text or len(text.strip()) == 0:
+                embeddings[idx] = [0.0] * self.embedding_dimension
+            else:
+                pending.append(idx)
+
+        if pending and self.cache is not None:
+            cached = self.cache.get_many([texts[idx] for idx in pending], self.embedding_dimension)
+            misses = []
+            for idx, vector in zip(pending, cached):
+                if vector is not None:
+                    embeddings[idx] = vector
+                else:
+                    misses.append(idx)
+            if len(misses) < len(pending):
+                print(f"[DEBUG] 嵌入向量缓存命中 {len(pending) - len(misses)}/{len(pending)} 条")
+            pending = misses
+
+        if not pending:
+            return [self._normalize(vector) for vector in embeddings]
+
+        # 同一次调用中重复的文本只请求一次
+        duplicates = {}
+        unique = {}
+        for idx in pending:
+            first = unique.setdefault(texts[idx], idx)
+            if first != idx:
+                duplicates[idx] = first
+        pending = list(unique.values())
+
+        batches = self._split_batches(pending, texts)
+        print(f"[DEBUG] 批量生成嵌入向量: {len(pending)} 条文本，分为 {len(batches)} 个请求")
+
+        batch_texts = [[texts[idx] for idx in batch] for batch in batches]
+        if len(batches) > 1 and self.max_workers > 1:
+            # executor.map按提交顺序返回结果，保证输出顺序与输入一致
+            results = self._get_executor().map(self._embed_batch, batch_texts)
+        else:
+            results = map(self._embed_batch, batch_texts)
+
+        for batch, vectors in zip(batches, results):
+            for idx, vector in zip(batch, vectors):
+                embeddings[idx] = vector
+            if self.cache is not None:
+                self.cache.set_many([texts[idx] for idx in batch], self.embedding_dimension, vectors)
+
+        for idx, first in duplicates.items():
+            embeddings[idx] = embeddings[first]
+
+        return [self._normalize(vector) for vector in embeddings]
+
+    def _normalize(self, vector: List[float]) -> List[float]:
+        """启用归一化时返回L2归一化后的向量，零向量原样返回（缓存中保存的是原始向量）"""
+        if not self.normalize:
+            return vector
+        norm = math.sqrt(sum(value * value for value in vector))
+        if norm == 0:
+            return vector
+        return [value / norm for value in vector]
+
+    def _split_batches(self, indices: List[int], texts: List[str]) -> List[List[int]]:
+        """按条数上限和token预算将文本下标切分为多个批次"""
+        batches = []
+        current = []
+        current_tokens = 0
+
+        for idx in indices:
+            # 按字符数估算token数，中文文本下基本等于或高于实际token数
+            tokens = len(texts[idx])
+            if current and (len(current) >= self.batch_size or current_tokens + tokens > self.max_batch_tokens):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(idx)
+            current_tokens += tokens
+
+        if current:
+            batches.append(current)
+        return batches
+
+    def _get_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        """获取并发请求线程池，首次使用时创建"""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="ollama-embed"
+                )
+            return self._executor
+
+    def _embed_batch(self, batch_texts: List[str]) -> List[List[float]]:
+        """发送一次批量嵌入请求，旧版本Ollama不支持时退回逐条请求"""
+        if not self.batch_endpoint_supported:
+            return [self.generate_embedding(text) for text in batch_texts]
+
+        try:
+            response = self.session.post(
+                f"{self.ollama_base_url}/api/embed",
+                json={"model": self.embedding_model_name, "input": batch_texts},
+                timeout=self.timeout
+            )
+
+            if response.status_code == 404 and self._is_missing_endpoint(response):
+                print("[WARNING] Ollama服务不支持/api/embed批量接口，退回逐条请求/api/embeddings")
+                self.batch_endpoint_supported = False
+                return [self.generate_embedding(text) for text in batch_texts]
+
+            if response.status_code != 200:
+                error_msg = f"批量API请求错误: {response.status_code}, {response.text}"
+                print(f"错误: {error_msg}")
+                raise Exception(error_msg)
+
+            vectors = response.json().get("embeddings")
+
+            if not vectors or len(vectors) != len(batch_texts):
+                error_msg = f"批量API返回的向量数量({len(vectors or [])})与输入数量({len(batch_texts)})不一致"
+                print(f"错误: {error_msg}")
+                raise Exception(error_msg)
+
+            self._check_dimension(vectors[0])
+            return vectors
+
+        except Exception as e:
+            print(f"[ERROR] Ollama批量嵌入向量生成异常: {str(e)}")
+            raise
+
+    @staticmethod
+    def _is_missing_endpoint(response) -> bool:
+        """404是否表示接口不存在
+
+        旧版本Ollama没有/api/embed路由，返回纯文本的"404 page not found"；
+        模型不存在时同样返回404，但响应体是包含error字段的JSON，此时不应退回逐条请求。
+        """
+        try:
+            body = response.json()
+        except ValueError:
+            return True
+        return not (isinstance(body, dict) and body.get("error"))
+
+    def _check_dimension(self, vector: List[float]):
+        """检查返回的向量维度与配置是否一致"""
+        actual_dimension = len(vector)
+        if actual_dimension != self.embedding_dimension:
+            print(f"[警告] 模型返回的向量维度({actual_dimension})与配置维度({self.embedding_dimension})不一致")
+            # 更新维度设置为实际值
+            self.embedding_dimension = actual_dimension
+
+    def cache_stats(self) -> dict:
+        """返回嵌入向量缓存的命中统计，未启用缓存时返回空字典"""
+        if self.cache is None:
+            return {}
+        return self.cache.stats()
+
+    def close(self):
+        """关闭线程池、HTTP连接池和持久化缓存"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
     def embed_documents(self, texts):
         """批量将文档转换为向量
         
@@ -100,8 +336,7 @@ class OllamaEmbeddingFunction:
         Returns:
             文档向量列表
         """
-        # 如果已有embed_query方法，可以复用它
-        return [self.embed_query(text) for text in texts] 
+        return self.generate_embeddings(texts)
 
     def embed_query(self, text):
         """将单个文本转换为向量
@@ -113,4 +348,4 @@ class OllamaEmbeddingFunction:
             嵌入向量
         """
         # 调用现有的生成嵌入方法
-        return self.generate_embedding(text) 
\ No newline at end of file
+        return self.generate_embedding(text) 
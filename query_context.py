@@ -0,0 +1,50 @@
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable
+
+
+class QueryContext:
+    """单次generate_sql请求内共享的查询上下文
+
+    同一个问题在一次请求中会分别检索sql、ddl和documentation三个集合，
+    上下文用于缓存问题向量等中间结果，使其只计算一次。
+    上下文按线程隔离，并发请求之间互不影响；在scope之外调用时不做任何缓存。
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    @contextmanager
+    def scope(self, question: str):
+        """开启一个针对指定问题的查询上下文，退出时丢弃缓存的结果"""
+        previous = getattr(self._local, "scope", None)
+        self._local.scope = {"question": question, "values": {}}
+        try:
+            yield
+        finally:
+            self._local.scope = previous
+
+    def is_active(self, question: str) -> bool:
+        """当前线程是否处于针对该问题的查询上下文中"""
+        scope = getattr(self._local, "scope", None)
+        return scope is not None and scope["question"] == question
+
+    def get_or_compute(self, question: str, key: str, compute: Callable[[], Any]) -> Any:
+        """在当前上下文中获取key对应的值，不存在时调用compute计算并缓存
+
+        Args:
+            question: 问题文本，与当前上下文的问题不一致时不使用缓存
+            key: 缓存键，例如"embedding"
+            compute: 计算函数
+
+        Returns:
+            缓存的值或新计算的值
+        """
+        scope = getattr(self._local, "scope", None)
+        if scope is None or scope["question"] != question:
+            return compute()
+
+        values = scope["values"]
+        if key not in values:
+            values[key] = compute()
+        return values[key]
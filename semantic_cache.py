@@ -0,0 +1,228 @@
+import re
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+# 问题中的数字和引号内的文本。只差一个年份、数量或名称的问题向量几乎相同，
+# 但对应不同的SQL，这些字面值必须完全一致才能命中
+_LITERAL_PATTERN = re.compile(
+    r'\d+(?:\.\d+)?|"([^"]*)"|\'([^\']*)\'|“([^”]*)”|‘([^’]*)’|「([^」]*)」|『([^』]*)』|《([^》]*)》'
+)
+
+
+class SemanticCache:
+    """问题到SQL的语义缓存
+
+    以问题向量为键缓存已生成的SQL。新问题与缓存中某个问题的余弦相似度达到阈值、
+    两个问题中的数字和引号内的文本完全相同，且训练数据版本没有变化时，直接返回缓存的
+    SQL，不再检索训练数据和调用大模型。中文数字("前五")和未加引号的名称(门店、地区)
+    无法识别，仍可能命中为其他问题生成的SQL，阈值不宜过低。
+
+    向量保存在预分配的NumPy矩阵中，一次矩阵乘法即可与所有缓存问题比较；容量满时
+    覆盖最早写入的条目。训练数据版本由version_fn提供，每隔version_check_interval秒
+    检查一次，版本变化时清空缓存。
+    """
+
+    def __init__(self, embed_fn: Callable[[str], List[float]], version_fn: Optional[Callable[[], object]] = None,
+                 threshold: float = 0.95, max_entries: int = 1000, ttl: Optional[float] = None,
+                 version_check_interval: float = 5.0):
+        """
+        Args:
+            embed_fn: 生成问题向量的函数，通常为vn.generate_embedding
+            version_fn: 返回训练数据版本的函数，None表示不检查版本
+            threshold: 余弦相似度阈值，大于等于该值且字面值相同时视为同一个问题
+            max_entries: 最多缓存的问题数
+            ttl: 条目的存活时间(秒)，None表示不过期
+            version_check_interval: 两次检查训练数据版本的最短间隔(秒)
+        """
+        self.embed_fn = embed_fn
+        self.version_fn = version_fn
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_check_interval = version_check_interval
+        self.lock = threading.Lock()
+
+        self.matrix = None
+        self.entries = [None] * max_entries
+        self.exact = {}
+        self.next_slot = 0
+        self.version = None
+        self.next_version_check = 0.0
+        # invalidate的次数，用于丢弃invalidate之前发起的版本查询结果
+        self.generation = 0
+        self.metrics = {"lookups": 0, "hits": 0, "exact_hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+
+    @staticmethod
+    def _key(question: str) -> str:
+        """完全相同的问题(忽略首尾空白)不需要计算向量"""
+        return question.strip()
+
+    @staticmethod
+    def _literals(question: str) -> List[str]:
+        """按出现顺序提取问题中的数字和引号内的文本"""
+        literals = []
+        for match in _LITERAL_PATTERN.finditer(question):
+            quoted = [group for group in match.groups() if group is not None]
+            literals.append(quoted[0] if quoted else match.group(0))
+        return literals
+
+    def _clear(self):
+        """清空缓存（调用方持有锁）"""
+        if self.matrix is not None:
+            self.matrix[:] = 0
+        self.entries = [None] * self.max_entries
+        self.exact = {}
+        self.next_slot = 0
+
+    def _check_version(self) -> bool:
+        """按间隔检查训练数据版本，版本变化时清空缓存
+
+        version_fn通常需要查询数据库，在锁外调用，不阻塞其他线程的查找；
+        取得版本后在锁内比较和替换。
+
+        Returns:
+            False表示无法确认版本，本次不应使用缓存
+        """
+        if self.version_fn is None:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            if now < self.next_version_check:
+                return True
+            # 其他线程在间隔内不再重复查询
+            self.next_version_check = now + self.version_check_interval
+            generation = self.generation
+        try:
+            version = self.version_fn()
+        except Exception as e:
+            print(f"[WARNING] 读取训练数据版本失败，本次不使用语义缓存: {e}")
+            with self.lock:
+                self.next_version_check = 0.0
+            return False
+        with self.lock:
+            # 查询期间调用过invalidate时，读到的版本可能早于这次变化，下次重新读取
+            if generation != self.generation:
+                return True
+            if version != self.version:
+                if self.version is not None:
+                    print(f"[INFO] 训练数据版本已变化({self.version} -> {version})，清空语义缓存")
+                    self.metrics["invalidations"] += 1
+                self._clear()
+                self.version = version
+        return True
+
+    def _is_live(self, entry: Optional[dict], now: float) -> bool:
+        return entry is not None and (self.ttl is None or now - entry["created_at"] < self.ttl)
+
+    def lookup(self, question: str) -> Tuple[Optional[dict], Optional[np.ndarray]]:
+        """查找语义相同的已缓存问题
+
+        Args:
+            question: 问题文本
+
+        Returns:
+            (命中的条目或None, 问题向量)。命中的条目包含question、sql和similarity；
+            问题向量用于未命中时调用store，精确命中或出错时为None
+        """
+        if not self._check_version():
+            with self.lock:
+                self.metrics["lookups"] += 1
+                self.metrics["misses"] += 1
+            return None, None
+
+        with self.lock:
+            self.metrics["lookups"] += 1
+            now = time.monotonic()
+            slot = self.exact.get(self._key(question))
+            if slot is not None and self._is_live(self.entries[slot], now):
+                entry = self.entries[slot]
+                self.metrics["hits"] += 1
+                self.metrics["exact_hits"] += 1
+                return {"question": entry["question"], "sql": entry["sql"], "similarity": 1.0}, None
+
+        try:
+            embedding = self._normalize(self.embed_fn(question))
+        except Exception as e:
+            print(f"[WARNING] 生成问题向量失败，本次不使用语义缓存: {e}")
+            with self.lock:
+                self.metrics["misses"] += 1
+            return None, None
+
+        literals = self._literals(question)
+        with self.lock:
+            if self.matrix is not None and self.matrix.shape[1] == embedding.shape[0]:
+                scores = self.matrix @ embedding
+                now = time.monotonic()
+                for slot in np.argsort(-scores):
+                    if scores[slot] < self.threshold:
+                        break
+                    entry = self.entries[slot]
+                    if self._is_live(entry, now) and entry["literals"] == literals:
+                        self.metrics["hits"] += 1
+                        return {"question": entry["question"], "sql": entry["sql"],
+                                "similarity": float(scores[slot])}, embedding
+            self.metrics["misses"] += 1
+        return None, embedding
+
+    def store(self, question: str, sql: str, embedding: Optional[np.ndarray] = None):
+        """缓存问题和生成的SQL
+
+        Args:
+            question: 问题文本
+            sql: 生成的SQL
+            embedding: lookup返回的问题向量，为None时重新计算
+        """
+        if embedding is None:
+            try:
+                embedding = self._normalize(self.embed_fn(question))
+            except Exception as e:
+                print(f"[WARNING] 生成问题向量失败，不写入语义缓存: {e}")
+                return
+
+        with self.lock:
+            if self.matrix is None or self.matrix.shape[1] != embedding.shape[0]:
+                self.matrix = np.zeros((self.max_entries, embedding.shape[0]), dtype=np.float32)
+                self._clear()
+
+            slot = self.next_slot
+            self.next_slot = (slot + 1) % self.max_entries
+            previous = self.entries[slot]
+            if previous is not None and self.exact.get(self._key(previous["question"])) == slot:
+                del self.exact[self._key(previous["question"])]
+
+            self.matrix[slot] = embedding
+            self.entries[slot] = {"question": question, "sql": sql, "literals": self._literals(question),
+                                  "created_at": time.monotonic()}
+            self.exact[self._key(question)] = slot
+            self.metrics["stores"] += 1
+
+    def invalidate(self):
+        """训练数据变化后清空缓存"""
+        with self.lock:
+            self._clear()
+            self.metrics["invalidations"] += 1
+            self.generation += 1
+            # 下次查找时重新读取版本
+            self.next_version_check = 0.0
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def stats(self) -> dict:
+        """返回命中率等统计信息"""
+        with self.lock:
+            lookups = self.metrics["lookups"]
+            return {
+                "entries": sum(entry is not None for entry in self.entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "version": None if self.version is None else str(self.version),
+                "hit_rate": self.metrics["hits"] / lookups if lookups else 0.0,
+                **self.metrics,
+            }
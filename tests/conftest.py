@@ -0,0 +1,7 @@
+import os
+import sys
+
+# 训练脚本以training目录为工作目录运行，模块之间直接导入
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "training"))
@@ -0,0 +1,32 @@
+from dedup import NearDuplicateFilter
+
+
+def make_record(record_id, embedding, document):
+    return {"id": record_id, "collection": "documentation", "embedding": embedding, "document": document}
+
+
+def test_near_duplicate_is_merged_into_existing_record():
+    dedup = NearDuplicateFilter(lambda name: (["old-doc"], [[1.0, 0.0]]), threshold=0.97)
+    records = [make_record("new-doc", [1.0, 0.01], "相似的文档")]
+    dedup.filter(records)
+    assert records[0]["duplicate_of"] == "old-doc"
+
+
+def test_edited_block_keeps_new_content():
+    dedup = NearDuplicateFilter(lambda name: (["old-doc"], [[1.0, 0.0]]), threshold=0.97)
+    # 训练文件已修改，原有记录将在本次训练结束时被替换
+    dedup.exclude(["old-doc"])
+    records = [make_record("new-doc", [1.0, 0.01], "修改后的文档")]
+    dedup.filter(records)
+    assert "duplicate_of" not in records[0]
+
+
+def test_failed_write_is_not_compared():
+    dedup = NearDuplicateFilter(lambda name: ([], []), threshold=0.97)
+    first = [make_record("a-doc", [1.0, 0.0], "a")]
+    dedup.filter(first)
+    dedup.commit(first, [{"id": "a-doc", "error": "写入失败"}])
+
+    second = [make_record("b-doc", [1.0, 0.01], "b")]
+    dedup.filter(second)
+    assert "duplicate_of" not in second[0]
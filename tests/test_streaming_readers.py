@@ -0,0 +1,22 @@
+from streaming_readers import iter_sql_statements
+
+
+def split(tmp_path, text):
+    path = tmp_path / "statements.sql"
+    path.write_text(text, encoding="utf-8")
+    return list(iter_sql_statements(str(path)))
+
+
+def test_semicolons_in_strings_and_comments(tmp_path):
+    text = "select 'a;b' as x; -- c;\nselect $$d;$$;\n/* e; /* f; */ */ select 1;"
+    assert split(tmp_path, text) == ["select 'a;b' as x", "-- c;\nselect $$d;$$", "/* e; /* f; */ */ select 1"]
+
+
+def test_escape_string_backslash_quote(tmp_path):
+    text = "select E'it\\'s; x';\nselect e'a\\\\';select 2;"
+    assert split(tmp_path, text) == ["select E'it\\'s; x'", "select e'a\\\\'", "select 2"]
+
+
+def test_escape_string_doubled_quote_and_identifier(tmp_path):
+    text = "select E'it''s \\'; x';\nselect name';';"
+    assert split(tmp_path, text) == ["select E'it''s \\'; x'", "select name';'"]
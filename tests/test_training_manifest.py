@@ -0,0 +1,92 @@
+from training_manifest import TrainingManifest
+
+
+def run_source(manifest, source, file_hash, blocks):
+    """模拟训练一个文件：登记并提交给定的数据块"""
+    assert manifest.begin_source(source, file_hash)
+    committed = []
+    for block in blocks:
+        block_hash = manifest.hash_text(block)
+        if manifest.should_train(source, block_hash):
+            committed.append({"source": source, "block": block_hash, "id": f"{block}-sql"})
+    manifest.mark_committed(committed)
+
+
+def test_partial_read_retires_nothing(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    manifest = TrainingManifest(path, target="t")
+    run_source(manifest, "pairs.json", "h1", ["q1", "q2", "q3"])
+    assert manifest.finalize() == []
+
+    # 第二次运行读到q1之后解析失败
+    manifest = TrainingManifest(path, target="t")
+    run_source(manifest, "pairs.json", "h2", ["q1"])
+    manifest.keep_source("pairs.json")
+    assert manifest.finalize() == []
+    assert manifest.stats() == {"sources": 1, "blocks": 3}
+
+    # 文件哈希没有更新，下次运行重新处理
+    manifest = TrainingManifest(path, target="t")
+    assert manifest.begin_source("pairs.json", "h2")
+
+
+def test_missing_file_retires_nothing(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    manifest = TrainingManifest(path, target="t")
+    run_source(manifest, "pairs.json", "h1", ["q1", "q2"])
+    manifest.finalize()
+
+    manifest = TrainingManifest(path, target="t")
+    manifest.keep_source("pairs.json")
+    assert manifest.finalize() == []
+
+
+def test_removed_blocks_and_sources_are_retired(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    manifest = TrainingManifest(path, target="t")
+    run_source(manifest, "pairs.json", "h1", ["q1", "q2"])
+    run_source(manifest, "old.json", "h1", ["q9"])
+    manifest.finalize()
+
+    manifest = TrainingManifest(path, target="t")
+    run_source(manifest, "pairs.json", "h2", ["q1"])
+    assert manifest.finalize() == ["q2-sql", "q9-sql"]
+
+
+def test_target_change_requires_reembedding_until_complete(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    manifest = TrainingManifest(path, target="model-a")
+    run_source(manifest, "pairs.json", "h1", ["q1"])
+    manifest.finalize()
+
+    # 切换嵌入配置后第一次运行中断
+    manifest = TrainingManifest(path, target="model-a|normalized")
+    assert manifest.reembed
+    manifest.begin_source("pairs.json", "h1")
+    manifest.should_train("pairs.json", manifest.hash_text("q1"))
+    manifest.finalize()
+
+    manifest = TrainingManifest(path, target="model-a|normalized")
+    assert manifest.reembed
+    run_source(manifest, "pairs.json", "h1", ["q1"])
+    manifest.finalize()
+
+    manifest = TrainingManifest(path, target="model-a|normalized")
+    assert not manifest.reembed
+
+
+def test_reconcile_keeps_generated_questions(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    manifest = TrainingManifest(path, target="t")
+    manifest.begin_source("examples.sql", "h1")
+    block_hash = manifest.hash_text("SELECT 1")
+    manifest.should_train("examples.sql", block_hash)
+    manifest.mark_committed([{"source": "examples.sql", "block": block_hash, "id": "x-sql", "question": "问题"}])
+    manifest.finalize()
+
+    # 向量表被重置后记录不存在
+    manifest = TrainingManifest(path, target="t")
+    assert manifest.reconcile(lambda ids: set()) == 1
+    assert manifest.begin_source("examples.sql", "h1")
+    assert manifest.should_train("examples.sql", block_hash)
+    assert manifest.known_question("examples.sql", block_hash) == "问题"
@@ -0,0 +1,241 @@
+# tools/benchmark_pgvector.py
+"""
+评估PgVector近似检索的召回率、延迟和存储占用
+
+从表中随机抽取已有向量作为查询，用顺序扫描计算精确的top-k作为基准，
+再用PG_VectorStore.search_collections(实际检索路径)查询，比较两者的结果。
+可用于对比vector/halfvec存储、二值量化重排、余弦/内积距离以及ef_search/probes等参数。
+--compare-operators 在不使用索引的情况下比较余弦(<=>)和内积(<#>)的单次比较开销。
+"""
+
+import sys
+import os
+import time
+import json
+import argparse
+
+from sqlalchemy import text
+
+# 添加父目录到路径，确保能正确导入项目模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 导入配置文件和工厂函数
+import ext_config
+from vanna_factory import create_vanna_instance
+
+def sample_queries(vn, n_queries, collection_name=None):
+    """
+    随机抽取表中已有的向量作为查询
+
+    Args:
+        vn: Vanna实例
+        n_queries: 查询数量
+        collection_name: 只从指定集合抽取，为空时从所有集合抽取
+
+    Returns:
+        list: [(集合名称, 向量)]
+    """
+    query = text(f"""
+    SELECT c.name AS collection_name, e.embedding::text AS embedding
+    FROM langchain_pg_embedding e
+    JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+    {"WHERE c.name = :name" if collection_name else ""}
+    ORDER BY random()
+    LIMIT :n
+    """)
+    params = {"n": n_queries}
+    if collection_name:
+        params["name"] = collection_name
+    with vn.engine.connect() as connection:
+        rows = connection.execute(query, params).fetchall()
+    return [(row.collection_name, json.loads(row.embedding)) for row in rows]
+
+def exact_search(vn, collection_name, embedding, k):
+    """
+    关闭索引扫描，按完整精度(float32)的余弦距离计算精确的top-k
+    """
+    query = text("""
+    SELECT e.document
+    FROM langchain_pg_embedding e
+    JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+    WHERE c.name = :name
+    ORDER BY e.embedding::vector <=> CAST(:embedding AS vector)
+    LIMIT :k
+    """)
+    with vn.engine.begin() as connection:
+        connection.execute(text("SET LOCAL enable_indexscan = off"))
+        connection.execute(text("SET LOCAL enable_bitmapscan = off"))
+        rows = connection.execute(query, {
+            "name": collection_name,
+            "embedding": vn._vector_literal(embedding),
+            "k": k
+        }).fetchall()
+    return [row.document for row in rows]
+
+def scan_time(vn, collection_name, embedding, k, operator):
+    """
+    关闭索引扫描，用指定距离操作符做一次全表扫描，返回耗时(毫秒)
+    """
+    query = text(f"""
+    SELECT e.id
+    FROM langchain_pg_embedding e
+    JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+    WHERE c.name = :name
+    ORDER BY e.embedding {operator} CAST(:embedding AS {vn.vector_storage_type})
+    LIMIT :k
+    """)
+    with vn.engine.begin() as connection:
+        connection.execute(text("SET LOCAL enable_indexscan = off"))
+        connection.execute(text("SET LOCAL enable_bitmapscan = off"))
+        start_time = time.time()
+        connection.execute(query, {
+            "name": collection_name,
+            "embedding": vn._vector_literal(vn._prepare_vector(embedding)),
+            "k": k
+        }).fetchall()
+        return (time.time() - start_time) * 1000
+
+def compare_operators(vn, queries, k):
+    """
+    比较余弦和内积两种距离在全表扫描下的耗时，两者交替执行以减少缓存的影响
+    """
+    timings = {"<=>": [], "<#>": []}
+    for query_collection, embedding in queries:
+        for operator in timings:
+            timings[operator].append(scan_time(vn, query_collection, embedding, k, operator))
+
+    print("\n全表扫描耗时对比 (不使用索引):")
+    for operator, name in (("<=>", "余弦"), ("<#>", "内积")):
+        values = timings[operator]
+        print(f" - {name}({operator}): p50 {percentile(values, 0.5):.2f}毫秒, p95 {percentile(values, 0.95):.2f}毫秒")
+    return timings
+
+def storage_stats(vn):
+    """
+    查询表和各索引的磁盘占用
+    """
+    query = text("""
+    SELECT c.relname AS name, pg_size_pretty(pg_relation_size(c.oid)) AS size
+    FROM pg_class c
+    WHERE c.oid = 'langchain_pg_embedding'::regclass
+       OR c.oid IN (SELECT indexrelid FROM pg_index WHERE indrelid = 'langchain_pg_embedding'::regclass)
+    ORDER BY pg_relation_size(c.oid) DESC
+    """)
+    with vn.engine.connect() as connection:
+        total = connection.execute(text("SELECT pg_size_pretty(pg_total_relation_size('langchain_pg_embedding'))")).scalar()
+        return total, [(row.name, row.size) for row in connection.execute(query)]
+
+def percentile(values, ratio):
+    """计算百分位数"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+def run_benchmark(n_queries=100, k=10, collection_name=None, ef_search=None, probes=None,
+                  binary_rerank=None, rerank_factor=None, distance=None, operators=False):
+    """
+    运行召回率和延迟测试
+
+    Args:
+        n_queries: 查询数量
+        k: 每次查询返回的条数
+        collection_name: 只测试指定集合
+        ef_search: 覆盖配置中的hnsw.ef_search
+        probes: 覆盖配置中的ivfflat.probes
+        binary_rerank: 覆盖配置中的二值量化重排开关
+        rerank_factor: 覆盖配置中的重排候选倍数
+        distance: 覆盖配置中的距离度量 "cosine" 或 "inner_product"
+        operators: 是否额外比较余弦和内积在全表扫描下的耗时
+    """
+    print("===== PgVector检索基准测试 =====")
+
+    # 强制使用PgVector
+    ext_config.VECTOR_DB_TYPE = "pgvector"
+    vn = create_vanna_instance()
+
+    # 命令行参数覆盖实例上的检索参数，便于对比不同配置
+    if ef_search is not None:
+        vn.hnsw_ef_search = ef_search
+    if probes is not None:
+        vn.ivfflat_probes = probes
+    if binary_rerank is not None:
+        vn.binary_rerank = binary_rerank
+    if rerank_factor is not None:
+        vn.rerank_factor = rerank_factor
+    if distance is not None:
+        vn.distance_metric = distance
+        vn.distance_operator = "<#>" if distance == "inner_product" else "<=>"
+
+    print(f"存储类型: {vn.vector_storage_type}, 索引类型: {vn.vector_index_type}, "
+          f"二值量化重排: {vn.binary_rerank} (候选倍数: {vn.rerank_factor}), "
+          f"距离: {vn.distance_metric} ({vn.distance_operator}), "
+          f"ef_search: {vn.hnsw_ef_search}, probes: {vn.ivfflat_probes or '自动'}")
+
+    queries = sample_queries(vn, n_queries, collection_name)
+    if not queries:
+        print("表中没有数据，无法测试")
+        return None
+
+    recalls = []
+    latencies = []
+    for query_collection, embedding in queries:
+        expected = exact_search(vn, query_collection, embedding, k)
+
+        start_time = time.time()
+        actual = vn.search_collections(vn._prepare_vector(embedding), {query_collection: k})[query_collection]
+        latencies.append((time.time() - start_time) * 1000)
+
+        if expected:
+            recalls.append(len(set(actual) & set(expected)) / len(expected))
+
+    if operators:
+        compare_operators(vn, queries, k)
+
+    total_size, relation_sizes = storage_stats(vn)
+
+    result = {
+        "queries": len(queries),
+        "k": k,
+        "recall": sum(recalls) / len(recalls) if recalls else 0.0,
+        "latency_p50_ms": percentile(latencies, 0.5),
+        "latency_p95_ms": percentile(latencies, 0.95),
+        "total_size": total_size,
+    }
+
+    print(f"\n查询数: {result['queries']}, k: {k}")
+    print(f"召回率@{k}: {result['recall']:.4f}")
+    print(f"延迟 p50: {result['latency_p50_ms']:.2f}毫秒, p95: {result['latency_p95_ms']:.2f}毫秒")
+    print(f"表总大小(含索引和TOAST): {total_size}")
+    for name, size in relation_sizes:
+        print(f" - {name}: {size}")
+
+    print("\n===== 基准测试完成 =====")
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='评估PgVector近似检索的召回率、延迟和存储占用')
+    parser.add_argument('--queries', type=int, default=100, help='查询数量')
+    parser.add_argument('--k', type=int, default=10, help='每次查询返回的条数')
+    parser.add_argument('--collection', choices=['sql', 'ddl', 'documentation'], help='只测试指定集合')
+    parser.add_argument('--ef-search', type=int, help='覆盖配置中的hnsw.ef_search')
+    parser.add_argument('--probes', type=int, help='覆盖配置中的ivfflat.probes')
+    parser.add_argument('--binary-rerank', dest='binary_rerank', action='store_true', default=None,
+                        help='启用二值量化重排')
+    parser.add_argument('--no-binary-rerank', dest='binary_rerank', action='store_false',
+                        help='关闭二值量化重排')
+    parser.add_argument('--rerank-factor', type=int, help='二值量化重排的候选倍数')
+    parser.add_argument('--distance', choices=['cosine', 'inner_product'], help='覆盖配置中的距离度量')
+    parser.add_argument('--compare-operators', action='store_true', help='比较余弦和内积在全表扫描下的耗时')
+
+    args = parser.parse_args()
+
+    run_benchmark(
+        n_queries=args.queries,
+        k=args.k,
+        collection_name=args.collection,
+        ef_search=args.ef_search,
+        probes=args.probes,
+        binary_rerank=args.binary_rerank,
+        rerank_factor=args.rerank_factor,
+        distance=args.distance,
+        operators=args.compare_operators
+    )
@@ -0,0 +1,53 @@
+# migrate_pgvector_ids.py
+"""
+将langchain_pg_embedding中旧版本生成的整数ID迁移为基于内容的ID
+旧ID由内容MD5对1000000取模再加类型前缀生成，训练数据较多时会发生碰撞。
+迁移只修改ID，不重新计算向量；迁移后重新运行训练会跳过所有已存在的内容。
+"""
+
+import sys
+import os
+import argparse
+
+# 添加父目录到路径，确保能正确导入项目模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 导入配置文件和工厂函数
+import ext_config
+from vanna_factory import create_vanna_instance
+
+def migrate_pgvector_ids(confirm=False):
+    """
+    迁移PgVector中的记录ID
+    
+    Args:
+        confirm: 是否已确认操作
+    """
+    if ext_config.VECTOR_DB_TYPE.lower() != "pgvector":
+        print("当前配置的向量数据库不是PgVector，无需迁移")
+        return False
+
+    if not confirm:
+        print(f"警告: 此操作将修改langchain_pg_embedding表中所有旧格式记录的ID！")
+        print(f"数据库连接信息: {ext_config.PGVECTOR_HOST}:{ext_config.PGVECTOR_PORT}/{ext_config.PGVECTOR_DB}")
+        confirm_input = input("确认继续？(y/N): ")
+        if confirm_input.lower() not in ['y', 'yes']:
+            print("操作已取消")
+            return False
+
+    try:
+        vn = create_vanna_instance()
+        stats = vn.migrate_legacy_ids()
+        print(f"✅ 记录ID迁移完成: {stats}")
+        return True
+    except Exception as e:
+        print(f"❌ 迁移记录ID时出错: {e}")
+        return False
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='将PgVector中的旧整数ID迁移为基于内容的ID')
+    parser.add_argument('--force', action='store_true', help='强制执行，不提示确认')
+    
+    args = parser.parse_args()
+    
+    migrate_pgvector_ids(confirm=args.force)
@@ -3,10 +3,13 @@
 用于重置LangChain PGVector数据库表的脚本
 会删除或清空langchain_pg_collection和langchain_pg_embedding表
 如果表不存在，则创建表，并确保collection_id字段为UUID类型
+使用--indexes-only时不重置数据，只在已有表上补建元数据索引（迁移旧库）
+使用--build-index时不重置数据，在批量导入完成后按实际行数(重新)创建向量索引
 """
 
 import sys
 import os
+import math
 import psycopg2
 import argparse
 
@@ -16,7 +19,228 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # 导入配置文件
 import ext_config as app_config
 
-def reset_langchain_pgvector(host=None, port=None, dbname=None, user=None, password=None, dimension=None, confirm=False):
+# 元数据查询使用的索引：按cmetadata->>'id'删除、按cmetadata过滤、按集合删除和检索
+METADATA_INDEXES = [
+    ("langchain_pg_embedding_cmetadata_id_idx", "((cmetadata ->> 'id'))"),
+    ("langchain_pg_embedding_cmetadata_gin_idx", "USING gin (cmetadata jsonb_path_ops)"),
+    ("langchain_pg_embedding_collection_id_idx", "(collection_id)"),
+]
+
+def create_metadata_indexes(cursor, concurrently=False):
+    """
+    创建元数据索引
+    
+    Args:
+        cursor: 数据库游标，连接需处于autocommit模式
+        concurrently: 是否使用CREATE INDEX CONCURRENTLY，在线上库建索引时不阻塞写入
+    """
+    for index_name, definition in METADATA_INDEXES:
+        print(f"创建索引 {index_name}...")
+        cursor.execute(f"""
+        CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {index_name}
+        ON langchain_pg_embedding {definition}
+        """)
+        print(f"✅ 已创建索引 {index_name}")
+    # 更新统计信息，让查询规划器使用新索引
+    cursor.execute("ANALYZE langchain_pg_embedding")
+
+VECTOR_INDEX_NAME = "langchain_pg_embedding_embedding_idx"
+
+def connect_pgvector(host=None, port=None, dbname=None, user=None, password=None):
+    """
+    连接PgVector数据库，参数为空时使用配置文件中的值，连接处于autocommit模式
+    """
+    conn = psycopg2.connect(
+        host=host or app_config.PGVECTOR_HOST,
+        port=port or app_config.PGVECTOR_PORT,
+        dbname=dbname or app_config.PGVECTOR_DB,
+        user=user or app_config.PGVECTOR_USER,
+        password=password or app_config.PGVECTOR_PASSWORD
+    )
+    # CREATE INDEX CONCURRENTLY不能在事务中执行
+    conn.autocommit = True
+    return conn
+
+def auto_ivfflat_lists(row_count):
+    """
+    按pgvector的建议根据行数计算ivfflat聚类中心数：
+    100万行以内为 行数/1000，超过100万行为 行数的平方根
+    """
+    if row_count <= 1000000:
+        return max(1, row_count // 1000)
+    return int(math.sqrt(row_count))
+
+def build_vector_index(cursor, index_type=None, m=None, ef_construction=None, lists=None,
+                       workers=None, work_mem=None, storage_type=None, binary_rerank=None, dimension=None,
+                       distance=None):
+    """
+    删除并重新创建向量索引
+    
+    启用二值量化重排时索引建在 binary_quantize(embedding)::bit(维度) 表达式上(汉明距离)，
+    查询先在该索引上取候选，再按完整精度的余弦距离重排，不再需要完整精度的索引。
+    
+    Args:
+        cursor: 数据库游标
+        index_type: 索引类型 "hnsw" 或 "ivfflat"
+        m: HNSW每个节点的最大连接数
+        ef_construction: HNSW建索引时的候选列表大小
+        lists: ivfflat聚类中心数，为空时按表中实际行数计算
+        workers: 建索引时的并行工作进程数
+        work_mem: 建索引时的maintenance_work_mem
+        storage_type: 向量列类型 "vector" 或 "halfvec"
+        binary_rerank: 是否建二值量化索引
+        dimension: 向量维度，二值量化索引需要
+        distance: 距离度量 "cosine"(*_cosine_ops) 或 "inner_product"(*_ip_ops，要求向量已归一化)
+        
+    Returns:
+        bool: 是否创建了索引
+    """
+    index_type = (index_type or getattr(app_config, "PGVECTOR_INDEX_TYPE", "hnsw")).lower()
+    workers = workers if workers is not None else getattr(app_config, "PGVECTOR_MAINTENANCE_WORKERS", 4)
+    work_mem = work_mem or getattr(app_config, "PGVECTOR_MAINTENANCE_WORK_MEM", "1GB")
+    storage_type = (storage_type or getattr(app_config, "PGVECTOR_STORAGE_TYPE", "vector")).lower()
+    if binary_rerank is None:
+        binary_rerank = getattr(app_config, "PGVECTOR_BINARY_RERANK", False)
+    dimension = dimension or app_config.OLLAMA_EMBEDDING_DIMENSION
+    distance = (distance or getattr(app_config, "PGVECTOR_DISTANCE", "cosine")).lower()
+    ops_suffix = {"cosine": "cosine_ops", "inner_product": "ip_ops"}.get(distance)
+    if ops_suffix is None:
+        raise ValueError(f"不支持的距离度量: {distance}")
+
+    # 表达式必须与PG_VectorStore.search_collections中的排序表达式完全一致
+    if binary_rerank:
+        index_expression = f"(binary_quantize(embedding)::bit({int(dimension)})) bit_hamming_ops"
+    else:
+        index_expression = f"embedding {storage_type}_{ops_suffix}"
+
+    cursor.execute("SELECT COUNT(*) FROM langchain_pg_embedding")
+    row_count = cursor.fetchone()[0]
+
+    if index_type == "hnsw":
+        m = m or getattr(app_config, "PGVECTOR_HNSW_M", 16)
+        ef_construction = ef_construction or getattr(app_config, "PGVECTOR_HNSW_EF_CONSTRUCTION", 64)
+        with_clause = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+    elif index_type == "ivfflat":
+        if row_count == 0:
+            # 空表上训练出的聚类中心没有意义，必须在导入数据后建索引
+            print("⚠️ 表中没有数据，跳过ivfflat索引。请在导入训练数据后使用 --build-index 创建索引")
+            return False
+        lists = lists or getattr(app_config, "PGVECTOR_IVFFLAT_LISTS", None) or auto_ivfflat_lists(row_count)
+        with_clause = f"lists = {int(lists)}"
+    else:
+        raise ValueError(f"不支持的向量索引类型: {index_type}")
+
+    # 并行建索引，maintenance_work_mem不足时HNSW建图会明显变慢
+    cursor.execute(f"SET max_parallel_maintenance_workers = {int(workers)}")
+    cursor.execute("SET maintenance_work_mem = %s", (work_mem,))
+
+    print(f"创建{index_type}向量索引 (行数: {row_count}, 参数: {with_clause}, 并行进程: {workers})...")
+    cursor.execute(f"DROP INDEX IF EXISTS {VECTOR_INDEX_NAME}")
+    cursor.execute(f"""
+    CREATE INDEX {VECTOR_INDEX_NAME}
+    ON langchain_pg_embedding
+    USING {index_type} ({index_expression})
+    WITH ({with_clause})
+    """)
+    print(f"✅ 已创建{index_type}向量索引 ({index_expression})")
+    if index_type == "ivfflat":
+        print(f"建议查询参数: ivfflat.probes = {max(1, round(math.sqrt(int(lists))))} "
+              f"(未配置PGVECTOR_IVFFLAT_PROBES时查询会自动按此计算)")
+    return True
+
+def convert_storage(cursor, storage_type, dimension):
+    """
+    将已有表的向量列转换为指定类型(vector/halfvec)，转换前删除向量索引
+    
+    Args:
+        cursor: 数据库游标
+        storage_type: 目标向量列类型
+        dimension: 向量维度
+    """
+    cursor.execute("""
+    SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+    WHERE attrelid = 'langchain_pg_embedding'::regclass AND attname = 'embedding'
+    """)
+    current_type = cursor.fetchone()[0]
+    target_type = f"{storage_type}({int(dimension)})"
+    if current_type == target_type:
+        return
+    print(f"转换向量列类型: {current_type} -> {target_type}...")
+    cursor.execute(f"DROP INDEX IF EXISTS {VECTOR_INDEX_NAME}")
+    cursor.execute(f"ALTER TABLE langchain_pg_embedding ALTER COLUMN embedding TYPE {target_type} USING embedding::{target_type}")
+    print(f"✅ 向量列已转换为 {target_type}")
+
+def normalize_existing(cursor):
+    """
+    将表中已有的向量L2归一化，切换到内积距离前需要执行
+    
+    Args:
+        cursor: 数据库游标
+    """
+    print("归一化已有向量...")
+    cursor.execute(f"DROP INDEX IF EXISTS {VECTOR_INDEX_NAME}")
+    cursor.execute("""
+    UPDATE langchain_pg_embedding
+    SET embedding = l2_normalize(embedding)
+    WHERE embedding IS NOT NULL AND abs(vector_norm(embedding::vector) - 1) > 1e-6
+    """)
+    print(f"✅ 已归一化 {cursor.rowcount} 条向量")
+
+def build_index_only(host=None, port=None, dbname=None, user=None, password=None, normalize=False, **index_options):
+    """
+    在已导入数据的表上(重新)创建向量索引，不修改数据；指定storage_type时先转换向量列类型
+    
+    Args:
+        host: 数据库主机
+        port: 数据库端口
+        dbname: 数据库名称
+        user: 数据库用户
+        password: 数据库密码
+        normalize: 建索引前是否将已有向量L2归一化
+        index_options: 传给build_vector_index的索引参数
+    """
+    try:
+        conn = connect_pgvector(host, port, dbname, user, password)
+        cursor = conn.cursor()
+        if normalize:
+            normalize_existing(cursor)
+        if index_options.get("storage_type"):
+            convert_storage(cursor, index_options["storage_type"],
+                            index_options.get("dimension") or app_config.OLLAMA_EMBEDDING_DIMENSION)
+        build_vector_index(cursor, **index_options)
+        cursor.execute("ANALYZE langchain_pg_embedding")
+        cursor.close()
+        conn.close()
+        return True
+    except Exception as e:
+        print(f"❌ 创建向量索引时出错: {e}")
+        return False
+
+def create_indexes_only(host=None, port=None, dbname=None, user=None, password=None):
+    """
+    在已有的langchain_pg_embedding表上补建元数据索引，不修改数据
+    
+    Args:
+        host: 数据库主机
+        port: 数据库端口
+        dbname: 数据库名称
+        user: 数据库用户
+        password: 数据库密码
+    """
+    try:
+        conn = connect_pgvector(host, port, dbname, user, password)
+        cursor = conn.cursor()
+        create_metadata_indexes(cursor, concurrently=True)
+        cursor.close()
+        conn.close()
+        print("✅ 元数据索引创建完成")
+        return True
+    except Exception as e:
+        print(f"❌ 创建元数据索引时出错: {e}")
+        return False
+
+def reset_langchain_pgvector(host=None, port=None, dbname=None, user=None, password=None, dimension=None, confirm=False,
+                             defer_index=False, storage_type=None, manifest_path=None, **index_options):
     """
     重置LangChain PGVector数据库表
     
@@ -28,6 +252,10 @@ def reset_langchain_pgvector(host=None, port=None, dbname=None, user=None, passw
         password: 数据库密码
         dimension: 向量维度
         confirm: 是否已确认操作
+        defer_index: 是否推迟创建向量索引，批量导入后再用--build-index创建，导入更快
+        storage_type: 向量列类型 "vector"(float32) 或 "halfvec"(float16)
+        manifest_path: 训练清单文件路径，重置成功后删除
+        index_options: 传给build_vector_index的索引参数
     """
     # 使用参数或从配置文件获取数据库连接信息
     pgvector_host = host or app_config.PGVECTOR_HOST
@@ -38,6 +266,7 @@ def reset_langchain_pgvector(host=None, port=None, dbname=None, user=None, passw
     
     # 使用传入参数或从配置文件获取向量维度
     vector_dimension = dimension or app_config.OLLAMA_EMBEDDING_DIMENSION
+    vector_type = (storage_type or getattr(app_config, "PGVECTOR_STORAGE_TYPE", "vector")).lower()
     
     # 如果未确认且不是交互式运行，提示确认
     if not confirm:
@@ -99,32 +328,45 @@ def reset_langchain_pgvector(host=None, port=None, dbname=None, user=None, passw
             cursor.execute("DROP TABLE langchain_pg_embedding")
             print("✅ 表langchain_pg_embedding已删除")
         
-        print(f"创建langchain_pg_embedding表，向量维度: {vector_dimension}...")
+        print(f"创建langchain_pg_embedding表，向量类型: {vector_type}，向量维度: {vector_dimension}...")
         cursor.execute(f"""
         CREATE TABLE langchain_pg_embedding (
             id text not null primary key,
             collection_id UUID,
             document TEXT,
-            embedding VECTOR({vector_dimension}),
+            embedding {vector_type.upper()}({vector_dimension}),
             cmetadata JSONB
         )
         """)
-        print(f"✅ 表langchain_pg_embedding已创建，支持{vector_dimension}维向量")
+        print(f"✅ 表langchain_pg_embedding已创建，支持{vector_dimension}维向量 ({vector_type})")
         
-        # 创建索引
-        print("创建向量索引...")
-        cursor.execute("""
-        CREATE INDEX langchain_pg_embedding_embedding_idx 
-        ON langchain_pg_embedding 
-        USING ivfflat (embedding vector_cosine_ops) 
-        WITH (lists = 100)
-        """)
-        print("✅ 已创建向量索引")
+        # 创建向量索引
+        if defer_index:
+            print("⚠️ 已推迟创建向量索引，请在导入训练数据后使用 --build-index 创建索引")
+        else:
+            build_vector_index(cursor, storage_type=vector_type, dimension=vector_dimension, **index_options)
+
+        # 创建元数据索引
+        create_metadata_indexes(cursor)
+
+        # 训练数据已清空，递增训练数据版本，使各工作进程的语义缓存失效
+        cursor.execute("SELECT to_regclass('vanna_training_version')")
+        if cursor.fetchone()[0] is not None:
+            cursor.execute("UPDATE vanna_training_version SET version = version + 1 WHERE id = 1")
+            print("✅ 训练数据版本已更新")
         
         # 关闭连接
         cursor.close()
         conn.close()
         print("✅ LangChain PGVector表重置完成")
+
+        # 训练清单记录的数据已被清空，删除清单使下次训练全量进行
+        if manifest_path:
+            if os.path.exists(manifest_path):
+                os.remove(manifest_path)
+                print(f"✅ 已删除训练清单: {manifest_path}")
+        else:
+            print("⚠️ 未指定--manifest，下次训练时会核对训练清单并重新训练已不存在的数据")
         return True
         
     except Exception as e:
@@ -140,9 +382,64 @@ if __name__ == "__main__":
     parser.add_argument('--password', type=str, help='数据库密码')
     parser.add_argument('--dimension', type=int, help=f'向量维度 (默认: {app_config.OLLAMA_EMBEDDING_DIMENSION})')
     parser.add_argument('--force', action='store_true', help='强制执行，不提示确认')
+    parser.add_argument('--indexes-only', action='store_true', help='不重置数据，只在已有表上补建元数据索引')
+    parser.add_argument('--build-index', action='store_true', help='不重置数据，按当前行数(重新)创建向量索引')
+    parser.add_argument('--defer-index', action='store_true', help='重置时不创建向量索引，导入数据后再使用--build-index')
+    parser.add_argument('--index-type', choices=['hnsw', 'ivfflat'],
+                        help=f'向量索引类型 (默认: {getattr(app_config, "PGVECTOR_INDEX_TYPE", "hnsw")})')
+    parser.add_argument('--m', type=int, help='HNSW每个节点的最大连接数')
+    parser.add_argument('--ef-construction', type=int, help='HNSW建索引时的候选列表大小')
+    parser.add_argument('--lists', type=int, help='ivfflat聚类中心数 (默认按行数自动计算)')
+    parser.add_argument('--workers', type=int, help='建索引时的并行工作进程数')
+    parser.add_argument('--work-mem', type=str, help='建索引时的maintenance_work_mem，例如1GB')
+    parser.add_argument('--storage', choices=['vector', 'halfvec'],
+                        help=f'向量列类型，与--build-index一起使用时转换已有的向量列 (默认: {getattr(app_config, "PGVECTOR_STORAGE_TYPE", "vector")})')
+    parser.add_argument('--binary-rerank', action='store_true', default=None,
+                        help='建二值量化索引，查询时按完整精度重排 (需同时设置PGVECTOR_BINARY_RERANK = True)')
+    parser.add_argument('--distance', choices=['cosine', 'inner_product'],
+                        help=f'距离度量，决定索引的操作符类 (默认: {getattr(app_config, "PGVECTOR_DISTANCE", "cosine")})')
+    parser.add_argument('--manifest', type=str,
+                        help='重置成功后删除的训练清单文件路径 (训练数据目录下的.vanna_training_manifest.json)')
+    parser.add_argument('--normalize-existing', action='store_true',
+                        help='与--build-index一起使用，建索引前将已有向量L2归一化 (切换到inner_product时需要)')
     
     args = parser.parse_args()
     
+    index_options = {
+        "index_type": args.index_type,
+        "m": args.m,
+        "ef_construction": args.ef_construction,
+        "lists": args.lists,
+        "workers": args.workers,
+        "work_mem": args.work_mem,
+        "binary_rerank": args.binary_rerank,
+        "distance": args.distance
+    }
+    
+    if args.build_index:
+        build_index_only(
+            host=args.host,
+            port=args.port,
+            dbname=args.dbname,
+            user=args.user,
+            password=args.password,
+            normalize=args.normalize_existing,
+            storage_type=args.storage,
+            dimension=args.dimension,
+            **index_options
+        )
+        sys.exit(0)
+    
+    if args.indexes_only:
+        create_indexes_only(
+            host=args.host,
+            port=args.port,
+            dbname=args.dbname,
+            user=args.user,
+            password=args.password
+        )
+        sys.exit(0)
+    
     reset_langchain_pgvector(
         host=args.host,
         port=args.port,
@@ -150,5 +447,9 @@ if __name__ == "__main__":
         user=args.user,
         password=args.password,
         dimension=args.dimension,
-        confirm=args.force
+        confirm=args.force,
+        defer_index=args.defer_index,
+        storage_type=args.storage,
+        manifest_path=args.manifest,
+        **index_options
     ) 
\ No newline at end of file
@@ -10,5 +10,11 @@ from .vanna_trainer import (
     train_sql_example,
     train_question_sql_pair,
     flush_training,
-    shutdown_trainer
-) 
\ No newline at end of file
+    shutdown_trainer,
+    add_commit_hook,
+    remove_training_ids,
+    get_existing_training_ids,
+    exclude_from_dedup,
+    write_dedup_report
+)
+from .training_manifest import TrainingManifest 
\ No newline at end of file
@@ -0,0 +1,185 @@
+# catalog_ddl.py
+"""
+从业务数据库的系统目录(pg_catalog)生成训练用的DDL
+
+用三条基于集合的查询一次性读取所有表、字段(含注释)和约束，不逐表查询，
+再为每张表合成一条CREATE TABLE语句及对应的COMMENT ON语句。
+"""
+import re
+import hashlib
+from typing import Callable, Dict, Iterator, List, Tuple
+
+# 参与训练的表类型：普通表、分区表的父表、外部表
+_TABLE_KINDS = "('r', 'p', 'f')"
+
+_TABLES_SQL = """
+SELECT n.nspname AS table_schema,
+       c.relname AS table_name,
+       obj_description(c.oid, 'pg_class') AS table_comment
+FROM pg_catalog.pg_class c
+JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind IN {kinds}
+  AND NOT c.relispartition
+  AND n.nspname IN ({schemas})
+ORDER BY n.nspname, c.relname
+"""
+
+_COLUMNS_SQL = """
+SELECT n.nspname AS table_schema,
+       c.relname AS table_name,
+       a.attname AS column_name,
+       pg_catalog.format_type(a.atttypid, a.atttypmod) AS data_type,
+       a.attnotnull AS not_null,
+       pg_catalog.pg_get_expr(d.adbin, d.adrelid) AS column_default,
+       pg_catalog.col_description(c.oid, a.attnum) AS column_comment
+FROM pg_catalog.pg_attribute a
+JOIN pg_catalog.pg_class c ON c.oid = a.attrelid
+JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+LEFT JOIN pg_catalog.pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+WHERE a.attnum > 0
+  AND NOT a.attisdropped
+  AND c.relkind IN {kinds}
+  AND NOT c.relispartition
+  AND n.nspname IN ({schemas})
+ORDER BY n.nspname, c.relname, a.attnum
+"""
+
+_CONSTRAINTS_SQL = """
+SELECT n.nspname AS table_schema,
+       c.relname AS table_name,
+       con.conname AS constraint_name,
+       pg_catalog.pg_get_constraintdef(con.oid) AS definition
+FROM pg_catalog.pg_constraint con
+JOIN pg_catalog.pg_class c ON c.oid = con.conrelid
+JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+WHERE con.contype IN ('p', 'u', 'f')
+  AND c.relkind IN {kinds}
+  AND NOT c.relispartition
+  AND n.nspname IN ({schemas})
+ORDER BY n.nspname, c.relname, con.contype, con.conname
+"""
+
+_PLAIN_IDENTIFIER = re.compile(r"^[a-z_][a-z0-9_$]*$")
+
+
+def quote_ident(name: str) -> str:
+    """按PostgreSQL规则引用标识符，只有必要时才加双引号"""
+    if _PLAIN_IDENTIFIER.match(name):
+        return name
+    return '"' + name.replace('"', '""') + '"'
+
+
+def quote_literal(value: str) -> str:
+    """生成SQL字符串字面量"""
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _records(df) -> List[dict]:
+    """将run_sql返回的DataFrame转换为字典列表"""
+    if df is None or len(df) == 0:
+        return []
+    return df.to_dict("records")
+
+
+def _empty(value) -> bool:
+    """系统目录中的NULL经过DataFrame后可能是None或NaN"""
+    return value is None or value != value or value == ""
+
+
+def fetch_catalog(run_sql: Callable, schemas: List[str]) -> Dict[Tuple[str, str], dict]:
+    """读取指定schema下所有表的结构
+
+    Args:
+        run_sql: 执行SQL并返回DataFrame的函数，通常为vn.run_sql
+        schemas: schema名称列表
+
+    Returns:
+        dict: (schema, 表名) -> {"comment": 表注释, "columns": [...], "constraints": [...]}
+    """
+    params = {
+        "kinds": _TABLE_KINDS,
+        "schemas": ", ".join(quote_literal(schema) for schema in schemas),
+    }
+
+    tables = {}
+    for row in _records(run_sql(_TABLES_SQL.format(**params))):
+        tables[(row["table_schema"], row["table_name"])] = {
+            "comment": None if _empty(row["table_comment"]) else row["table_comment"],
+            "columns": [],
+            "constraints": [],
+        }
+
+    for row in _records(run_sql(_COLUMNS_SQL.format(**params))):
+        table = tables.get((row["table_schema"], row["table_name"]))
+        if table is not None:
+            table["columns"].append(row)
+
+    for row in _records(run_sql(_CONSTRAINTS_SQL.format(**params))):
+        table = tables.get((row["table_schema"], row["table_name"]))
+        if table is not None:
+            table["constraints"].append(row)
+
+    return tables
+
+
+def build_table_ddl(schema: str, name: str, table: dict) -> str:
+    """为一张表合成CREATE TABLE语句，表和字段注释以COMMENT ON语句附在后面
+
+    Args:
+        schema: schema名称，public下的表不加schema前缀
+        name: 表名
+        table: fetch_catalog返回的表结构
+
+    Returns:
+        str: DDL文本
+    """
+    qualified = quote_ident(name) if schema == "public" else f"{quote_ident(schema)}.{quote_ident(name)}"
+
+    lines = []
+    for column in table["columns"]:
+        line = f"    {quote_ident(column['column_name'])} {column['data_type']}"
+        if not _empty(column["column_default"]):
+            line += f" DEFAULT {column['column_default']}"
+        if bool(column["not_null"]):
+            line += " NOT NULL"
+        lines.append(line)
+    for constraint in table["constraints"]:
+        lines.append(f"    CONSTRAINT {quote_ident(constraint['constraint_name'])} {constraint['definition']}")
+
+    ddl = f"CREATE TABLE {qualified} (\n" + ",\n".join(lines) + "\n);"
+
+    comments = []
+    if table["comment"]:
+        comments.append(f"COMMENT ON TABLE {qualified} IS {quote_literal(table['comment'])};")
+    for column in table["columns"]:
+        if not _empty(column["column_comment"]):
+            comments.append(
+                f"COMMENT ON COLUMN {qualified}.{quote_ident(column['column_name'])} "
+                f"IS {quote_literal(column['column_comment'])};"
+            )
+    if comments:
+        ddl += "\n" + "\n".join(comments)
+    return ddl
+
+
+def iter_catalog_ddl(run_sql: Callable, schemas: List[str]) -> Iterator[Tuple[str, str]]:
+    """逐表产出合成的DDL
+
+    Args:
+        run_sql: 执行SQL并返回DataFrame的函数
+        schemas: schema名称列表
+
+    Yields:
+        tuple: (schema.表名, DDL文本)
+    """
+    for (schema, name), table in fetch_catalog(run_sql, schemas).items():
+        yield f"{schema}.{name}", build_table_ddl(schema, name, table)
+
+
+def schema_fingerprint(ddls: List[str]) -> str:
+    """整个schema的指纹：所有表DDL的哈希，任何一张表的结构或注释变化都会改变指纹"""
+    digest = hashlib.sha256()
+    for ddl in ddls:
+        digest.update(ddl.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
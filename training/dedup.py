@@ -0,0 +1,196 @@
+# dedup.py
+import json
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class NearDuplicateFilter:
+    """训练数据近似重复过滤器
+
+    记录ID由内容哈希生成，只能识别完全相同的内容。过滤器在写入前计算新向量与集合中
+    已有向量（包括本次训练已成功写入的向量）的余弦相似度，超过阈值的项目不再写入，
+    而是合并到已有记录：写入结果返回已有记录的ID，训练清单中的数据块指向该记录。
+
+    批次中未被判为重复的记录只有在写入成功后通过commit加入比较集合，写入失败的记录
+    不会导致之后的项目被当作它的重复项丢弃。本次训练中将被替换的记录(内容已变化的
+    训练文件原有的记录)通过exclude排除在比较集合之外，修改后的内容不会被合并回旧记录。
+
+    相似度用NumPy矩阵乘法批量计算，每个批次对每个已有向量块只做一次矩阵乘法。
+    """
+
+    def __init__(self, fetch_existing: Callable[[str], Tuple[List[str], List[List[float]]]],
+                 threshold: float = 0.97, collections: Optional[List[str]] = None):
+        """
+        Args:
+            fetch_existing: 读取集合中已有记录(ID列表, 向量列表)的函数，通常为vn.get_collection_embeddings
+            threshold: 余弦相似度阈值，大于等于该值视为近似重复
+            collections: 参与去重的集合名称，None表示所有集合
+        """
+        self.fetch_existing = fetch_existing
+        self.threshold = threshold
+        self.collections = set(collections) if collections is not None else None
+        self.lock = threading.Lock()
+        # 集合名称 -> [(ID列表, 归一化后的向量矩阵, ID到行号的映射)]，已有数据和每个批次接受的数据各占一块
+        self.blocks: Dict[str, List[Tuple[List[str], np.ndarray, Dict[str, int]]]] = {}
+        # 不参与比较的记录ID
+        self.excluded = set()
+        self.report: List[dict] = []
+
+    @staticmethod
+    def _normalize(embeddings) -> np.ndarray:
+        """按行归一化，零向量保持为零"""
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2:
+            matrix = matrix.reshape(len(matrix), -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    @staticmethod
+    def _block(ids: List[str], matrix: np.ndarray) -> Tuple[List[str], np.ndarray, Dict[str, int]]:
+        """组装一个向量块"""
+        return ids, matrix, {block_id: idx for idx, block_id in enumerate(ids)}
+
+    def _load(self, collection_name: str) -> List[Tuple[List[str], np.ndarray, Dict[str, int]]]:
+        """首次遇到集合时读取已有向量（调用方持有锁）"""
+        if collection_name not in self.blocks:
+            self.blocks[collection_name] = []
+            try:
+                ids, embeddings = self.fetch_existing(collection_name)
+            except Exception as e:
+                print(f"[WARNING] 读取集合 {collection_name} 的已有向量失败，仅在本次训练数据内去重: {e}")
+                ids, embeddings = [], []
+            if ids:
+                self.blocks[collection_name].append(self._block([str(_id) for _id in ids], self._normalize(embeddings)))
+            print(f"[INFO] 近似重复检测: 集合 {collection_name} 已有 {len(ids)} 条向量")
+        return self.blocks[collection_name]
+
+    def exclude(self, ids: List[str]):
+        """将要被替换的记录不再作为近似重复的比较对象
+
+        训练文件修改后，新内容通常与该文件原有的记录高度相似，如果合并到原有记录，
+        修改就不会写入向量数据库。
+
+        Args:
+            ids: 记录ID列表
+        """
+        with self.lock:
+            self.excluded.update(str(_id) for _id in ids)
+
+    def filter(self, records: List[dict]) -> List[dict]:
+        """标记一批prepare_batch记录中的近似重复项
+
+        近似重复的记录增加duplicate_of(已有记录ID或同一批次中排在前面的记录ID)和
+        similarity字段，其余记录不变。写入完成后需调用commit，之后的批次才会与本批次
+        写入的记录比较。
+
+        Args:
+            records: prepare_batch返回的记录列表
+
+        Returns:
+            同一个记录列表
+        """
+        grouped = {}
+        for record in records:
+            if "error" in record or "embedding" not in record:
+                continue
+            if self.collections is not None and record["collection"] not in self.collections:
+                continue
+            grouped.setdefault(record["collection"], []).append(record)
+
+        with self.lock:
+            for collection_name, group in grouped.items():
+                self._filter_collection(collection_name, group)
+        return records
+
+    def _filter_collection(self, collection_name: str, group: List[dict]):
+        """在一个集合内检测近似重复（调用方持有锁）"""
+        blocks = self._load(collection_name)
+        new_ids = [str(record["id"]) for record in group]
+        matrix = self._normalize([record["embedding"] for record in group])
+
+        best_score = np.full(len(group), -1.0, dtype=np.float32)
+        best_id = [None] * len(group)
+
+        for block_ids, block_matrix, block_index in blocks:
+            if block_matrix.shape[1] != matrix.shape[1]:
+                continue
+            scores = matrix @ block_matrix.T
+            # 相同ID表示同一内容的重新写入，不算近似重复
+            for row, new_id in enumerate(new_ids):
+                col = block_index.get(new_id)
+                if col is not None:
+                    scores[row, col] = -1.0
+            excluded = [block_index[_id] for _id in self.excluded if _id in block_index]
+            if excluded:
+                scores[:, excluded] = -1.0
+            columns = scores.argmax(axis=1)
+            maxima = scores[np.arange(len(group)), columns]
+            better = maxima > best_score
+            best_score[better] = maxima[better]
+            for row in np.nonzero(better)[0]:
+                best_id[row] = block_ids[columns[row]]
+
+        # 批次内部：每条记录只与排在它前面、且自身未被判为重复的记录比较
+        inner = matrix @ matrix.T
+        accepted = []
+        for row, record in enumerate(group):
+            if accepted:
+                candidates = [idx for idx in accepted if new_ids[idx] != new_ids[row]]
+                if candidates:
+                    scores = inner[row, candidates]
+                    col = int(scores.argmax())
+                    if scores[col] > best_score[row]:
+                        best_score[row] = scores[col]
+                        best_id[row] = new_ids[candidates[col]]
+
+            if best_id[row] is not None and best_score[row] >= self.threshold:
+                record["duplicate_of"] = best_id[row]
+                record["similarity"] = float(best_score[row])
+                self.report.append({
+                    "collection": collection_name,
+                    "id": new_ids[row],
+                    "duplicate_of": best_id[row],
+                    "similarity": round(float(best_score[row]), 4),
+                    "document": record["document"][:200],
+                })
+            else:
+                accepted.append(row)
+
+    def commit(self, records: List[dict], results: List[dict]):
+        """将写入成功的记录加入比较集合
+
+        Args:
+            records: 经过filter的记录列表
+            results: write_prepared_batch返回的写入结果，与records一一对应
+        """
+        grouped = {}
+        for record, result in zip(records, results):
+            if result.get("error") or "error" in record or "embedding" not in record:
+                continue
+            # 近似重复项没有写入；已存在的记录在读取已有向量时已经包含
+            if record.get("duplicate_of") or record.get("exists"):
+                continue
+            if self.collections is not None and record["collection"] not in self.collections:
+                continue
+            grouped.setdefault(record["collection"], []).append(record)
+
+        with self.lock:
+            for collection_name, group in grouped.items():
+                self._load(collection_name).append(self._block(
+                    [str(record["id"]) for record in group],
+                    self._normalize([record["embedding"] for record in group])))
+
+    def write_report(self, path: str) -> int:
+        """将本次训练跳过的近似重复项写入JSON报告
+
+        Returns:
+            报告中的条数
+        """
+        with self.lock:
+            report = list(self.report)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"threshold": self.threshold, "duplicates": report}, f, ensure_ascii=False, indent=2)
+        return len(report)
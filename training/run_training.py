@@ -1,22 +1,35 @@
 # run_training.py
 import os
 import time
-import re
 import json
 import sys
 import requests
 import pandas as pd
-from sqlalchemy import create_engine
 
 
 from vanna_trainer import (
+    vn,
     train_ddl,
     train_documentation,
     train_sql_example,
     train_question_sql_pair,
     flush_training,
-    shutdown_trainer
+    shutdown_trainer,
+    add_commit_hook,
+    remove_training_ids,
+    get_existing_training_ids,
+    exclude_from_dedup,
+    write_dedup_report
 )
+from training_manifest import TrainingManifest
+from streaming_readers import (
+    iter_sql_statements,
+    iter_delimited_blocks,
+    iter_markdown_sections,
+    iter_formatted_question_sql_pairs,
+    iter_json_records
+)
+from catalog_ddl import iter_catalog_ddl, schema_fingerprint
 
 def check_embedding_model_connection():
     """检查嵌入模型连接是否可用
@@ -92,24 +105,26 @@ def check_embedding_model_connection():
         sys.exit(1)  # 终止程序执行
 
 def read_file_by_delimiter(filepath, delimiter="---"):
-    """通用读取：将文件按分隔符切片为多个段落"""
-    with open(filepath, "r", encoding="utf-8") as f:
-        content = f.read()
-    blocks = [block.strip() for block in content.split(delimiter) if block.strip()]
-    return blocks
+    """通用读取：将文件按分隔符流式切片为多个段落
+
+    分隔符为";"时按SQL语法切分，字符串、注释和美元引用中的分号不会切断语句。
+
+    Returns:
+        iterator: 逐个产出的段落
+    """
+    if delimiter == ";":
+        return iter_sql_statements(filepath)
+    return iter_delimited_blocks(filepath, delimiter)
 
 def read_markdown_file_by_sections(filepath):
-    """专门用于Markdown文件：按标题(#、##、###)分割文档
+    """专门用于Markdown文件：按标题(#、##、###)流式分割文档
     
     Args:
         filepath (str): Markdown文件路径
         
     Returns:
-        list: 分割后的Markdown章节列表
+        iterator: 逐个产出的Markdown章节
     """
-    with open(filepath, "r", encoding="utf-8") as f:
-        content = f.read()
-    
     # 确定文件是否为Markdown
     is_markdown = filepath.lower().endswith('.md') or filepath.lower().endswith('.markdown')
     
@@ -117,48 +132,152 @@ def read_markdown_file_by_sections(filepath):
         # 非Markdown文件使用默认的---分隔
         return read_file_by_delimiter(filepath, "---")
     
-    # 直接按照标题级别分割内容，处理#、##和###
-    sections = []
-    
-    # 匹配所有级别的标题（#、##或###开头）
-    header_pattern = r'(?:^|\n)((?:#|##|###)[^#].*?)(?=\n(?:#|##|###)[^#]|\Z)'
-    all_sections = re.findall(header_pattern, content, re.DOTALL)
-    
-    for section in all_sections:
-        section = section.strip()
-        if section:
-            sections.append(section)
-    
-    # 处理没有匹配到标题的情况
-    if not sections and content.strip():
-        sections = [content.strip()]
-        
-    return sections
+    return iter_markdown_sections(filepath)
+
+def begin_manifest_source(manifest, filepath):
+    """在训练清单中登记训练文件
+
+    Args:
+        manifest (TrainingManifest): 训练清单，为None时不做增量处理
+        filepath (str): 训练文件路径
+
+    Returns:
+        bool: 文件是否需要处理，文件自上次训练后未变化时返回False
+    """
+    if manifest is None:
+        return True
+    source = manifest.source_key(filepath)
+    if not manifest.begin_source(source, TrainingManifest.hash_file(filepath)):
+        print(f" 文件自上次训练后未变化，跳过: {filepath}")
+        return False
+    # 文件中修改过的数据块与自己原来的记录高度相似，不能当作近似重复合并回去
+    exclude_from_dedup(manifest.source_ids(source))
+    return True
+
+def keep_manifest_source(manifest, filepath):
+    """文件不存在或读取失败时调用，清单保留该文件已有的记录，finalize不会删除它们
+
+    Args:
+        manifest (TrainingManifest): 训练清单，为None时不做任何处理
+        filepath (str): 训练文件路径
+    """
+    if manifest is not None:
+        manifest.keep_source(manifest.source_key(filepath))
+        print(f" 保留训练清单中 {filepath} 的已有记录，下次运行时重新处理")
+
+def guard_source_blocks(manifest, filepath, blocks):
+    """逐个产出数据块，读取或解析中途失败时停止并保留该文件在清单中的已有记录
 
-def train_ddl_statements(ddl_file):
+    只捕获读取数据块时的异常，训练单个数据块时的异常由调用方处理。
+
+    Args:
+        manifest (TrainingManifest): 训练清单
+        filepath (str): 训练文件路径
+        blocks (iterator): 读取器返回的数据块迭代器
+
+    Yields:
+        数据块
+    """
+    try:
+        yield from blocks
+    except Exception as e:
+        print(f"错误：读取 {filepath} 失败 - {e}")
+        keep_manifest_source(manifest, filepath)
+
+def manifest_block_ref(manifest, filepath, content):
+    """计算数据块在训练清单中的标识
+
+    Args:
+        manifest (TrainingManifest): 训练清单，为None时不做增量处理
+        filepath (str): 训练文件路径
+        content (str): 数据块内容
+
+    Returns:
+        tuple: (是否需要训练, block_ref)，已写入过的数据块返回(False, None)
+    """
+    if manifest is None:
+        return True, None
+    source = manifest.source_key(filepath)
+    block_hash = TrainingManifest.hash_text(content)
+    if not manifest.should_train(source, block_hash):
+        return False, None
+    return True, {"source": source, "block": block_hash}
+
+def train_ddl_statements(ddl_file, manifest=None):
     """训练DDL语句
     Args:
         ddl_file (str): DDL文件路径
+        manifest (TrainingManifest): 训练清单，用于增量训练
     """
     print(f"开始训练 DDL: {ddl_file}")
     if not os.path.exists(ddl_file):
         print(f"DDL 文件不存在: {ddl_file}")
+        keep_manifest_source(manifest, ddl_file)
         return
-    for idx, ddl in enumerate(read_file_by_delimiter(ddl_file, ";"), start=1):
+    if not begin_manifest_source(manifest, ddl_file):
+        return
+    for idx, ddl in enumerate(guard_source_blocks(manifest, ddl_file, read_file_by_delimiter(ddl_file, ";")), start=1):
         try:
+            needs_training, block_ref = manifest_block_ref(manifest, ddl_file, ddl)
+            if not needs_training:
+                continue
             print(f"\n DDL 训练 {idx}")
-            train_ddl(ddl)
+            train_ddl(ddl, block_ref=block_ref)
         except Exception as e:
             print(f"错误：DDL #{idx} - {e}")
 
-def train_documentation_blocks(doc_file):
+def train_catalog_ddl(schemas, manifest=None):
+    """从业务数据库的系统目录生成每张表的DDL并训练
+
+    Args:
+        schemas (list): 需要训练的schema名称列表
+        manifest (TrainingManifest): 训练清单，用于增量训练，只有结构或注释变化的表才重新嵌入
+    """
+    import ext_config
+
+    source = f"catalog://{ext_config.DB_HOST}:{ext_config.DB_PORT}/{ext_config.DB_NAME}"
+    print(f"开始训练 数据库表结构: {source} (schema: {', '.join(schemas)})")
+    try:
+        tables = list(iter_catalog_ddl(vn.run_sql, schemas))
+    except Exception as e:
+        print(f"错误：读取数据库表结构失败 - {e}")
+        if manifest is not None:
+            manifest.keep_source(source)
+        return
+    print(f" 共读取 {len(tables)} 张表")
+
+    # 整体指纹未变化时跳过所有表；变化时由清单按每张表的DDL哈希判断需要重新嵌入的表
+    if manifest is not None and not manifest.begin_source(source, schema_fingerprint([ddl for _, ddl in tables])):
+        print(f" 数据库表结构自上次训练后未变化，跳过: {source}")
+        return
+    if manifest is not None:
+        exclude_from_dedup(manifest.source_ids(source))
+
+    for idx, (table_name, ddl) in enumerate(tables, start=1):
+        try:
+            block_ref = None
+            if manifest is not None:
+                block_hash = manifest.hash_text(ddl)
+                if not manifest.should_train(source, block_hash):
+                    continue
+                block_ref = {"source": source, "block": block_hash}
+            print(f"\n 表结构训练 {idx}: {table_name}")
+            train_ddl(ddl, block_ref=block_ref)
+        except Exception as e:
+            print(f"错误：表 {table_name} - {e}")
+
+def train_documentation_blocks(doc_file, manifest=None):
     """训练文档块
     Args:
         doc_file (str): 文档文件路径
+        manifest (TrainingManifest): 训练清单，用于增量训练
     """
     print(f"开始训练 文档: {doc_file}")
     if not os.path.exists(doc_file):
         print(f"文档文件不存在: {doc_file}")
+        keep_manifest_source(manifest, doc_file)
+        return
+    if not begin_manifest_source(manifest, doc_file):
         return
     
     # 检查是否为Markdown文件
@@ -166,11 +285,13 @@ def train_documentation_blocks(doc_file):
     
     if is_markdown:
         # 使用Markdown专用分割器
-        sections = read_markdown_file_by_sections(doc_file)
-        print(f" Markdown文档已分割为 {len(sections)} 个章节")
-        
-        for idx, section in enumerate(sections, start=1):
+        section_count = 0
+        for idx, section in enumerate(guard_source_blocks(manifest, doc_file, read_markdown_file_by_sections(doc_file)), start=1):
+            section_count = idx
             try:
+                needs_training, block_ref = manifest_block_ref(manifest, doc_file, section)
+                if not needs_training:
+                    continue
                 section_title = section.split('\n', 1)[0].strip()
                 print(f"\n Markdown章节训练 {idx}: {section_title}")
                 
@@ -178,56 +299,81 @@ def train_documentation_blocks(doc_file):
                 if len(section) > 2000:
                     print(f" 章节 {idx} 长度为 {len(section)} 字符，接近API限制(2048)")
                 
-                train_documentation(section)
+                train_documentation(section, block_ref=block_ref)
             except Exception as e:
                 print(f" 错误：章节 #{idx} - {e}")
+        print(f" Markdown文档共 {section_count} 个章节")
     else:
         # 非Markdown文件使用传统的---分隔
-        for idx, doc in enumerate(read_file_by_delimiter(doc_file, "---"), start=1):
+        for idx, doc in enumerate(guard_source_blocks(manifest, doc_file, read_file_by_delimiter(doc_file, "---")), start=1):
             try:
+                needs_training, block_ref = manifest_block_ref(manifest, doc_file, doc)
+                if not needs_training:
+                    continue
                 print(f"\n 文档训练 {idx}")
-                train_documentation(doc)
+                train_documentation(doc, block_ref=block_ref)
             except Exception as e:
                 print(f" 错误：文档 #{idx} - {e}")
 
-def train_sql_examples(sql_file):
+def train_sql_examples(sql_file, manifest=None):
     """训练SQL示例
     Args:
         sql_file (str): SQL示例文件路径
+        manifest (TrainingManifest): 训练清单，用于增量训练，已训练的SQL不再调用大模型生成问题
     """
     print(f" 开始训练 SQL 示例: {sql_file}")
     if not os.path.exists(sql_file):
         print(f" SQL 示例文件不存在: {sql_file}")
+        keep_manifest_source(manifest, sql_file)
         return
-    for idx, sql in enumerate(read_file_by_delimiter(sql_file, ";"), start=1):
+    if not begin_manifest_source(manifest, sql_file):
+        return
+    for idx, sql in enumerate(guard_source_blocks(manifest, sql_file, read_file_by_delimiter(sql_file, ";")), start=1):
         try:
+            needs_training, block_ref = manifest_block_ref(manifest, sql_file, sql)
+            if not needs_training:
+                continue
             print(f"\n SQL 示例训练 {idx}")
-            train_sql_example(sql)
+            # 记录在向量数据库中丢失、需要重新写入的SQL，复用清单中之前生成的问题
+            question = manifest.known_question(block_ref["source"], block_ref["block"]) if block_ref else None
+            if question:
+                print(f"[SQL] 使用之前生成的问题: {question}")
+                train_question_sql_pair(question, sql, block_ref=block_ref)
+            else:
+                train_sql_example(sql, block_ref=block_ref)
         except Exception as e:
             print(f" 错误：SQL #{idx} - {e}")
 
-def train_question_sql_pairs(qs_file):
+def train_question_sql_pairs(qs_file, manifest=None):
     """训练问答对
     Args:
         qs_file (str): 问答对文件路径
+        manifest (TrainingManifest): 训练清单，用于增量训练
     """
     print(f" 开始训练 问答对: {qs_file}")
     if not os.path.exists(qs_file):
         print(f" 问答文件不存在: {qs_file}")
+        keep_manifest_source(manifest, qs_file)
+        return
+    if not begin_manifest_source(manifest, qs_file):
         return
     try:
         with open(qs_file, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-        for idx, line in enumerate(lines, start=1):
-            if "::" not in line:
-                continue
-            question, sql = line.strip().split("::", 1)
-            print(f"\n 问答训练 {idx}")
-            train_question_sql_pair(question.strip(), sql.strip())
+            for idx, line in enumerate(f, start=1):
+                if "::" not in line:
+                    continue
+                question, sql = line.strip().split("::", 1)
+                needs_training, block_ref = manifest_block_ref(manifest, qs_file, line.strip())
+                if not needs_training:
+                    continue
+                print(f"\n 问答训练 {idx}")
+                train_question_sql_pair(question.strip(), sql.strip(), block_ref=block_ref)
     except Exception as e:
         print(f" 错误：问答训练 - {e}")
+        # 之后的行没有登记，不能当作已从文件中删除
+        keep_manifest_source(manifest, qs_file)
 
-def train_formatted_question_sql_pairs(formatted_file):
+def train_formatted_question_sql_pairs(formatted_file, manifest=None):
     """训练格式化的问答对文件
     支持两种格式：
     1. Question: xxx\nSQL: xxx (单行SQL)
@@ -235,37 +381,22 @@ def train_formatted_question_sql_pairs(formatted_file):
     
     Args:
         formatted_file (str): 格式化问答对文件路径
+        manifest (TrainingManifest): 训练清单，用于增量训练
     """
     print(f" 开始训练 格式化问答对: {formatted_file}")
     if not os.path.exists(formatted_file):
         print(f" 格式化问答文件不存在: {formatted_file}")
+        keep_manifest_source(manifest, formatted_file)
+        return
+    if not begin_manifest_source(manifest, formatted_file):
         return
     
-    # 读取整个文件内容
-    with open(formatted_file, "r", encoding="utf-8") as f:
-        content = f.read()
-    
-    # 按双空行分割不同的问答对
-    # 使用更精确的分隔符，避免误识别
-    pairs = []
-    blocks = content.split("\n\nQuestion:")
-    
-    # 处理第一块（可能没有前导的"\n\nQuestion:"）
-    first_block = blocks[0]
-    if first_block.strip().startswith("Question:"):
-        pairs.append(first_block.strip())
-    elif "Question:" in first_block:
-        # 处理文件开头没有Question:的情况
-        question_start = first_block.find("Question:")
-        pairs.append(first_block[question_start:].strip())
-    
-    # 处理其余块
-    for block in blocks[1:]:
-        pairs.append("Question:" + block.strip())
-    
+    # 逐个读取问答对，不把整个文件读入内存
+    total = 0
     # 处理每个问答对
     successfully_processed = 0
-    for idx, pair in enumerate(pairs, start=1):
+    for idx, pair in enumerate(guard_source_blocks(manifest, formatted_file, iter_formatted_question_sql_pairs(formatted_file)), start=1):
+        total = idx
         try:
             if "Question:" not in pair or "SQL:" not in pair:
                 print(f" 跳过不符合格式的对 #{idx}")
@@ -294,40 +425,43 @@ def train_formatted_question_sql_pairs(formatted_file):
                 continue
             
             # 训练问答对
+            successfully_processed += 1
+            needs_training, block_ref = manifest_block_ref(manifest, formatted_file, pair)
+            if not needs_training:
+                continue
             print(f"\n格式化问答训练 {idx}")
             print(f"问题: {question}")
             print(f"SQL: {sql_part}")
-            train_question_sql_pair(question, sql_part)
-            successfully_processed += 1
+            train_question_sql_pair(question, sql_part, block_ref=block_ref)
             
         except Exception as e:
             print(f" 错误：格式化问答训练对 #{idx} - {e}")
     
-    print(f"格式化问答训练完成，共成功处理 {successfully_processed} 对问答（总计 {len(pairs)} 对）")
+    print(f"格式化问答训练完成，共成功处理 {successfully_processed} 对问答（总计 {total} 对）")
 
-def train_json_question_sql_pairs(json_file):
+def train_json_question_sql_pairs(json_file, manifest=None):
     """训练JSON格式的问答对
     
+    支持JSON数组([{"question": ..., "sql": ...}, ...])和每行一个对象的JSON Lines文件
+    
     Args:
-        json_file (str): JSON格式问答对文件路径
+        json_file (str): JSON或JSON Lines格式问答对文件路径
+        manifest (TrainingManifest): 训练清单，用于增量训练
     """
     print(f" 开始训练 JSON格式问答对: {json_file}")
     if not os.path.exists(json_file):
         print(f" JSON问答文件不存在: {json_file}")
+        keep_manifest_source(manifest, json_file)
+        return
+    if not begin_manifest_source(manifest, json_file):
         return
     
     try:
-        # 读取JSON文件
-        with open(json_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        
-        # 确保数据是列表格式
-        if not isinstance(data, list):
-            print(f" 错误: JSON文件格式不正确，应为问答对列表")
-            return
-            
+        # 增量读取JSON数组或JSON Lines文件，不把整个文件读入内存
         successfully_processed = 0
-        for idx, pair in enumerate(data, start=1):
+        total = 0
+        for idx, pair in enumerate(guard_source_blocks(manifest, json_file, iter_json_records(json_file)), start=1):
+            total = idx
             try:
                 # 检查问答对格式
                 if not isinstance(pair, dict) or "question" not in pair or "sql" not in pair:
@@ -342,21 +476,23 @@ def train_json_question_sql_pairs(json_file):
                     continue
                 
                 # 训练问答对
+                successfully_processed += 1
+                needs_training, block_ref = manifest_block_ref(manifest, json_file, f"{question}\n{sql}")
+                if not needs_training:
+                    continue
                 print(f"\n JSON格式问答训练 {idx}")
                 print(f"问题: {question}")
                 print(f"SQL: {sql}")
-                train_question_sql_pair(question, sql)
-                successfully_processed += 1
+                train_question_sql_pair(question, sql, block_ref=block_ref)
                 
             except Exception as e:
                 print(f" 错误：JSON问答训练对 #{idx} - {e}")
         
-        print(f"JSON格式问答训练完成，共成功处理 {successfully_processed} 对问答（总计 {len(data)} 对）")
+        print(f"JSON格式问答训练完成，共成功处理 {successfully_processed} 对问答（总计 {total} 对）")
         
-    except json.JSONDecodeError as e:
-        print(f" 错误：JSON解析失败 - {e}")
     except Exception as e:
         print(f" 错误：处理JSON问答训练 - {e}")
+        keep_manifest_source(manifest, json_file)
 
 def main():
     """主函数：配置和运行训练流程"""
@@ -405,21 +541,57 @@ def main():
         "sql_1": os.path.join(BASE_PATH, "sql_example.sql"),
     }
 
-    # 添加DDL语句训练
-    train_ddl_statements(TRAINING_FILES["ddl_1"])
+    # 增量训练：清单记录已写入的数据块，重复运行只处理新增、修改和删除的部分
+    manifest = None
+    if getattr(ext_config, "TRAINING_INCREMENTAL", False):
+        if ext_config.VECTOR_DB_TYPE.lower() == "pgvector":
+            target = f"pgvector://{ext_config.PGVECTOR_HOST}:{ext_config.PGVECTOR_PORT}/{ext_config.PGVECTOR_DB}"
+        else:
+            target = f"chromadb://{os.path.abspath(ext_config.CHROMADB_PATH)}"
+        target += f"|{ext_config.OLLAMA_EMBEDDING_MODEL}"
+        # 向量是否归一化也决定了已写入的记录能否继续使用，切换后清单作废、全量重新嵌入
+        from ollama_embedding import embedding_normalize_enabled
+        if embedding_normalize_enabled():
+            target += "|normalized"
+        manifest = TrainingManifest(os.path.join(BASE_PATH, ext_config.TRAINING_MANIFEST_FILE), target=target)
+        add_commit_hook(manifest.mark_committed)
+        if manifest.reembed:
+            # 嵌入模型或归一化配置变化后，内容相同(ID相同)的已有记录也要用新配置重新嵌入
+            vn.reembed_existing = True
+        # 向量表被重置后清单中的记录已不存在，需要重新训练
+        manifest.reconcile(get_existing_training_ids)
+        print(f"===== 增量训练已启用，训练清单: {manifest.path} ({manifest.stats()}) =====")
+
+    # 添加DDL语句训练：优先从业务数据库的系统目录读取表结构，否则使用导出的DDL文件
+    # 两者只训练其一，清单finalize时会删除本次未处理来源(原DDL文件或系统目录)的记录
+    if getattr(ext_config, "TRAINING_CATALOG_DDL", False):
+        if manifest is None:
+            print("[WARNING] 未开启增量训练，之前从DDL文件写入的表结构不会被删除，可能与系统目录生成的DDL重复")
+        train_catalog_ddl(getattr(ext_config, "TRAINING_CATALOG_SCHEMAS", ["public"]), manifest)
+    else:
+        train_ddl_statements(TRAINING_FILES["ddl_1"], manifest)
 
     #添加文档结构训练
-    train_documentation_blocks(TRAINING_FILES["doc_1"])
+    train_documentation_blocks(TRAINING_FILES["doc_1"], manifest)
 
     # 添加SQL示例训练
-    train_sql_examples(TRAINING_FILES["sql_1"])
+    train_sql_examples(TRAINING_FILES["sql_1"], manifest)
     
     # 添加JSON格式问答对训练
-    train_json_question_sql_pairs(TRAINING_FILES["json_qs_1"])
+    train_json_question_sql_pairs(TRAINING_FILES["json_qs_1"], manifest)
     
     # 训练结束，刷新和关闭批处理器
     print("\n===== 训练完成，处理剩余批次 =====")
     flush_training()
+    write_dedup_report(os.path.join(BASE_PATH, getattr(ext_config, "TRAINING_DEDUP_REPORT", "dedup_report.json")))
+
+    # 删除训练文件中已不存在的数据块
+    if manifest is not None:
+        stale_ids = manifest.finalize()
+        if stale_ids:
+            print(f"\n===== 删除 {len(stale_ids)} 条已从训练文件中移除的数据 =====")
+            remove_training_ids(stale_ids)
+
     shutdown_trainer()
     
     # 验证数据是否成功写入
@@ -430,9 +602,8 @@ def main():
     # 根据向量数据库类型执行不同的验证逻辑
     if ext_config.VECTOR_DB_TYPE.lower() == "pgvector":
         try:
-            # 使用PgVector的数据库连接直接查询
-            connection_string = f"postgresql://{ext_config.PGVECTOR_USER}:{ext_config.PGVECTOR_PASSWORD}@{ext_config.PGVECTOR_HOST}:{ext_config.PGVECTOR_PORT}/{ext_config.PGVECTOR_DB}"
-            engine = create_engine(connection_string)
+            # 使用PgVector实例的连接池直接查询
+            engine = vn.engine
             
             # 查询总记录数
             query_total = "SELECT COUNT(*) FROM langchain_pg_embedding"
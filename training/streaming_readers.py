@@ -0,0 +1,294 @@
+# streaming_readers.py
+"""
+流式读取训练文件的生成器
+
+所有读取器都按行或按块读取文件，逐个产出数据块，内存占用只与单个数据块的大小有关，
+与文件大小无关。
+"""
+import re
+import json
+from typing import Any, Iterator
+
+# 读取文件时的块大小
+CHUNK_SIZE = 1024 * 1024
+
+# SQL正常状态下需要关注的记号：语句结束符、字符串、引用标识符、注释和美元引用
+_SQL_TOKEN = re.compile(r"""[;'"$]|--|/\*""")
+_SQL_BLOCK_COMMENT = re.compile(r"/\*|\*/")
+_DOLLAR_TAG = re.compile(r"\$(?:[A-Za-z_][A-Za-z0-9_]*)?\$")
+# 转义字符串(E'...')内需要关注的字符：反斜杠转义下一个字符，单引号结束字符串
+_ESCAPE_STRING_TOKEN = re.compile(r"[\\']")
+
+# Markdown的一到三级标题（与原有按#、##、###切分的规则一致）
+_MARKDOWN_HEADER = re.compile(r"^(?:#|##|###)[^#]")
+
+
+def iter_sql_statements(filepath: str) -> Iterator[str]:
+    """按分号流式切分SQL语句
+
+    字符串('...'，以及反斜杠转义的E'...')、引用标识符("...")、行注释(--)、
+    块注释(/* */，支持嵌套)和PostgreSQL美元引用($$...$$、$tag$...$tag$)中的分号
+    不会被当作语句结束符。
+    注释保留在语句文本中，训练SQL示例时会从中提取注释信息。
+
+    Args:
+        filepath (str): SQL文件路径
+
+    Yields:
+        str: 去除首尾空白后的非空语句（不含结尾分号）
+    """
+    statement = []
+    state = None  # None: 正常; "'"或'"': 引号内; "E'": 转义字符串内; "/*": 块注释内; "$": 美元引用内
+    block_depth = 0
+    dollar_tag = ""
+
+    with open(filepath, "r", encoding="utf-8") as f:
+        for line in f:
+            pos = 0
+            length = len(line)
+            while pos < length:
+                if state is None:
+                    match = _SQL_TOKEN.search(line, pos)
+                    if match is None:
+                        statement.append(line[pos:])
+                        break
+                    token = match.group()
+                    if token == ";":
+                        statement.append(line[pos:match.start()])
+                        text = "".join(statement).strip()
+                        if text:
+                            yield text
+                        statement = []
+                        pos = match.end()
+                    elif token == "--":
+                        # 行注释一直到行尾
+                        statement.append(line[pos:])
+                        break
+                    elif token == "/*":
+                        statement.append(line[pos:match.end()])
+                        state, block_depth = "/*", 1
+                        pos = match.end()
+                    elif token == "$":
+                        tag = _DOLLAR_TAG.match(line, match.start())
+                        if tag is None:
+                            # 普通的$字符，例如位置参数$1
+                            statement.append(line[pos:match.end()])
+                            pos = match.end()
+                        else:
+                            statement.append(line[pos:tag.end()])
+                            state, dollar_tag = "$", tag.group()
+                            pos = tag.end()
+                    else:
+                        statement.append(line[pos:match.end()])
+                        state = token
+                        if token == "'" and _is_escape_string_prefix(line, match.start()):
+                            state = "E'"
+                        pos = match.end()
+                elif state == "E'":
+                    match = _ESCAPE_STRING_TOKEN.search(line, pos)
+                    if match is None:
+                        statement.append(line[pos:])
+                        break
+                    if match.group() == "\\":
+                        # 反斜杠和被转义的字符一起跳过（包括\'）
+                        statement.append(line[pos:match.end() + 1])
+                        pos = match.end() + 1
+                    elif line.startswith("'", match.end()):
+                        # ''转义的单引号，仍在转义字符串内
+                        statement.append(line[pos:match.end() + 1])
+                        pos = match.end() + 1
+                    else:
+                        statement.append(line[pos:match.end()])
+                        state = None
+                        pos = match.end()
+                elif state == "/*":
+                    match = _SQL_BLOCK_COMMENT.search(line, pos)
+                    if match is None:
+                        statement.append(line[pos:])
+                        break
+                    statement.append(line[pos:match.end()])
+                    block_depth += 1 if match.group() == "/*" else -1
+                    if block_depth == 0:
+                        state = None
+                    pos = match.end()
+                else:
+                    closing = dollar_tag if state == "$" else state
+                    end = line.find(closing, pos)
+                    if end == -1:
+                        statement.append(line[pos:])
+                        break
+                    # 引号内的''或""转义会表现为先结束再立即开始，无需特殊处理
+                    statement.append(line[pos:end + len(closing)])
+                    state = None
+                    pos = end + len(closing)
+
+    text = "".join(statement).strip()
+    if text:
+        yield text
+
+
+def _is_escape_string_prefix(line: str, quote_pos: int) -> bool:
+    """单引号前是否为转义字符串前缀E/e，且E不是标识符(如name')的一部分"""
+    if quote_pos == 0 or line[quote_pos - 1] not in "Ee":
+        return False
+    return quote_pos == 1 or not (line[quote_pos - 2].isalnum() or line[quote_pos - 2] in "_$")
+
+
+def iter_delimited_blocks(filepath: str, delimiter: str = "---") -> Iterator[str]:
+    """按任意分隔符流式切分文件
+
+    Args:
+        filepath (str): 文件路径
+        delimiter (str): 分隔符
+
+    Yields:
+        str: 去除首尾空白后的非空数据块
+    """
+    buffer = ""
+    with open(filepath, "r", encoding="utf-8") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), ""):
+            buffer += chunk
+            blocks = buffer.split(delimiter)
+            # 最后一段可能还没读完，留到下一轮
+            buffer = blocks.pop()
+            for block in blocks:
+                block = block.strip()
+                if block:
+                    yield block
+
+    buffer = buffer.strip()
+    if buffer:
+        yield buffer
+
+
+def iter_markdown_sections(filepath: str) -> Iterator[str]:
+    """按一到三级标题(#、##、###)流式切分Markdown文件
+
+    第一个标题之前的内容会被忽略；整个文件没有标题时，全文作为一个章节。
+    代码块(```)中以#开头的行不视为标题。
+
+    Args:
+        filepath (str): Markdown文件路径
+
+    Yields:
+        str: 以标题行开头的章节内容
+    """
+    section = []
+    seen_header = False
+    in_code_block = False
+
+    with open(filepath, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.lstrip().startswith("```"):
+                in_code_block = not in_code_block
+            elif not in_code_block and _MARKDOWN_HEADER.match(line):
+                text = "".join(section).strip()
+                if seen_header and text:
+                    yield text
+                section = []
+                seen_header = True
+            section.append(line)
+
+    text = "".join(section).strip()
+    if text:
+        yield text
+
+
+def iter_formatted_question_sql_pairs(filepath: str) -> Iterator[str]:
+    """流式切分"Question: ...\\nSQL: ..."格式的问答对文件
+
+    文件开头或空行之后以"Question:"开头的行表示一个新的问答对。
+
+    Args:
+        filepath (str): 格式化问答对文件路径
+
+    Yields:
+        str: 以"Question:"开头的问答对文本
+    """
+    pair = []
+    previous_blank = True
+
+    with open(filepath, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("Question:") and previous_blank:
+                text = "".join(pair).strip()
+                if text.startswith("Question:"):
+                    yield text
+                pair = []
+            if pair or line.startswith("Question:"):
+                pair.append(line)
+            previous_blank = not line.strip()
+
+    text = "".join(pair).strip()
+    if text.startswith("Question:"):
+        yield text
+
+
+def iter_json_records(filepath: str) -> Iterator[Any]:
+    """增量读取JSON数组或JSON Lines文件中的记录
+
+    文件以"["开头时按JSON数组解析，逐个产出数组元素；否则按空白分隔的JSON值序列
+    (JSON Lines)解析。任何时候内存中只保留当前正在解析的记录。
+
+    Args:
+        filepath (str): JSON或JSONL文件路径
+
+    Yields:
+        数组元素或每行的JSON值
+
+    Raises:
+        json.JSONDecodeError: 文件格式不正确
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+    in_array = None  # 尚未读到第一个非空白字符
+
+    with open(filepath, "r", encoding="utf-8") as f:
+        def fill():
+            nonlocal buffer, pos, eof
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                eof = True
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+        while True:
+            # 跳过空白和数组元素之间的逗号
+            while True:
+                while pos < len(buffer) and (buffer[pos].isspace() or (in_array and buffer[pos] == ",")):
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    break
+                fill()
+
+            if pos >= len(buffer):
+                if in_array:
+                    raise json.JSONDecodeError("JSON数组没有结束", buffer, pos)
+                return
+
+            if in_array is None:
+                in_array = buffer[pos] == "["
+                if in_array:
+                    pos += 1
+                continue
+
+            if in_array and buffer[pos] == "]":
+                return
+
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+
+            # 值恰好在缓冲区末尾结束时（例如数字）可能还没读完整，读入更多数据后重新解析
+            if end == len(buffer) and not eof:
+                fill()
+                continue
+
+            pos = end
+            yield value
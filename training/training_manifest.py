@@ -0,0 +1,271 @@
+# training_manifest.py
+import os
+import json
+import hashlib
+import threading
+from typing import Callable, Dict, List, Optional, Set
+
+
+class TrainingManifest:
+    """训练数据清单，用于增量、可恢复的训练
+
+    清单以JSON文件保存在训练数据旁边，记录每个训练文件的哈希，以及文件中每个数据块的
+    哈希、写入向量数据库后的记录ID和(SQL示例)生成的问题：
+    1. 文件哈希未变化时整个文件跳过
+    2. 已写入的数据块跳过，不再嵌入、不再调用大模型生成问题
+    3. 文件中已删除的数据块，其记录从向量数据库中删除
+    4. 本次运行没有处理的文件(已改名或删除)，其记录从向量数据库中删除
+    每提交一个批次就保存一次清单，训练中断后重新运行会从最后提交的批次继续。
+    清单可能与向量数据库不一致(例如重置了向量表)，训练开始前用reconcile核对记录是否仍然存在。
+    """
+
+    # 2: 向量数据库记录ID改为基于内容的UUID
+    VERSION = 2
+
+    def __init__(self, path: str, target: str = ""):
+        """
+        Args:
+            path: 清单文件路径
+            target: 训练目标标识(向量数据库+嵌入模型)，与清单中记录的不一致时清单作废
+        """
+        self.path = path
+        self.target = target
+        self.lock = threading.Lock()
+        # 本次运行中处理过的文件: source -> {"hash": 文件哈希, "blocks": 出现的数据块哈希集合}
+        self.pending_sources = {}
+        # 本次运行中因读取失败而保留的文件
+        self.kept_sources = set()
+        # 本次运行中开始处理的文件，包括未变化而整体跳过的文件
+        self.seen_sources = set()
+        self.data = self._load()
+
+    def _load(self) -> dict:
+        """读取清单文件，不存在、损坏或训练目标变化时返回空清单"""
+        empty = {"version": self.VERSION, "target": self.target, "sources": {}}
+        if not os.path.exists(self.path):
+            return empty
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"[WARNING] 训练清单读取失败，将进行全量训练: {e}")
+            return empty
+
+        if data.get("version") != self.VERSION or data.get("target") != self.target:
+            print(f"[INFO] 训练目标已变化({data.get('target')} -> {self.target})，将进行全量训练")
+            if data.get("target") != self.target:
+                # 嵌入配置变化后ID相同的已有记录也要重新嵌入，直到一次完整的训练结束
+                empty["reembed"] = True
+            return empty
+        return data
+
+    @property
+    def reembed(self) -> bool:
+        """训练目标变化后是否还需要重新嵌入向量数据库中已有的记录"""
+        return bool(self.data.get("reembed"))
+
+    def save(self):
+        """原子地写入清单文件"""
+        with self.lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def source_key(self, filepath: str) -> str:
+        """训练文件在清单中的标识：相对清单所在目录的路径，整个目录移动后仍然有效"""
+        base_dir = os.path.dirname(os.path.abspath(self.path))
+        return os.path.relpath(os.path.abspath(filepath), base_dir)
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        """计算数据块内容的哈希"""
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def hash_file(filepath: str) -> str:
+        """分块计算文件内容的哈希"""
+        digest = hashlib.sha256()
+        with open(filepath, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _source(self, source: str) -> dict:
+        """获取(必要时创建)文件对应的清单记录（调用方持有锁）"""
+        return self.data["sources"].setdefault(source, {"hash": None, "blocks": {}})
+
+    def begin_source(self, source: str, file_hash: str) -> bool:
+        """开始处理一个训练文件
+
+        Args:
+            source: 文件标识(路径)
+            file_hash: 文件内容哈希
+
+        Returns:
+            True表示文件需要处理；False表示文件自上次完整训练后未变化，可以整体跳过
+        """
+        with self.lock:
+            self.seen_sources.add(source)
+            entry = self.data["sources"].get(source)
+            if entry and entry.get("hash") == file_hash:
+                return False
+            self.pending_sources[source] = {"hash": file_hash, "blocks": set()}
+            return True
+
+    def source_ids(self, source: str) -> List[str]:
+        """返回清单中记录的该文件所有数据块的记录ID"""
+        with self.lock:
+            entry = self.data["sources"].get(source)
+            return [str(block["id"]) for block in entry["blocks"].values()] if entry else []
+
+    def keep_source(self, source: str):
+        """本次运行无法读取该来源时调用，保留其已有记录，不视为已删除
+
+        适用于文件不存在、数据库暂时不可用，以及读取或解析到一半失败的文件。已开始处理的
+        文件放弃本次登记的数据块：finalize不删除该文件的任何记录，也不更新文件哈希，
+        下次运行重新处理。本次已提交的数据块保留在清单中。
+        """
+        with self.lock:
+            self.seen_sources.add(source)
+            self.kept_sources.add(source)
+            self.pending_sources.pop(source, None)
+
+    def should_train(self, source: str, block_hash: str) -> bool:
+        """登记文件中出现的数据块，返回该数据块是否还需要训练"""
+        with self.lock:
+            self.pending_sources[source]["blocks"].add(block_hash)
+            return block_hash not in self._source(source)["blocks"]
+
+    def mark_committed(self, committed: List[dict]):
+        """记录一批已写入向量数据库的数据块并保存清单
+
+        Args:
+            committed: 每项为 {"source": 文件标识, "block": 数据块哈希, "id": 记录ID, "question": 生成的问题(可选)}
+        """
+        if not committed:
+            return
+        with self.lock:
+            for entry in committed:
+                block = {"id": entry["id"]}
+                if entry.get("question"):
+                    block["question"] = entry["question"]
+                source = self._source(entry["source"])
+                source["blocks"][entry["block"]] = block
+                source.get("questions", {}).pop(entry["block"], None)
+        self.save()
+
+    def known_question(self, source: str, block_hash: str) -> Optional[str]:
+        """返回之前为该数据块生成的问题，重新训练时不必再调用大模型
+
+        包括reconcile发现记录已不存在、需要重新写入的数据块。
+        """
+        with self.lock:
+            entry = self.data["sources"].get(source)
+            if not entry:
+                return None
+            block = entry["blocks"].get(block_hash)
+            if block and block.get("question"):
+                return block["question"]
+            return entry.get("questions", {}).get(block_hash)
+
+    def reconcile(self, get_existing_ids: Callable[[List[str]], Optional[Set[str]]]) -> int:
+        """核对清单记录的ID是否仍存在于向量数据库中
+
+        向量表被重置或Chroma目录被删除后，清单中的记录已不存在。不存在的数据块从清单中移除，
+        所属文件的哈希清空，本次运行会重新训练这些数据块；已生成的问题保留下来，由known_question复用。
+
+        Args:
+            get_existing_ids: 返回给定ID中仍然存在的ID集合的函数，返回None表示无法核对
+
+        Returns:
+            从清单中移除的数据块数
+        """
+        with self.lock:
+            ids = sorted({
+                str(block["id"])
+                for entry in self.data["sources"].values()
+                for block in entry["blocks"].values()
+            })
+        if not ids:
+            return 0
+
+        existing = get_existing_ids(ids)
+        if existing is None:
+            print("[WARNING] 向量数据库不支持按ID查询，无法核对训练清单")
+            return 0
+        missing = set(ids) - {str(_id) for _id in existing}
+        if not missing:
+            return 0
+
+        removed = 0
+        with self.lock:
+            for entry in self.data["sources"].values():
+                stale = [block_hash for block_hash, block in entry["blocks"].items() if str(block["id"]) in missing]
+                for block_hash in stale:
+                    block = entry["blocks"].pop(block_hash)
+                    if block.get("question"):
+                        entry.setdefault("questions", {})[block_hash] = block["question"]
+                if stale:
+                    entry["hash"] = None
+                    removed += len(stale)
+        self.save()
+        print(f"[WARNING] 训练清单中有 {removed} 个数据块在向量数据库中已不存在，将重新训练")
+        return removed
+
+    def finalize(self) -> List[str]:
+        """在所有批次刷新后调用，清理已删除的数据块并更新文件哈希
+
+        只有文件中所有数据块都已提交时才记录文件哈希，否则下次运行会继续处理该文件。
+        本次运行没有开始处理的文件视为已删除，其全部记录都会被删除。
+
+        Returns:
+            需要从向量数据库中删除的记录ID列表
+        """
+        stale_ids = set()
+        with self.lock:
+            complete = not self.kept_sources
+            for source, pending in self.pending_sources.items():
+                entry = self._source(source)
+                for block_hash in list(entry["blocks"]):
+                    if block_hash not in pending["blocks"]:
+                        stale_ids.add(str(entry["blocks"].pop(block_hash)["id"]))
+                # 已从文件中删除的数据块不再需要保留问题
+                questions = entry.get("questions", {})
+                for block_hash in [block_hash for block_hash in questions if block_hash not in pending["blocks"]]:
+                    del questions[block_hash]
+                if not questions:
+                    entry.pop("questions", None)
+                if pending["blocks"].issubset(entry["blocks"].keys()):
+                    entry["hash"] = pending["hash"]
+                else:
+                    complete = False
+                    missing = len(pending["blocks"] - entry["blocks"].keys())
+                    print(f"[WARNING] {source} 有 {missing} 个数据块未成功写入，下次运行时将重试")
+            self.pending_sources = {}
+
+            for source in [source for source in self.data["sources"] if source not in self.seen_sources]:
+                entry = self.data["sources"].pop(source)
+                stale_ids.update(str(block["id"]) for block in entry["blocks"].values())
+                print(f"[INFO] {source} 在本次训练中不存在，删除其 {len(entry['blocks'])} 个数据块")
+            self.seen_sources = set()
+            self.kept_sources = set()
+            if complete:
+                self.data.pop("reembed", None)
+
+            # 相同内容可能出现在其他文件中，仍被引用的记录不删除
+            live_ids = {
+                str(block["id"])
+                for entry in self.data["sources"].values()
+                for block in entry["blocks"].values()
+            }
+        self.save()
+        return sorted(stale_ids - live_ids)
+
+    def stats(self) -> Dict[str, int]:
+        """返回清单中记录的文件数和数据块数"""
+        with self.lock:
+            return {
+                "sources": len(self.data["sources"]),
+                "blocks": sum(len(entry["blocks"]) for entry in self.data["sources"].values()),
+            }
@@ -1,6 +1,8 @@
 # vanna_trainer.py
 import os
+import json
 import time
+import hashlib
 import threading
 import queue
 import concurrent.futures
@@ -12,6 +14,11 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import ext_config
 from vanna_factory import create_vanna_instance
+# 作为training包的模块导入时用相对导入，作为脚本目录下的顶层模块导入(run_training.py)时直接导入
+try:
+    from .dedup import NearDuplicateFilter
+except ImportError:
+    from dedup import NearDuplicateFilter
 
 vn = create_vanna_instance()
 
@@ -34,93 +41,265 @@ print(f"\n===== 当前使用的Embedding模型: {embedding_model} =====")
 BATCH_PROCESSING_ENABLED = ext_config.BATCH_PROCESSING_ENABLED
 BATCH_SIZE = ext_config.BATCH_SIZE
 MAX_WORKERS = ext_config.MAX_WORKERS
+PIPELINE_WRITE_WORKERS = getattr(ext_config, 'PIPELINE_WRITE_WORKERS', 2)
+PIPELINE_QUEUE_SIZE = getattr(ext_config, 'PIPELINE_QUEUE_SIZE', 8)
+PIPELINE_BATCH_TIMEOUT = getattr(ext_config, 'PIPELINE_BATCH_TIMEOUT', 2.0)
+QUESTION_GEN_MAX_WORKERS = getattr(ext_config, 'QUESTION_GEN_MAX_WORKERS', 4)
+QUESTION_GEN_RATE_LIMIT = getattr(ext_config, 'QUESTION_GEN_RATE_LIMIT', 0)
+QUESTION_GEN_MAX_RETRIES = getattr(ext_config, 'QUESTION_GEN_MAX_RETRIES', 3)
+QUESTION_CACHE_PATH = getattr(ext_config, 'QUESTION_CACHE_PATH', None)
+TRAINING_DEDUP_ENABLED = getattr(ext_config, 'TRAINING_DEDUP_ENABLED', False)
+TRAINING_DEDUP_THRESHOLD = getattr(ext_config, 'TRAINING_DEDUP_THRESHOLD', 0.97)
+TRAINING_DEDUP_COLLECTIONS = getattr(ext_config, 'TRAINING_DEDUP_COLLECTIONS', ["documentation"])
+
+# 批次写入成功后的回调列表，例如训练清单记录已提交的数据块
+commit_hooks = []
+
+def add_commit_hook(hook: Callable[[List[Dict[str, Any]]], None]):
+    """注册写入成功回调
+
+    回调参数为已提交数据块列表，每项为
+    {"source": 文件标识, "block": 数据块哈希, "id": 记录ID, "question": 问题}，
+    只包含添加时携带了block_ref的项目。
+    """
+    commit_hooks.append(hook)
+
+
+# 流水线阶段之间传递的控制信号
+_FLUSH = object()  # 立即发出所有未满的批次
+_STOP = object()   # 结束工作线程
 
 
 # 数据批处理器
 class BatchProcessor:
-    def __init__(self, batch_size=BATCH_SIZE, max_workers=MAX_WORKERS):
+    """流水线式训练引擎
+
+    各阶段之间通过有界队列连接，队列满时上游阻塞（背压），每个阶段有独立的并发度：
+    1. 解析: 调用方线程读取训练文件，通过add_item进入输入队列
+    2. 大模型补全: SQL示例由QuestionGenerator并发生成问题后再进入输入队列
+    3. 分批: 单个线程按类型攒批，批次满或空闲超时后发出
+    4. 批量嵌入: embed_workers个线程调用vn.prepare_batch计算向量，并由dedup_filter标记近似重复项
+    5. 批量写入: write_workers个线程调用vn.write_prepared_batch写入向量数据库
+    整体吞吐量由最慢的阶段决定，而不是各阶段耗时之和。
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, max_workers=MAX_WORKERS,
+                 write_workers=PIPELINE_WRITE_WORKERS, queue_size=PIPELINE_QUEUE_SIZE,
+                 batch_timeout=PIPELINE_BATCH_TIMEOUT, dedup_filter: Optional[NearDuplicateFilter] = None):
         self.batch_size = batch_size
         self.max_workers = max_workers
+        self.write_workers = write_workers
+        self.batch_timeout = batch_timeout
         self.batches = defaultdict(list)
         self.lock = threading.Lock()  # 线程安全锁
-        
-        # 初始化工作线程池
-        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
-        
+
         # 是否启用批处理
-        self.batch_enabled = BATCH_PROCESSING_ENABLED       
+        self.batch_enabled = BATCH_PROCESSING_ENABLED
+
+        # 向量数据库支持拆分嵌入和写入时，两个阶段流水线执行
+        self.pipelined = all(
+            callable(getattr(vn, name, None)) for name in ('prepare_batch', 'write_prepared_batch')
+        )
+
+        # 近似重复检测需要写入前的向量，只在流水线模式下生效
+        self.dedup_filter = dedup_filter if self.pipelined else None
+
+        # 阶段之间的有界队列
+        self.input_queue = queue.Queue(maxsize=queue_size * batch_size)
+        self.embed_queue = queue.Queue(maxsize=queue_size)
+        self.write_queue = queue.Queue(maxsize=queue_size)
+
+        # 各阶段累计耗时，用于定位瓶颈
+        self.stage_seconds = defaultdict(float)
+
+        self.threads = []
+        if self.batch_enabled:
+            self._start_thread(self._batch_loop, "batcher")
+            for idx in range(max_workers):
+                self._start_thread(self._embed_loop, f"embed-{idx}")
+            for idx in range(write_workers):
+                self._start_thread(self._write_loop, f"write-{idx}")
+
+        print(f"[DEBUG] 批处理器初始化: 启用={self.batch_enabled}, 批大小={self.batch_size}, "
+              f"嵌入线程={self.max_workers}, 写入线程={self.write_workers}, 流水线={self.pipelined}")
+
+    def _start_thread(self, target, name):
+        thread = threading.Thread(target=target, name=f"batch-{name}", daemon=True)
+        thread.start()
+        self.threads.append((name, thread))
 
-        print(f"[DEBUG] 批处理器初始化: 启用={self.batch_enabled}, 批大小={self.batch_size}, 最大工作线程={self.max_workers}")
-    
     def add_item(self, batch_type: str, item: Dict[str, Any]):
-        """添加一个项目到批处理队列"""
+        """添加一个项目到批处理队列，队列满时阻塞"""
         if not self.batch_enabled:
             # 如果未启用批处理，直接处理
             self._process_single_item(batch_type, item)
             return
-        
-        with self.lock:
-            self.batches[batch_type].append(item)
-            
-            if len(self.batches[batch_type]) >= self.batch_size:
-                batch_items = self.batches[batch_type]
-                self.batches[batch_type] = []
-                # 提交批处理任务到线程池
-                self.executor.submit(self._process_batch, batch_type, batch_items)
-    
+
+        self.input_queue.put((batch_type, item))
+
+    def _batch_loop(self):
+        """分批阶段：按类型攒批，批次满、收到刷新信号或空闲超时后发往嵌入阶段"""
+        while True:
+            try:
+                entry = self.input_queue.get(timeout=self.batch_timeout)
+            except queue.Empty:
+                # 上游暂时没有数据，先把未满的批次发出去，避免下游空等
+                self._emit_batches()
+                continue
+
+            try:
+                if entry is _STOP:
+                    self._emit_batches()
+                    return
+                if entry is _FLUSH:
+                    self._emit_batches()
+                    continue
+
+                batch_type, item = entry
+                self.batches[batch_type].append(item)
+                if len(self.batches[batch_type]) >= self.batch_size:
+                    self._emit_batches(batch_type)
+            finally:
+                self.input_queue.task_done()
+
+    def _emit_batches(self, batch_type: Optional[str] = None):
+        """将缓冲中的批次放入嵌入队列（仅由分批线程调用）"""
+        batch_types = [batch_type] if batch_type else list(self.batches.keys())
+        for current_type in batch_types:
+            items = self.batches.pop(current_type, [])
+            if items:
+                self.embed_queue.put((current_type, items))
+
+    def _embed_loop(self):
+        """批量嵌入阶段"""
+        while True:
+            job = self.embed_queue.get()
+            try:
+                if job is _STOP:
+                    return
+                batch_type, items = job
+                batch_data = self._to_batch_data(batch_type, items)
+                records, error = None, None
+                if self.pipelined:
+                    start_time = time.time()
+                    try:
+                        records = vn.prepare_batch(batch_data)
+                        if self.dedup_filter is not None:
+                            self.dedup_filter.filter(records)
+                    except Exception as e:
+                        error = e
+                    with self.lock:
+                        self.stage_seconds['embed'] += time.time() - start_time
+                self.write_queue.put((batch_type, items, batch_data, records, error))
+            finally:
+                self.embed_queue.task_done()
+
+    def _write_loop(self):
+        """批量写入阶段"""
+        while True:
+            job = self.write_queue.get()
+            try:
+                if job is _STOP:
+                    return
+                start_time = time.time()
+                self._process_batch(*job)
+                with self.lock:
+                    self.stage_seconds['write'] += time.time() - start_time
+            finally:
+                self.write_queue.task_done()
+
+    @staticmethod
+    def _to_batch_data(batch_type: str, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """将队列中的项目转换为向量数据库add_batch的输入格式"""
+        batch_data = []
+
+        if batch_type == 'ddl':
+            for item in items:
+                batch_data.append({
+                    'type': 'ddl',
+                    'content': item['ddl']
+                })
+
+        elif batch_type == 'documentation':
+            for item in items:
+                batch_data.append({
+                    'type': 'documentation',
+                    'content': item['documentation']
+                })
+
+        elif batch_type == 'question_sql':
+            for item in items:
+                batch_data.append({
+                    'type': 'question_sql',
+                    'question': item['question'],
+                    'sql': item['sql']
+                })
+
+        return batch_data
+
+    def _notify_committed(self, items: List[Dict[str, Any]], ids: List[Any]):
+        """通知回调哪些数据块已成功写入"""
+        committed = []
+        for item, record_id in zip(items, ids):
+            block_ref = item.get('block_ref')
+            if block_ref and record_id is not None:
+                committed.append({
+                    'source': block_ref['source'],
+                    'block': block_ref['block'],
+                    'id': record_id,
+                    'question': item.get('question')
+                })
+        if not committed:
+            return
+        for hook in commit_hooks:
+            try:
+                hook(committed)
+            except Exception as e:
+                print(f"[ERROR] 写入回调执行失败: {e}")
+
     def _process_single_item(self, batch_type: str, item: Dict[str, Any]):
-        """处理单个项目"""
+        """处理单个项目，返回写入的记录ID，失败时返回None"""
         try:
+            record_id = None
             if batch_type == 'ddl':
-                vn.train(ddl=item['ddl'])
+                record_id = vn.train(ddl=item['ddl'])
             elif batch_type == 'documentation':
-                vn.train(documentation=item['documentation'])
+                record_id = vn.train(documentation=item['documentation'])
             elif batch_type == 'question_sql':
-                vn.train(question=item['question'], sql=item['sql'])
+                record_id = vn.train(question=item['question'], sql=item['sql'])
             
             print(f"[DEBUG] 单项处理成功: {batch_type}")
+            self._notify_committed([item], [record_id])
+            return record_id
                 
         except Exception as e:
             print(f"[ERROR] 处理 {batch_type} 项目失败: {e}")
+            return None
     
-    def _process_batch(self, batch_type: str, items: List[Dict[str, Any]]):
-        """处理一批项目"""
+    def _process_batch(self, batch_type: str, items: List[Dict[str, Any]], batch_data: List[Dict[str, Any]],
+                       records: Optional[List[Dict[str, Any]]] = None, error: Optional[Exception] = None):
+        """写入一批项目，records为嵌入阶段已计算好向量的记录"""
         print(f"[INFO] 开始批量处理 {len(items)} 个 {batch_type} 项")
         start_time = time.time()
         
         try:
-            # 准备批处理数据
-            batch_data = []
-            
-            if batch_type == 'ddl':
-                for item in items:
-                    batch_data.append({
-                        'type': 'ddl',
-                        'content': item['ddl']
-                    })
-            
-            elif batch_type == 'documentation':
-                for item in items:
-                    batch_data.append({
-                        'type': 'documentation',
-                        'content': item['documentation']
-                    })
-            
-            elif batch_type == 'question_sql':
-                for item in items:
-                    batch_data.append({
-                        'type': 'question_sql',
-                        'question': item['question'],
-                        'sql': item['sql']
-                    })
-            
+            if error is not None:
+                raise error
+
             # 使用批量添加方法
-            if hasattr(vn, 'add_batch') and callable(getattr(vn, 'add_batch')):
-                success = vn.add_batch(batch_data)
-                if success:
+            if records is not None or (hasattr(vn, 'add_batch') and callable(getattr(vn, 'add_batch'))):
+                if records is not None:
+                    results = self._write_records(records)
+                else:
+                    results = vn.add_batch(batch_data)
+                self._notify_committed(items, [None if result.get('error') else result.get('id') for result in results])
+                failed = [result for result in results if result.get('error')]
+                if not failed:
                     print(f"[INFO] 批量处理成功: {len(items)} 个 {batch_type} 项")
                 else:
-                    print(f"[WARNING] 批量处理部分失败: {batch_type}")
+                    print(f"[WARNING] 批量处理部分失败: {batch_type}，失败 {len(failed)}/{len(items)} 项")
+                    for result in failed:
+                        print(f"[ERROR] 项目写入失败 (ID: {result.get('id')}): {result['error']}")
             else:
                 # 如果没有批处理方法，退回到逐条处理
                 print(f"[WARNING] 批处理不可用，使用逐条处理: {batch_type}")
@@ -140,42 +319,83 @@ class BatchProcessor:
         elapsed = time.time() - start_time
         print(f"[INFO] 批处理完成 {len(items)} 个 {batch_type} 项，耗时 {elapsed:.2f} 秒")
     
+    def _write_records(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """写入嵌入阶段生成的记录，近似重复项不写入，结果中返回其合并到的已有记录ID
+
+        写入成功的记录随后加入dedup_filter的比较集合；合并目标是同一批次中写入失败的
+        记录时，近似重复项也按失败处理。
+        """
+        duplicates = [idx for idx, record in enumerate(records) if record.get('duplicate_of')]
+        if not duplicates:
+            results = vn.write_prepared_batch(records)
+        else:
+            print(f"[INFO] 跳过 {len(duplicates)} 个近似重复项")
+            to_write = [record for record in records if not record.get('duplicate_of')]
+            written = iter(vn.write_prepared_batch(to_write) if to_write else [])
+            results = [None if record.get('duplicate_of') else next(written) for record in records]
+            failed = {str(record['id']): result.get('error') for record, result in zip(records, results)
+                      if result is not None and result.get('error')}
+            for idx in duplicates:
+                target = records[idx]['duplicate_of']
+                if target in failed:
+                    results[idx] = {'id': records[idx]['id'], 'error': f"近似重复的目标记录写入失败: {failed[target]}"}
+                else:
+                    results[idx] = {'id': target, 'error': None}
+
+        if self.dedup_filter is not None:
+            self.dedup_filter.commit(records, results)
+        return results
+
     def flush_all(self):
-        """强制处理所有剩余项目"""
-        with self.lock:
-            for batch_type, items in self.batches.items():
-                if items:
-                    print(f"[INFO] 正在处理剩余的 {len(items)} 个 {batch_type} 项")
-                    self._process_batch(batch_type, items)
-            
-            # 清空队列
-            self.batches = defaultdict(list)
+        """强制处理所有剩余项目，等待流水线各阶段排空"""
+        if self.batch_enabled:
+            self.input_queue.put(_FLUSH)
+            # 按阶段顺序等待：上游排空后不会再向下游放入新的批次
+            self.input_queue.join()
+            self.embed_queue.join()
+            self.write_queue.join()
         
-        print("[INFO] 所有批处理项目已完成")
+        with self.lock:
+            timings = ", ".join(f"{stage}: {seconds:.2f}秒" for stage, seconds in self.stage_seconds.items())
+        print(f"[INFO] 所有批处理项目已完成 (阶段累计耗时 {timings or '无'})")
     
     def shutdown(self):
-        """关闭处理器和线程池"""
+        """排空流水线并依次关闭各阶段的工作线程"""
         self.flush_all()
-        self.executor.shutdown(wait=True)
+        if self.batch_enabled:
+            for stage_name, stage_queue in (("batcher", self.input_queue),
+                                            ("embed", self.embed_queue),
+                                            ("write", self.write_queue)):
+                stage_threads = [thread for name, thread in self.threads if name.split("-")[0] == stage_name]
+                for _ in stage_threads:
+                    stage_queue.put(_STOP)
+                for thread in stage_threads:
+                    thread.join()
+            self.threads = []
         print("[INFO] 批处理器已关闭")
 
-# 创建全局批处理器实例
-batch_processor = BatchProcessor()
+# 创建全局近似重复过滤器和批处理器实例
+dedup_filter = None
+if TRAINING_DEDUP_ENABLED and callable(getattr(vn, 'get_collection_embeddings', None)):
+    dedup_filter = NearDuplicateFilter(
+        vn.get_collection_embeddings,
+        threshold=TRAINING_DEDUP_THRESHOLD,
+        collections=TRAINING_DEDUP_COLLECTIONS
+    )
+batch_processor = BatchProcessor(dedup_filter=dedup_filter)
 
 # 原始训练函数的批处理增强版本
-def train_ddl(ddl_sql: str):
+# block_ref为训练清单中的数据块标识 {"source": 文件标识, "block": 数据块哈希}，写入成功后通过commit_hooks回传
+def train_ddl(ddl_sql: str, block_ref: Optional[Dict[str, str]] = None):
     print(f"[DDL] Training on DDL:\n{ddl_sql}")
-    batch_processor.add_item('ddl', {'ddl': ddl_sql})
+    batch_processor.add_item('ddl', {'ddl': ddl_sql, 'block_ref': block_ref})
 
-def train_documentation(doc: str):
+def train_documentation(doc: str, block_ref: Optional[Dict[str, str]] = None):
     print(f"[DOC] Training on documentation:\n{doc}")
-    batch_processor.add_item('documentation', {'documentation': doc})
+    batch_processor.add_item('documentation', {'documentation': doc, 'block_ref': block_ref})
 
-def train_sql_example(sql: str):
-    """训练单个SQL示例，通过SQL生成相应的问题"""
-    print(f"[SQL] Training on SQL:\n{sql}")
-    
-    # 从SQL提取注释信息
+def extract_sql_comment(sql: str) -> Optional[str]:
+    """从SQL中提取第一条"--"注释，用于辅助生成问题"""
     comment_info = None
     try:
         if "--" in sql:
@@ -184,98 +404,306 @@ def train_sql_example(sql: str):
     except Exception as e:
         # 如果提取注释失败，不报错，只记录日志
         print(f"[INFO] 提取SQL注释信息时出现问题: {e}")
-    
-    # 使用大模型生成问题
-    try:
-        # 准备提示词
-        if comment_info:
-            prompt = f"""
+    return comment_info
+
+def generate_question_for_sql(sql: str, comment_info: Optional[str] = None) -> str:
+    """使用大模型(不可用时使用规则方法)为SQL生成问题，调用失败时抛出异常"""
+    # 准备提示词
+    if comment_info:
+        prompt = f"""
 根据以下SQL及其注释，生成一个简洁、明确的中文问题，问题应该能够反映SQL的功能或目的。
 注释信息: {comment_info}
 SQL: {sql}
 生成的问题需要是一个问句，以问号结尾。
 """
-        else:
-            prompt = f"""
+    else:
+        prompt = f"""
 根据以下SQL，生成一个简洁、明确的中文问题，问题应该能够反映SQL的功能或目的。
 SQL: {sql}
 生成的问题需要是一个问句，以问号结尾。
 """
-        
-        # 使用vn对象调用大模型生成问题
-        if hasattr(vn, 'generate_question_for_sql') and callable(getattr(vn, 'generate_question_for_sql')):
-            # 如果有专门的方法，使用它
-            question = vn.generate_question_for_sql(sql=sql, comment=comment_info)
-        elif hasattr(vn, 'llm') and hasattr(vn.llm, 'generate'):
-            # 尝试通过llm属性调用生成方法
-            question = vn.llm.generate(prompt)
-        elif hasattr(vn, 'generate_text'):
-            # 尝试使用generate_text方法
-            question = vn.generate_text(prompt)
-        else:
-            # 如果无法调用大模型，使用基于规则的方法生成问题
-            print("[INFO] 无法调用大模型生成问题，使用规则方法生成")
-            
-            # 使用注释作为基本问题
-            if comment_info:
-                question = comment_info
-                if not question.endswith("?"):
-                    question += "?"
-            else:
-                # 使用基于SQL结构的规则生成问题
-                if "SELECT" in sql.upper():
-                    if "COUNT" in sql.upper():
-                        question = "如何统计指定条件的记录数量？"
-                    elif "SUM" in sql.upper() or "AVG" in sql.upper():
-                        question = "如何计算字段的汇总值？"
-                    elif "GROUP BY" in sql.upper():
-                        question = "如何按分组统计数据？"
-                    elif "JOIN" in sql.upper():
-                        question = "如何连接多个表查询数据？"
-                    elif "ORDER BY" in sql.upper():
-                        question = "如何对查询结果进行排序？"
-                    else:
-                        question = "如何查询指定条件的数据？"
-                elif "INSERT" in sql.upper():
-                    question = "如何插入新数据？"
-                elif "UPDATE" in sql.upper():
-                    question = "如何更新现有数据？"
-                elif "DELETE" in sql.upper():
-                    question = "如何删除满足条件的数据？"
-                elif "CREATE" in sql.upper():
-                    question = "如何创建数据库对象？"
-                elif "ALTER" in sql.upper():
-                    question = "如何修改数据库对象结构？"
-                else:
-                    question = "如何执行这个SQL语句？"
-                    
-        # 处理问题格式
-        question = question.strip()
-        if not question.endswith("?"):
-            question += "?"
-            
-    except Exception as e:
-        print(f"[WARNING] 生成问题时出错: {e}")
-        # 如果有注释，使用注释作为问题
+
+    # 使用vn对象调用大模型生成问题
+    if hasattr(vn, 'generate_question_for_sql') and callable(getattr(vn, 'generate_question_for_sql')):
+        # 如果有专门的方法，使用它
+        question = vn.generate_question_for_sql(sql=sql, comment=comment_info)
+    elif hasattr(vn, 'llm') and hasattr(vn.llm, 'generate'):
+        # 尝试通过llm属性调用生成方法
+        question = vn.llm.generate(prompt)
+    elif hasattr(vn, 'generate_text'):
+        # 尝试使用generate_text方法
+        question = vn.generate_text(prompt)
+    else:
+        # 如果无法调用大模型，使用基于规则的方法生成问题
+        print("[INFO] 无法调用大模型生成问题，使用规则方法生成")
+
+        # 使用注释作为基本问题
         if comment_info:
-            question = comment_info + "?"
+            question = comment_info
+            if not question.endswith("?"):
+                question += "?"
         else:
-            question = "如何执行这个SQL语句？"
-        
-    print(f"[SQL] 生成问题: {question}")
-    # 使用标准方式存储问题-SQL对
-    batch_processor.add_item('question_sql', {'question': question, 'sql': sql})
+            # 使用基于SQL结构的规则生成问题
+            if "SELECT" in sql.upper():
+                if "COUNT" in sql.upper():
+                    question = "如何统计指定条件的记录数量？"
+                elif "SUM" in sql.upper() or "AVG" in sql.upper():
+                    question = "如何计算字段的汇总值？"
+                elif "GROUP BY" in sql.upper():
+                    question = "如何按分组统计数据？"
+                elif "JOIN" in sql.upper():
+                    question = "如何连接多个表查询数据？"
+                elif "ORDER BY" in sql.upper():
+                    question = "如何对查询结果进行排序？"
+                else:
+                    question = "如何查询指定条件的数据？"
+            elif "INSERT" in sql.upper():
+                question = "如何插入新数据？"
+            elif "UPDATE" in sql.upper():
+                question = "如何更新现有数据？"
+            elif "DELETE" in sql.upper():
+                question = "如何删除满足条件的数据？"
+            elif "CREATE" in sql.upper():
+                question = "如何创建数据库对象？"
+            elif "ALTER" in sql.upper():
+                question = "如何修改数据库对象结构？"
+            else:
+                question = "如何执行这个SQL语句？"
+
+    # 处理问题格式
+    question = question.strip()
+    if not question.endswith("?"):
+        question += "?"
+
+    return question
+
+def fallback_question(comment_info: Optional[str] = None) -> str:
+    """大模型多次调用失败后使用的问题"""
+    # 如果有注释，使用注释作为问题
+    if comment_info:
+        return comment_info + "?"
+    return "如何执行这个SQL语句？"
+
+
+# 并发问题生成器
+class QuestionGenerator:
+    """并发地为SQL示例生成问题
+
+    使用有界线程池并发调用大模型，按QUESTION_GEN_RATE_LIMIT限制请求速率，
+    失败时指数退避重试（遇到限流错误时退避更久）。生成的问题按SQL哈希缓存，
+    相同的SQL只调用一次大模型。重试用尽后使用的占位问题不写入缓存，之后的运行会重新生成。
+    """
+
+    def __init__(self, max_workers=QUESTION_GEN_MAX_WORKERS, rate_limit=QUESTION_GEN_RATE_LIMIT,
+                 max_retries=QUESTION_GEN_MAX_RETRIES, cache_path=QUESTION_CACHE_PATH):
+        self.max_retries = max_retries
+        self.min_interval = 1.0 / rate_limit if rate_limit else 0.0
+        self.cache_path = cache_path
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="question-gen"
+        )
+        self.lock = threading.Lock()
+        self.cache = self._load_cache()  # SQL哈希 -> 问题
+        self.key_locks = {}  # SQL哈希 -> 锁，同一SQL并发提交时只生成一次
+        self.futures = set()
+        # 限制已提交但未完成的SQL数量，调用方提交过快时阻塞（背压）
+        self.pending_slots = threading.BoundedSemaphore(max_workers * 4)
+        self.rate_lock = threading.Lock()
+        self.next_call_time = 0.0
+        self.cache_hits = 0
+        self.llm_calls = 0
+
+        print(f"[DEBUG] 问题生成器初始化: 并发={max_workers}, 速率限制={rate_limit}/秒, 最大重试={max_retries}")
+
+    def _load_cache(self) -> Dict[str, str]:
+        """读取持久化的问题缓存"""
+        if self.cache_path and os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"[WARNING] 问题缓存读取失败: {e}")
+        return {}
+
+    def _save_cache(self):
+        """持久化问题缓存"""
+        if not self.cache_path:
+            return
+        with self.lock:
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.cache, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.cache_path)
+
+    @staticmethod
+    def sql_key(sql: str) -> str:
+        """SQL缓存键"""
+        return hashlib.sha256(sql.strip().encode("utf-8")).hexdigest()
+
+    def submit(self, sql: str, on_done: Callable[[str, bool], None]):
+        """提交SQL，问题生成后在工作线程中调用on_done(question, fallback)
+
+        fallback为True表示大模型调用失败，question是根据SQL注释生成的占位问题
+        """
+        self.pending_slots.acquire()
+        future = self.executor.submit(self._run, sql, on_done)
+        with self.lock:
+            self.futures.add(future)
+        future.add_done_callback(self._discard)
 
-def train_question_sql_pair(question: str, sql: str):
+    def _discard(self, future):
+        with self.lock:
+            self.futures.discard(future)
+        self.pending_slots.release()
+
+    def _run(self, sql: str, on_done: Callable[[str, bool], None]):
+        key = self.sql_key(sql)
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+
+        fallback = False
+        with key_lock:
+            with self.lock:
+                question = self.cache.get(key)
+                if question is not None:
+                    self.cache_hits += 1
+            if question is None:
+                question, fallback = self._generate_with_retry(sql)
+                # 占位问题不缓存，大模型恢复后重新生成
+                if not fallback:
+                    with self.lock:
+                        self.cache[key] = question
+
+        try:
+            on_done(question, fallback)
+        except Exception as e:
+            print(f"[ERROR] 处理生成的问题失败: {e}")
+
+    def _wait_for_rate_limit(self):
+        """按最小调用间隔排队，控制大模型请求速率"""
+        if not self.min_interval:
+            return
+        with self.rate_lock:
+            now = time.monotonic()
+            wait = self.next_call_time - now
+            self.next_call_time = max(now, self.next_call_time) + self.min_interval
+        if wait > 0:
+            time.sleep(wait)
+
+    @staticmethod
+    def _is_rate_limited(error: Exception) -> bool:
+        message = str(error).lower()
+        return "429" in message or "rate limit" in message or "throttl" in message
+
+    def _generate_with_retry(self, sql: str) -> Tuple[str, bool]:
+        """调用大模型生成问题，返回(问题, 是否为占位问题)"""
+        comment_info = extract_sql_comment(sql)
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_rate_limit()
+            try:
+                with self.lock:
+                    self.llm_calls += 1
+                return generate_question_for_sql(sql, comment_info), False
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    print(f"[WARNING] 生成问题时出错: {e}")
+                    return fallback_question(comment_info), True
+                delay = 2 ** attempt
+                if self._is_rate_limited(e):
+                    # 被限流时退避更久
+                    delay *= 5
+                print(f"[WARNING] 生成问题失败(第{attempt + 1}次): {e}，{delay}秒后重试")
+                time.sleep(delay)
+
+    def wait_all(self):
+        """等待所有已提交的SQL完成问题生成并交给回调"""
+        while True:
+            with self.lock:
+                pending = list(self.futures)
+            if not pending:
+                break
+            concurrent.futures.wait(pending)
+        self._save_cache()
+        print(f"[INFO] 问题生成完成: 大模型调用 {self.llm_calls} 次，缓存命中 {self.cache_hits} 次")
+
+    def shutdown(self):
+        """关闭问题生成线程池"""
+        self.wait_all()
+        self.executor.shutdown(wait=True)
+
+# 创建全局问题生成器实例
+question_generator = QuestionGenerator()
+
+def train_sql_example(sql: str, block_ref: Optional[Dict[str, str]] = None):
+    """训练单个SQL示例，并发地通过SQL生成相应的问题，生成完成后进入批处理队列"""
+    print(f"[SQL] Training on SQL:\n{sql}")
+
+    def on_question(question: str, fallback: bool):
+        if fallback and block_ref is not None:
+            # 不写入占位问题，数据块在清单中保持未提交，下次运行时重新生成问题
+            print(f"[WARNING] 问题生成失败，跳过该SQL示例，下次增量训练时重试: {sql[:80]}")
+            return
+        print(f"[SQL] 生成问题: {question}")
+        # 使用标准方式存储问题-SQL对
+        batch_processor.add_item('question_sql', {'question': question, 'sql': sql, 'block_ref': block_ref})
+
+    question_generator.submit(sql, on_question)
+
+def train_question_sql_pair(question: str, sql: str, block_ref: Optional[Dict[str, str]] = None):
     print(f"[Q-S] Training on:\nquestion: {question}\nsql: {sql}")
-    batch_processor.add_item('question_sql', {'question': question, 'sql': sql})
+    batch_processor.add_item('question_sql', {'question': question, 'sql': sql, 'block_ref': block_ref})
+
+def remove_training_ids(ids: List[str]):
+    """从向量数据库中删除指定ID的训练数据，向量数据库支持时用一条语句批量删除"""
+    if callable(getattr(vn, 'remove_training_data_many', None)):
+        try:
+            removed = vn.remove_training_data_many(ids)
+            print(f"[INFO] 已删除 {removed}/{len(ids)} 条过期训练数据")
+            return removed
+        except Exception as e:
+            print(f"[ERROR] 批量删除训练数据失败，改为逐条删除: {e}")
+
+    removed = 0
+    for record_id in ids:
+        try:
+            if vn.remove_training_data(id=str(record_id)):
+                removed += 1
+        except Exception as e:
+            print(f"[ERROR] 删除训练数据 {record_id} 失败: {e}")
+    print(f"[INFO] 已删除 {removed}/{len(ids)} 条过期训练数据")
+    return removed
+
+def get_existing_training_ids(ids: List[str]) -> Optional[set]:
+    """返回给定ID中仍存在于向量数据库的ID集合，向量数据库不支持按ID查询时返回None"""
+    if not callable(getattr(vn, 'get_existing_ids', None)):
+        return None
+    existing = set()
+    # 分段查询，避免单条语句的参数过多
+    for start in range(0, len(ids), 1000):
+        existing.update(str(_id) for _id in vn.get_existing_ids(ids[start:start + 1000]))
+    return existing
+
+def exclude_from_dedup(ids: List[str]):
+    """本次训练中将被替换的记录不参与近似重复比较，未启用近似重复检测时不做任何事"""
+    if dedup_filter is not None and ids:
+        dedup_filter.exclude(ids)
+
+def write_dedup_report(path: str):
+    """将本次训练跳过的近似重复项写入JSON报告，未启用近似重复检测时不做任何事"""
+    if dedup_filter is None:
+        return
+    count = dedup_filter.write_report(path)
+    print(f"[INFO] 本次训练跳过 {count} 个近似重复项，报告已写入: {path}")
 
 # 完成训练后刷新所有待处理项
 def flush_training():
     """强制处理所有待处理的训练项目"""
+    # 先等待问题生成完成，生成的问答对才会进入批处理队列
+    question_generator.wait_all()
     batch_processor.flush_all()
 
 # 关闭训练器
 def shutdown_trainer():
     """关闭训练器和相关资源"""
+    question_generator.shutdown()
     batch_processor.shutdown() 
\ No newline at end of file
@@ -96,6 +96,22 @@ def create_vanna_instance(config_module=None):
         # 添加PgVector所需的连接字符串
         connection_string = f"postgresql://{config_module.PGVECTOR_USER}:{config_module.PGVECTOR_PASSWORD}@{config_module.PGVECTOR_HOST}:{config_module.PGVECTOR_PORT}/{config_module.PGVECTOR_DB}"
         config["connection_string"] = connection_string
+        # 查询时的近似最近邻参数
+        config["vector_index_type"] = getattr(config_module, "PGVECTOR_INDEX_TYPE", "hnsw")
+        config["hnsw_ef_search"] = getattr(config_module, "PGVECTOR_HNSW_EF_SEARCH", None)
+        config["ivfflat_probes"] = getattr(config_module, "PGVECTOR_IVFFLAT_PROBES", None)
+        # 向量存储类型和二值量化重排
+        config["vector_storage_type"] = getattr(config_module, "PGVECTOR_STORAGE_TYPE", "vector")
+        config["binary_rerank"] = getattr(config_module, "PGVECTOR_BINARY_RERANK", False)
+        config["rerank_factor"] = getattr(config_module, "PGVECTOR_RERANK_FACTOR", 4)
+        config["vector_dimension"] = config_module.OLLAMA_EMBEDDING_DIMENSION
+        config["distance_metric"] = getattr(config_module, "PGVECTOR_DISTANCE", "cosine")
+        # 连接池
+        config["pool_size"] = getattr(config_module, "PGVECTOR_POOL_SIZE", 5)
+        config["max_overflow"] = getattr(config_module, "PGVECTOR_MAX_OVERFLOW", 10)
+        config["pool_pre_ping"] = getattr(config_module, "PGVECTOR_POOL_PRE_PING", True)
+        config["pool_recycle"] = getattr(config_module, "PGVECTOR_POOL_RECYCLE", 1800)
+        config["pool_timeout"] = getattr(config_module, "PGVECTOR_POOL_TIMEOUT", 30)
         print(f"已配置使用PgVector作为向量数据库：{config_module.PGVECTOR_HOST}:{config_module.PGVECTOR_PORT}/{config_module.PGVECTOR_DB}")
     elif vector_db_type == "chromadb":
         # 添加ChromaDB所需的路径配置